@@ -4,9 +4,15 @@
 from simple_parsing import ArgumentParser
 from pathlib import Path
 import os
+import numpy as np
 from distribution_inference.datasets.utils import get_dataset_wrapper, get_dataset_information
-from distribution_inference.attacks.blackbox.utils import get_attack, calculate_accuracies, get_vic_adv_preds_on_distr
+from distribution_inference.attacks.blackbox.utils import get_attack, calculate_accuracies, get_vic_adv_preds_on_distr, get_evaluation_loaders
 from distribution_inference.attacks.blackbox.core import PredictionsOnDistributions
+from distribution_inference.attacks.blackbox.zhang import ZhangAttack, DeferredZhangAttacks
+from distribution_inference.attacks.blackbox.cache import PredictionCache
+from distribution_inference.attacks.blackbox.buffers import set_memmap_directory
+from distribution_inference.attacks.blackbox.planner import PredictionPlanner
+from distribution_inference.attacks.blackbox.precision import PrecisionCheck
 from distribution_inference.attacks.utils import get_dfs_for_victim_and_adv, get_train_config_for_adv
 from distribution_inference.config import DatasetConfig, AttackConfig, BlackBoxAttackConfig, TrainConfig
 from distribution_inference.utils import flash_utils
@@ -53,6 +59,10 @@ if __name__ == "__main__":
     flash_utils(attack_config)
     # Define logger
     logger = AttackResult(args.en, attack_config)
+    # Random sampling in attacks (one generator for the run: trials draw different samples)
+    attack_rng = np.random.default_rng(bb_attack_config.multi_sampling_seed)
+    # Reduced-precision predictions are checked (and reported) once per run
+    precision_check = PrecisionCheck(bb_attack_config.precision_check_models)
 
     # Get dataset wrapper
     ds_wrapper_class = get_dataset_wrapper(data_config.name)
@@ -72,18 +82,75 @@ if __name__ == "__main__":
     ds_adv_1 = ds_wrapper_class(data_config_adv_1)
     train_adv_config = get_train_config_for_adv(train_config, attack_config)
 
-    def single_evaluation(models_1_path=None, models_2_paths=None):
-        # Load victim models for first value
-        models_vic_1 = ds_vic_1.get_models(
+    # Back large prediction arrays with memory-mapped files
+    if bb_attack_config.memmap_directory is not None:
+        set_memmap_directory(bb_attack_config.memmap_directory)
+
+    # Cache victim predictions (not supported for epoch-wise models)
+    cache = None
+    if bb_attack_config.cache_predictions and not attack_config.train_config.save_every_epoch:
+        cache = PredictionCache(max_size_gb=bb_attack_config.cache_max_size_gb)
+
+    def victim_models_loader(ds_vic, custom_models_path):
+        models = None
+
+        def load():
+            nonlocal models
+            if models is None:
+                models = ds_vic.get_models(
+                    train_config,
+                    n_models=attack_config.num_victim_models,
+                    on_cpu=attack_config.on_cpu,
+                    shuffle=False,
+                    epochwise_version=attack_config.train_config.save_every_epoch,
+                    model_arch=attack_config.victim_model_arch,
+                    custom_models_path=custom_models_path,
+                    lazy=attack_config.lazy_model_loading,
+                    cache_models=attack_config.model_cache_size)
+                if type(models) == tuple:
+                    models = models[0]
+            return models
+        # With cache, load models only if predictions are not cached
+        if cache is not None:
+            return load
+        return load()
+
+    def victim_model_files(ds_vic, custom_models_path):
+        if cache is None:
+            return None
+        return ds_vic.get_model_files(
             train_config,
             n_models=attack_config.num_victim_models,
-            on_cpu=attack_config.on_cpu,
-            shuffle=False,
-            epochwise_version=attack_config.train_config.save_every_epoch,
             model_arch=attack_config.victim_model_arch,
-            custom_models_path=models_1_path)
-        if type(models_vic_1) == tuple:
-                models_vic_1 = models_vic_1[0]
+            custom_models_path=custom_models_path)
+
+    def evaluation_loaders(ds_adv):
+        # Evaluation data shared across trials (if requested)
+        if not bb_attack_config.reuse_data_across_trials:
+            return None
+        return get_evaluation_loaders(
+            ds_adv, bb_attack_config.batch_size,
+            are_graph_models=ds_adv.is_graph_data,
+            make_processed_version=attack_config.adv_processed_variant,
+            materialize=bb_attack_config.materialize_data)
+
+    def single_evaluation(models_1_path=None, models_2_paths=None):
+        # Batched meta-classifiers (Zhang attack) of all values and trials are trained together, at the end
+        deferred = None
+        if bb_attack_config.meta_classifier_backend == "torch":
+            deferred = DeferredZhangAttacks(bb_attack_config)
+        # Load victim models for first value
+        models_vic_1 = victim_models_loader(ds_vic_1, models_1_path)
+        files_vic_1 = victim_model_files(ds_vic_1, models_1_path)
+        loaders_1 = evaluation_loaders(ds_adv_1)
+        # Work out which prediction blocks are shared across values and trials
+        planner = PredictionPlanner(
+            attack_config.values, attack_config.tries,
+            reuse_data=bb_attack_config.reuse_data_across_trials)
+        if bb_attack_config.reuse_data_across_trials:
+            # (Without reuse, evaluation data differs per trial and no block is shared)
+            print("Prediction blocks shared across trials: computing %d for %d uses" % (
+                planner.n_unique(), planner.n_requests))
 
         # For each value (of property) asked to experiment with
         for prop_value in attack_config.values:
@@ -96,27 +163,27 @@ if __name__ == "__main__":
                 label_noise=train_config.label_noise,
                 epoch=attack_config.train_config.save_every_epoch)
             ds_adv_2 = ds_wrapper_class(data_config_adv_2)
+            loaders_2 = evaluation_loaders(ds_adv_2)
 
             # Load victim models for other value
-            models_vic_2 = ds_vic_2.get_models(
-                train_config,
-                n_models=attack_config.num_victim_models,
-                on_cpu=attack_config.on_cpu,
-                shuffle=False,
-                epochwise_version=attack_config.train_config.save_every_epoch,
-                model_arch=attack_config.victim_model_arch,
-                custom_models_path=models_2_paths[i] if models_2_paths else None)
-            if type(models_vic_2) == tuple:
-                models_vic_2 = models_vic_2[0]
+            models_2_path = models_2_paths[i] if models_2_paths else None
+            models_vic_2 = victim_models_loader(ds_vic_2, models_2_path)
+            files_vic_2 = victim_model_files(ds_vic_2, models_2_path)
+            vic_model_paths = None
+            if cache is not None:
+                vic_model_paths = (files_vic_1, files_vic_2)
 
             for t in range(attack_config.tries):
                 print("{}: trial {}".format(prop_value, t))
+                models_keys = planner.models_keys(prop_value, t)
                 models_adv_1 = ds_adv_1.get_models(
                     train_adv_config,
                     n_models=bb_attack_config.num_adv_models,
                     on_cpu=attack_config.on_cpu,
                     model_arch=attack_config.adv_model_arch,
-                    target_epoch = attack_config.adv_target_epoch)
+                    target_epoch = attack_config.adv_target_epoch,
+                    lazy=attack_config.lazy_model_loading,
+                    cache_models=attack_config.model_cache_size)
                 if type(models_adv_1) == tuple:
                     models_adv_1 = models_adv_1[0]
                 models_adv_2 = ds_adv_2.get_models(
@@ -124,7 +191,9 @@ if __name__ == "__main__":
                     n_models=bb_attack_config.num_adv_models,
                     on_cpu=attack_config.on_cpu,
                     model_arch=attack_config.adv_model_arch,
-                    target_epoch = attack_config.adv_target_epoch)
+                    target_epoch = attack_config.adv_target_epoch,
+                    lazy=attack_config.lazy_model_loading,
+                    cache_models=attack_config.model_cache_size)
                 if type(models_adv_2) == tuple:
                     models_adv_2 = models_adv_2[0]
 
@@ -137,7 +206,19 @@ if __name__ == "__main__":
                     epochwise_version=attack_config.train_config.save_every_epoch,
                     preload=bb_attack_config.preload,
                     multi_class=bb_attack_config.multi_class,
-                    make_processed_version=attack_config.adv_processed_variant
+                    make_processed_version=attack_config.adv_processed_variant,
+                    ensemble=bb_attack_config.ensemble_inference,
+                    cache=cache,
+                    vic_model_paths=vic_model_paths,
+                    num_workers=bb_attack_config.prediction_workers,
+                    materialize=bb_attack_config.materialize_data,
+                    loaders=loaders_1,
+                    planner=planner,
+                    models_keys=models_keys,
+                    data_key=planner.data_key(1, prop_value, t),
+                    subgraph_batch_size=bb_attack_config.subgraph_batch_size,
+                    precision=bb_attack_config.prediction_precision,
+                    precision_check=precision_check
                 )
                 # Get victim and adv predictions on loaders for second ratio
                 preds_adv_on_2, preds_vic_on_2, ground_truth_2, _ = get_vic_adv_preds_on_distr(
@@ -148,7 +229,19 @@ if __name__ == "__main__":
                     epochwise_version=attack_config.train_config.save_every_epoch,
                     preload=bb_attack_config.preload,
                     multi_class=bb_attack_config.multi_class,
-                    make_processed_version=attack_config.adv_processed_variant
+                    make_processed_version=attack_config.adv_processed_variant,
+                    ensemble=bb_attack_config.ensemble_inference,
+                    cache=cache,
+                    vic_model_paths=vic_model_paths,
+                    num_workers=bb_attack_config.prediction_workers,
+                    materialize=bb_attack_config.materialize_data,
+                    loaders=loaders_2,
+                    planner=planner,
+                    models_keys=models_keys,
+                    data_key=planner.data_key(2, prop_value, t),
+                    subgraph_batch_size=bb_attack_config.subgraph_batch_size,
+                    precision=bb_attack_config.prediction_precision,
+                    precision_check=precision_check
                 )
                 # Wrap predictions to be used by the attack
                 preds_adv = PredictionsOnDistributions(
@@ -166,7 +259,13 @@ if __name__ == "__main__":
                 # For each requested attack
                 for attack_type in bb_attack_config.attack_type:
                     # Create attacker object
-                    attacker_obj = get_attack(attack_type)(bb_attack_config)
+                    attacker_obj = get_attack(attack_type)(bb_attack_config, rng=attack_rng)
+                    if deferred is not None and isinstance(attacker_obj, ZhangAttack):
+                        deferred.add(attacker_obj, preds_adv, preds_vic,
+                                     key=(attack_type, prop_value),
+                                     epochwise_version=attack_config.train_config.save_every_epoch,
+                                     not_using_logits=not_using_logits)
+                        continue
 
                     # Launch attack
                     result = attacker_obj.attack(
@@ -186,6 +285,13 @@ if __name__ == "__main__":
                     # Keep saving results (more I/O, minimal loss of information in crash)
                     logger.save()
 
+        if deferred is not None and len(deferred) > 0:
+            for (attack_type, prop_value), result in deferred.run():
+                logger.add_results(attack_type, prop_value,
+                                   result[0][0], result[1][0])
+                print(result[0][0])
+            logger.save()
+
     if args.victim_path:
         def joinpath(x, y): return os.path.join(
             args.victim_path, str(x), str(y))
@@ -195,3 +301,8 @@ if __name__ == "__main__":
             single_evaluation(models_1_path, model_2_paths)
     else:
         single_evaluation()
+    # Report precision check, if not reported yet (only one of victim/adversary models checked)
+    precision_check.report()
+    # Write remaining cache accesses (used for eviction) to its index
+    if cache is not None:
+        cache.flush()
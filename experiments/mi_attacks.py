@@ -17,6 +17,7 @@ from simple_parsing import ArgumentParser
 from distribution_inference.datasets.utils import get_dataset_wrapper
 from distribution_inference.attacks.utils import get_dfs_for_victim_and_adv, get_train_config_for_adv
 from distribution_inference.config import AttackConfig
+from distribution_inference.device import to_device
 from distribution_inference.nleaked.nleaked import BinaryRatio, Regression
 
 
@@ -116,10 +117,10 @@ def get_overall_loss_values(models, criterion, loader):
         model.eval()
         loss_vals = []
         for data in loader:
-            out = model(data[0].cuda())
+            out = model(to_device(data[0]))
             if out.shape[1] == 1:
                 out = out.squeeze()
-            loss_vals.append(criterion(out, data[1].cuda()).cpu().numpy())
+            loss_vals.append(criterion(out, to_device(data[1])).cpu().numpy())
         loss_vals = np.concatenate(loss_vals)
         model_loss_vals.append(np.mean(loss_vals))
     return model_loss_vals
@@ -133,13 +134,13 @@ def get_loss_values(models, criterion, prior_data_one_x, prior_data_one_y, prior
         model_adv.eval()
         lz_inner, lo_inner = [], []
         for pzx, pzy, pox, poy in zip(prior_data_zero_x, prior_data_zero_y, prior_data_one_x, prior_data_one_y):
-            pz_out = model_adv(pzx.cuda()).detach()
-            po_out = model_adv(pox.cuda()).detach()
+            pz_out = model_adv(to_device(pzx)).detach()
+            po_out = model_adv(to_device(pox)).detach()
             if pz_out.shape[1] == 1: # Squeeze if binary task (binary loss used with it)
                 pz_out = pz_out.squeeze(1)
                 po_out = po_out.squeeze(1)
-            loss_zero = criterion(pz_out, pzy.float().cuda())
-            loss_one = criterion(po_out, poy.float().cuda())
+            loss_zero = criterion(pz_out, to_device(pzy.float()))
+            loss_one = criterion(po_out, to_device(poy.float()))
             lz_inner.append(loss_zero.cpu().numpy())
             lo_inner.append(loss_one.cpu().numpy())
         losses_zero.append(lz_inner)
@@ -155,16 +156,16 @@ def get_loss_values_victim(models, criterion, prior_data_one_x, prior_data_one_y
     losses_zero, losses_one = [], []
     for i, model_vic in tqdm(enumerate(models), desc="Collecting loss values from victim models"):
         model_vic.eval()
-        pz_out = model_vic(prior_data_zero_x[i].cuda()).detach()
+        pz_out = model_vic(to_device(prior_data_zero_x[i])).detach()
         # Weird bug
         if ch.sum(ch.isnan(pz_out)):
-            pz_out = model_vic(prior_data_zero_x[i].cuda()).detach()
-        po_out = model_vic(prior_data_one_x[i].cuda()).detach()
+            pz_out = model_vic(to_device(prior_data_zero_x[i])).detach()
+        po_out = model_vic(to_device(prior_data_one_x[i])).detach()
         if pz_out.shape[1] == 1: # Squeeze if binary task (binary loss used with it)
             pz_out = pz_out.squeeze(1)
             po_out = po_out.squeeze(1)
-        loss_zero = criterion(pz_out, prior_data_zero_y[i].float().cuda())
-        loss_one = criterion(po_out, prior_data_one_y[i].float().cuda())
+        loss_zero = criterion(pz_out, to_device(prior_data_zero_y[i].float()))
+        loss_one = criterion(po_out, to_device(prior_data_one_y[i].float()))
         losses_zero.append(loss_zero.cpu().numpy())
         losses_one.append(loss_one.cpu().numpy())
     losses_zero = np.array(losses_zero)
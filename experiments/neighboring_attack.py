@@ -4,10 +4,12 @@
 from simple_parsing import ArgumentParser
 from pathlib import Path
 import os
+import numpy as np
 from distribution_inference.datasets.utils import get_dataset_wrapper, get_dataset_information
 from distribution_inference.attacks.blackbox.utils import get_attack, calculate_accuracies
 from distribution_inference.attacks.blackbox.neighboring_points import get_vic_adv_preds_on_distr
 from distribution_inference.attacks.blackbox.core import PredictionsOnDistributions
+from distribution_inference.attacks.blackbox.zhang import ZhangAttack, DeferredZhangAttacks
 from distribution_inference.attacks.utils import get_dfs_for_victim_and_adv, get_train_config_for_adv
 from distribution_inference.config import DatasetConfig, AttackConfig, BlackBoxAttackConfig, TrainConfig
 from distribution_inference.utils import flash_utils
@@ -46,6 +48,10 @@ if __name__ == "__main__":
     flash_utils(attack_config)
     # Define logger
     logger = AttackResult(args.en, attack_config)
+    # Random sampling in attacks (one generator for the run: trials draw different samples)
+    attack_rng = np.random.default_rng(bb_attack_config.multi_sampling_seed)
+    # Noise for neighbors (one generator for the run: every model gets its own noise)
+    neighbor_rng = np.random.default_rng(bb_attack_config.merlin_seed)
 
     # Get dataset wrapper
     ds_wrapper_class = get_dataset_wrapper(data_config.name)
@@ -66,6 +72,10 @@ if __name__ == "__main__":
     train_adv_config = get_train_config_for_adv(train_config, attack_config)
 
     def single_evaluation(models_1_path=None, models_2_paths=None):
+        # Batched meta-classifiers (Zhang attack) of all values and trials are trained together, at the end
+        deferred = None
+        if bb_attack_config.meta_classifier_backend == "torch":
+            deferred = DeferredZhangAttacks(bb_attack_config)
         # Load victim models for first value
         models_vic_1 = ds_vic_1.get_models(
             train_config,
@@ -126,6 +136,7 @@ if __name__ == "__main__":
                     mean=bb_attack_config.merlin_mean,
                     std=bb_attack_config.merlin_std,
                     neighbors=bb_attack_config.merlin_neighbors,
+                    rng=neighbor_rng,
                     epochwise_version=attack_config.train_config.save_every_epoch,
                     preload=bb_attack_config.preload,
                     multi_class=bb_attack_config.multi_class,
@@ -140,6 +151,7 @@ if __name__ == "__main__":
                     mean=bb_attack_config.merlin_mean,
                     std=bb_attack_config.merlin_std,
                     neighbors=bb_attack_config.merlin_neighbors,
+                    rng=neighbor_rng,
                     epochwise_version=attack_config.train_config.save_every_epoch,
                     preload=bb_attack_config.preload,
                     multi_class=bb_attack_config.multi_class,
@@ -161,7 +173,13 @@ if __name__ == "__main__":
                 # For each requested attack
                 for attack_type in bb_attack_config.attack_type:
                     # Create attacker object
-                    attacker_obj = get_attack(attack_type)(bb_attack_config)
+                    attacker_obj = get_attack(attack_type)(bb_attack_config, rng=attack_rng)
+                    if deferred is not None and isinstance(attacker_obj, ZhangAttack):
+                        deferred.add(attacker_obj, preds_adv, preds_vic,
+                                     key=(attack_type, prop_value),
+                                     epochwise_version=attack_config.train_config.save_every_epoch,
+                                     not_using_logits=not_using_logits)
+                        continue
 
                     # Launch attack
                     result = attacker_obj.attack(
@@ -181,6 +199,13 @@ if __name__ == "__main__":
                     # Keep saving results (more I/O, minimal loss of information in crash)
                     logger.save()
 
+        if deferred is not None and len(deferred) > 0:
+            for (attack_type, prop_value), result in deferred.run():
+                logger.add_results(attack_type, prop_value,
+                                   result[0][0], result[1][0])
+                print(result[0][0])
+            logger.save()
+
     if args.victim_path:
         def joinpath(x, y): return os.path.join(
             args.victim_path, str(x), str(y))
@@ -0,0 +1,43 @@
+"""
+    Convert directories of trained models (one file per model) into
+    packed model zoos (one file per directory), read by get_models().
+"""
+import os
+from simple_parsing import ArgumentParser
+from distribution_inference.training.zoo import pack_directory, PackedZoo, ZOO_FILE_NAME
+
+
+def _model_directories(path: str, recursive: bool):
+    if not recursive:
+        yield path
+        return
+    # Directories that directly contain model files
+    for root, _, files in os.walk(path):
+        if any(f.endswith(".ch") for f in files):
+            yield root
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument("paths",
+                        nargs='+',
+                        help="Directories of models to pack",
+                        type=str)
+    parser.add_argument("--recursive",
+                        action="store_true",
+                        help="Pack all directories (containing model files) under given paths")
+    parser.add_argument("--remove_originals",
+                        action="store_true",
+                        help="Remove model files after packing them")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        for folder_path in _model_directories(path, args.recursive):
+            try:
+                pack_directory(folder_path, remove_originals=args.remove_originals)
+            except ValueError as e:
+                print("Skipping %s: %s" % (folder_path, e))
+                continue
+            zoo = PackedZoo.open(folder_path)
+            print("Packed %d models into %s" % (
+                len(zoo), os.path.join(folder_path, ZOO_FILE_NAME)))
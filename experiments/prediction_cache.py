@@ -0,0 +1,49 @@
+"""
+    Inspect and purge the on-disk cache of victim-model predictions.
+"""
+from simple_parsing import ArgumentParser
+from datetime import datetime
+from distribution_inference.attacks.blackbox.cache import PredictionCache
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument("action",
+                        choices=["list", "purge", "remove"],
+                        help="List entries, purge (all or old) entries, or remove specific entries",
+                        type=str)
+    parser.add_argument("--cache_dir",
+                        help="Cache directory (defaults to DDI_CACHE_DIRECTORY/predictions)",
+                        type=str, default=None)
+    parser.add_argument("--keys",
+                        nargs='+',
+                        help="Keys of entries to remove (for 'remove')",
+                        type=str)
+    parser.add_argument("--older_than_days",
+                        help="Only purge entries not accessed in these many days (for 'purge')",
+                        type=float, default=None)
+    args = parser.parse_args()
+
+    cache = PredictionCache(cache_dir=args.cache_dir)
+
+    if args.action == "list":
+        entries = cache.entries()
+        for key, entry in sorted(entries.items(), key=lambda x: -x[1]["last_access"]):
+            last_access = datetime.fromtimestamp(entry["last_access"])
+            print("%s  shape=%s  size=%.2fMB  hits=%d  last_access=%s" % (
+                key, tuple(entry["shape"]), entry["size"] / (1024 ** 2),
+                entry.get("hits", 0), last_access))
+        print("%d entries, %.2fMB total" % (
+            len(entries), cache.total_size() / (1024 ** 2)))
+    elif args.action == "purge":
+        older_than = None
+        if args.older_than_days is not None:
+            older_than = args.older_than_days * 24 * 60 * 60
+        cache.purge(older_than=older_than)
+        print("Purged cache at %s" % cache.cache_dir)
+    else:
+        if not args.keys:
+            raise ValueError("Specify keys to remove with --keys")
+        for key in args.keys:
+            cache.remove(key)
+        print("Removed %d entries" % len(args.keys))
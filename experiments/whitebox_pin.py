@@ -7,6 +7,7 @@ from pathlib import Path
 from distribution_inference.datasets.utils import get_dataset_wrapper, get_dataset_information
 from distribution_inference.attacks.utils import get_dfs_for_victim_and_adv, get_train_config_for_adv
 from distribution_inference.attacks.whitebox.utils import get_attack, get_train_val_from_pool, wrap_into_loader
+from distribution_inference.attacks.whitebox.cache import FeatureCache
 from distribution_inference.config import DatasetConfig, AttackConfig, WhiteBoxAttackConfig, TrainConfig
 from distribution_inference.utils import flash_utils
 from distribution_inference.logging.core import AttackResult
@@ -68,6 +69,11 @@ if __name__ == "__main__":
     # Make train config for adversarial models
     train_config_adv = get_train_config_for_adv(train_config, attack_config)
 
+    # Cache extracted features (re-used across runs)
+    cache = None
+    if wb_attack_config.cache_features:
+        cache = FeatureCache()
+
     # Load victim and adversary's model features for first value
     dims, features_vic_1 = ds_vic_1.get_model_features(
         train_config,
@@ -75,7 +81,8 @@ if __name__ == "__main__":
         n_models=attack_config.num_victim_models,
         on_cpu=attack_config.on_cpu,
         shuffle=False,
-        model_arch=attack_config.victim_model_arch)
+        model_arch=attack_config.victim_model_arch,
+        cache=cache)
 
     # For each value (of property) asked to experiment with
     for prop_value in attack_config.values:
@@ -96,7 +103,8 @@ if __name__ == "__main__":
             n_models=attack_config.num_victim_models,
             on_cpu=attack_config.on_cpu,
             shuffle=False,
-            model_arch=attack_config.victim_model_arch)
+            model_arch=attack_config.victim_model_arch,
+            cache=cache)
 
         # Generate test set unless victim-only mode
         # In that case, 'val' data is test data
@@ -116,14 +124,16 @@ if __name__ == "__main__":
                 n_models=attack_config.num_total_adv_models,
                 on_cpu=attack_config.on_cpu,
                 shuffle=True,
-                model_arch=attack_config.adv_model_arch)
+                model_arch=attack_config.adv_model_arch,
+                cache=cache)
             _, features_adv_2 = ds_adv_2.get_model_features(
                 train_config_adv,
                 wb_attack_config,
                 n_models=attack_config.num_total_adv_models,
                 on_cpu=attack_config.on_cpu,
                 shuffle=True,
-                model_arch=attack_config.adv_model_arch)
+                model_arch=attack_config.adv_model_arch,
+                cache=cache)
 
         # Run attack trials
         for trial in range(attack_config.tries):
@@ -20,15 +20,24 @@ class KLAttack(Attack):
         if not epochwise_version:
             return self.attack_not_epoch(preds_adv,preds_vic,ground_truth,calc_acc,not_using_logits)
         else:
-            preds_v = [PredictionsOnDistributions(
-                PredictionsOnOneDistribution(preds_vic.preds_on_distr_1.preds_property_1[i],preds_vic.preds_on_distr_1.preds_property_2[i]),
-                PredictionsOnOneDistribution(preds_vic.preds_on_distr_2.preds_property_1[i],preds_vic.preds_on_distr_2.preds_property_2[i])
-            ) for i in range(len(preds_vic.preds_on_distr_2.preds_property_1))]
+            self.not_using_logits = not_using_logits
+            # Victim models of all epochs are compared with adversary's models together
+            def merge_epochs(x):
+                return np.concatenate(list(x), 0)
+            preds_v = PredictionsOnDistributions(
+                PredictionsOnOneDistribution(merge_epochs(preds_vic.preds_on_distr_1.preds_property_1),
+                                             merge_epochs(preds_vic.preds_on_distr_1.preds_property_2)),
+                PredictionsOnOneDistribution(merge_epochs(preds_vic.preds_on_distr_2.preds_property_1),
+                                             merge_epochs(preds_vic.preds_on_distr_2.preds_property_2)))
+            preds_first, preds_second = self._get_preds_on_distrs(preds_adv, preds_v)
+            # Split back into epochs
+            splits_1 = np.cumsum([len(x) for x in preds_vic.preds_on_distr_1.preds_property_1])[:-1]
+            splits_2 = np.cumsum([len(x) for x in preds_vic.preds_on_distr_1.preds_property_2])[:-1]
             accs,preds=[],[]
-            for x in preds_v:
-                result = self.attack_not_epoch(preds_adv,x,ground_truth,calc_acc,not_using_logits)
-                accs.append(result[0][0])
-                preds.append(result[0][1])
+            for x, y in zip(np.split(preds_first, splits_1), np.split(preds_second, splits_2)):
+                acc, pred = self._get_acc(x, y)
+                accs.append(acc)
+                preds.append(pred)
             return [(accs, preds), (None, None), (None,None)]
 
     def attack_not_epoch(self,
@@ -39,7 +48,16 @@ class KLAttack(Attack):
                not_using_logits: bool = False):
         
         self.not_using_logits = not_using_logits
+        preds_first, preds_second = self._get_preds_on_distrs(preds_adv, preds_vic)
+        acc, preds = self._get_acc(preds_first, preds_second)
 
+        # No concept of "choice" (are we in the Matrix :P)
+        choice_information = (None, None)
+        return [(acc, preds), (None, None), choice_information]
+
+    def _get_preds_on_distrs(self,
+                             preds_adv: PredictionsOnDistributions,
+                             preds_vic: PredictionsOnDistributions):
         # Get values using data from first distribution
         preds_1_first, preds_1_second = self._get_kl_preds(
             preds_adv.preds_on_distr_1.preds_property_1,
@@ -56,6 +74,9 @@ class KLAttack(Attack):
         # Combine data
         preds_first = np.concatenate((preds_1_first, preds_2_first), 1)
         preds_second = np.concatenate((preds_1_second, preds_2_second), 1)
+        return preds_first, preds_second
+
+    def _get_acc(self, preds_first, preds_second):
         preds = np.concatenate((preds_first, preds_second))
 
         if not self.config.kl_voting:
@@ -65,10 +86,7 @@ class KLAttack(Attack):
         preds = np.mean(preds, 1)        
         gt = np.concatenate((np.zeros(preds_first.shape[0]), np.ones(preds_second.shape[0])))
         acc = 100 * np.mean((preds >= 0.5) == gt)
-
-        # No concept of "choice" (are we in the Matrix :P)
-        choice_information = (None, None)
-        return [(acc, preds), (None, None), choice_information]
+        return acc, preds
 
     def _get_kl_preds(self, ka, kb, kc1, kc2):
         # Apply sigmoid to ones that are not already sigmoided
@@ -103,42 +121,52 @@ class KLAttack(Attack):
 
         # Compare the KL divergence between the two distributions
         # For both sets of victim models
-        KL_vals_1_a = np.array([KL(ka_, x,
-            multi_class=self.config.multi_class) for x in kc1_])
-        self._check(KL_vals_1_a)
-        KL_vals_1_b = np.array(
-            [KL(kb_, x, multi_class=self.config.multi_class) for x in kc1_])
-        self._check(KL_vals_1_b)
-        KL_vals_2_a = np.array([KL(ka_, x,
-            multi_class=self.config.multi_class) for x in kc2_])
-        self._check(KL_vals_2_a)
-        KL_vals_2_b = np.array([KL(kb_, x,
-            multi_class=self.config.multi_class) for x in kc2_])
-        self._check(KL_vals_2_b)
-
-        preds_first = self._pairwise_compare(
-            KL_vals_1_a, KL_vals_1_b, xx, yy)
-        preds_second = self._pairwise_compare(
-            KL_vals_2_a, KL_vals_2_b, xx, yy)
+        preds_first = self._kl_compare(ka_, kb_, kc1_, xx, yy)
+        preds_second = self._kl_compare(ka_, kb_, kc2_, xx, yy)
 
         # Compare KL values
         return preds_first, preds_second
-    
+
+    def _kl_compare(self, ka, kb, kc, xx, yy):
+        """
+            Compare KL values (with victim models kc) of adversary's models ka[xx]
+            and kb[yy], for all victim models. Victim models are processed in chunks,
+            to keep intermediate arrays within config.kl_memory_budget_gb.
+        """
+        multi_class = self.config.multi_class
+        # Terms that depend only on adversary's models
+        neg_entropy_a = _neg_entropy(ka, multi_class)
+        neg_entropy_b = _neg_entropy(kb, multi_class)
+
+        # Approximate bytes used per victim model: its log-probabilities,
+        # KL values, and values for pairs being compared
+        n_values = np.prod(kc.shape[1:])
+        per_victim = 8 * (2 * n_values + ka.shape[0] + kb.shape[0] + 3 * len(xx))
+        budget = self.config.kl_memory_budget_gb * (1024 ** 3)
+        chunk_size = max(1, int(budget // per_victim))
+
+        preds = np.empty((kc.shape[0], len(xx)),
+                         dtype=bool if self.config.kl_voting else np.float64)
+        for start in range(0, kc.shape[0], chunk_size):
+            log_vic = _log_probs(kc[start:start + chunk_size], multi_class)
+            KL_vals_a = KL_matrix(ka, log_vic, multi_class, neg_entropy_a)
+            self._check(KL_vals_a)
+            KL_vals_b = KL_matrix(kb, log_vic, multi_class, neg_entropy_b)
+            self._check(KL_vals_b)
+            preds[start:start + chunk_size] = self._pairwise_compare(
+                KL_vals_a, KL_vals_b, xx, yy)
+        return preds
+
     def _check(self, x):
         if np.sum(np.isinf(x)) > 0 or np.sum(np.isnan(x)) > 0:
             print("Invalid values:", x)
             raise ValueError("Invalid values found!")
 
     def _pairwise_compare(self, x, y, xx, yy):
-        x_ = np.expand_dims(x, 2)
-        y_ = np.expand_dims(y, 2)
-        y_ = np.transpose(y_, (0, 2, 1))
+        # Only the sampled pairs (xx, yy) of adversary's models are compared
         if self.config.kl_voting:
-            pairwise_comparisons = (x_ > y_)
-        else:
-            pairwise_comparisons = (x_ - y_)
-        preds = np.array([z[xx, yy] for z in pairwise_comparisons])
-        return preds
+            return x[:, xx] > y[:, yy]
+        return x[:, xx] - y[:, yy]
 """
     def attack(self,
                preds_adv: PredictionsOnDistributions,
@@ -201,6 +229,43 @@ def softmax(x):
     return exp / np.sum(exp, -1, keepdims=True)
 
 
+def _flat_probs(x, multi_class: bool = False):
+    """
+        Clipped predictions (as in KL), flattened per model.
+        For binary predictions, those for the other class are appended.
+    """
+    small_eps = 1e-4
+    x_ = np.clip(np.asarray(x, dtype=np.float64), small_eps, 1 - small_eps)
+    x_ = x_.reshape(x_.shape[0], -1)
+    if multi_class:
+        return x_
+    return np.concatenate((x_, 1 - x_), 1)
+
+
+def _log_probs(y, multi_class: bool = False):
+    return np.log(_flat_probs(y, multi_class))
+
+
+def _neg_entropy(x, multi_class: bool = False):
+    """
+        Mean (across data) of sum_c x log(x), for each model
+    """
+    x_ = _flat_probs(x, multi_class)
+    return np.sum(x_ * np.log(x_), 1) / x.shape[1]
+
+
+def KL_matrix(x, log_y, multi_class: bool = False, neg_entropy_x=None):
+    """
+        KL divergence between predictions of every model in x and every model
+        with given log-probabilities (see _log_probs), as one matrix product.
+        Same as np.array([KL(x, y_) for y_ in y]): shape (n_models_y, n_models_x).
+    """
+    if neg_entropy_x is None:
+        neg_entropy_x = _neg_entropy(x, multi_class)
+    cross = (log_y @ _flat_probs(x, multi_class).T) / x.shape[1]
+    return neg_entropy_x[np.newaxis] - cross
+
+
 def KL(x, y, multi_class: bool = False):
     small_eps = 1e-4
     x_ = np.clip(x, small_eps, 1 - small_eps)
@@ -1,4 +1,4 @@
-from distribution_inference.attacks.blackbox.KL import KLAttack, sigmoid, KL
+from distribution_inference.attacks.blackbox.KL import KLAttack, sigmoid, _flat_probs, _log_probs, _neg_entropy
 from typing import List, Callable, Tuple
 import numpy as np
 
@@ -18,27 +18,53 @@ class KLRegression(KLAttack):
             epochwise_version and self.config.multi2), "No implementation for both epochwise and multi model"
         assert self.config.regression_config is not None, "Only for regression"
         self.not_using_logits = not_using_logits
+        # Mean (across adversary's models) of KL values is linear in
+        # victim's log-probabilities: reduce adversary's models per ratio once
+        adv_neg_entropy, adv_mean_probs = zip(
+            *[self._adv_kl_terms(pa) for pa in preds_adv])
+        adv_neg_entropy = np.array(adv_neg_entropy)
+        adv_mean_probs = np.stack(adv_mean_probs, 0)
+        labels_ = np.array(labels)[:, np.newaxis]
         p_c = []
-        #nested for loop to test all combinations
         for pv in preds_vic:
-            p_across = []
-            for pa in preds_adv:
-                preds = self._get_kl_preds(pa, pv)
-                #print(preds.shape)
-                p_across.append(preds)
-            p_across = np.array(p_across)
-            p = np.divide(np.sum([i*x for i, x in zip(labels, p_across)], axis=0),
-                          np.sum(p_across, axis=0)
-                          )
+            # Scores for all (adversary's ratio, victim model) pairs
+            p_across = self._get_kl_preds(adv_neg_entropy, adv_mean_probs, pv)
+            p = np.sum(labels_ * p_across, axis=0) / np.sum(p_across, axis=0)
             p_c.append(p)
         gt = np.array([[i]*preds_vic[0].shape[0] for i in labels])
 
         return np.square(p_c-gt).mean(), np.mean(np.square(p_c-gt), axis=1)
 
-    def _get_kl_preds(self, ka, kc1):
-        ka_, kc1_ = ka, kc1
+    def _adv_kl_terms(self, ka):
+        """
+            Mean (across adversary's models) negative entropy and
+            (clipped, flattened) predictions
+        """
+        ka_ = ka
         if not self.not_using_logits:
-            ka_, kc1_ = sigmoid(ka), sigmoid(kc1)
-        KL_vals_1_a = np.array([np.mean(KL(ka_, x,
-                                           multi_class=self.config.multi_class), axis=0) for x in kc1_])
-        return KL_vals_1_a
+            ka_ = sigmoid(ka)
+        multi_class = self.config.multi_class
+        return (np.mean(_neg_entropy(ka_, multi_class)),
+                np.mean(_flat_probs(ka_, multi_class), axis=0))
+
+    def _get_kl_preds(self, adv_neg_entropy, adv_mean_probs, kc1):
+        """
+            Mean KL value between adversary's models (for each ratio) and
+            each victim model, shape (n_ratios, n_victims). Victim models are
+            processed in chunks, to stay within config.kl_memory_budget_gb.
+        """
+        kc1_ = kc1
+        if not self.not_using_logits:
+            kc1_ = sigmoid(kc1)
+        n_values = np.prod(kc1_.shape[1:])
+        per_victim = 8 * (3 * n_values + len(adv_neg_entropy))
+        budget = self.config.kl_memory_budget_gb * (1024 ** 3)
+        chunk_size = max(1, int(budget // per_victim))
+
+        KL_vals = np.empty((len(adv_neg_entropy), kc1_.shape[0]))
+        for start in range(0, kc1_.shape[0], chunk_size):
+            log_vic = _log_probs(kc1_[start:start + chunk_size],
+                                 self.config.multi_class)
+            cross = (adv_mean_probs @ log_vic.T) / kc1_.shape[1]
+            KL_vals[:, start:start + chunk_size] = adv_neg_entropy[:, np.newaxis] - cross
+        return KL_vals
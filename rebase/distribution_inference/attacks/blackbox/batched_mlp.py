@@ -0,0 +1,258 @@
+"""
+    Binary MLP classifiers (meta-classifiers for black-box attacks) trained
+    together as one batched model: weights of all classifiers are stacked
+    into (n_models, in, out) tensors and updated by a single optimizer.
+    Follows sklearn's MLPClassifier (ReLU hidden layers, Adam, L2 penalty,
+    optional early stopping on held-out accuracy), and exposes each trained
+    classifier with the same predict/predict_proba/score surface.
+"""
+import numpy as np
+import torch as ch
+import torch.nn.functional as F
+from typing import List, Tuple
+
+from distribution_inference.device import get_execution_context
+
+
+class BatchedMLPClassifier:
+    def __init__(self,
+                 hidden_layer_sizes: Tuple[int] = (100,),
+                 alpha: float = 1e-4,
+                 batch_size: int = 200,
+                 learning_rate_init: float = 1e-3,
+                 max_iter: int = 200,
+                 tol: float = 1e-4,
+                 early_stopping: bool = False,
+                 validation_fraction: float = 0.1,
+                 n_iter_no_change: int = 10,
+                 random_state: int = None):
+        """
+            Same meaning (and defaults) as parameters of sklearn's MLPClassifier
+        """
+        self.hidden_layer_sizes = tuple(hidden_layer_sizes)
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.learning_rate_init = learning_rate_init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.early_stopping = early_stopping
+        self.validation_fraction = validation_fraction
+        self.n_iter_no_change = n_iter_no_change
+        self.random_state = random_state
+        self.weights, self.biases = None, None
+
+    def __len__(self):
+        return len(self.n_features_)
+
+    def __getitem__(self, k: int) -> "BatchedMLPView":
+        return BatchedMLPView(self, k)
+
+    def _stack(self, Xs: List[np.ndarray], ys: List[np.ndarray] = None):
+        """
+            Pad data of all classifiers (features with zeros, samples with
+            a mask) to common shapes: (n_models, n_samples, n_features)
+        """
+        n_samples = max(len(X) for X in Xs)
+        X_ = np.zeros((len(Xs), n_samples, self.n_features_in_), dtype=np.float32)
+        y_ = np.zeros((len(Xs), n_samples), dtype=np.float32)
+        mask = np.zeros((len(Xs), n_samples), dtype=np.float32)
+        for k, X in enumerate(Xs):
+            X_[k, :len(X), :X.shape[1]] = X
+            mask[k, :len(X)] = 1
+            if ys is not None:
+                y_[k, :len(X)] = ys[k]
+        context = get_execution_context()
+        return (ch.from_numpy(X_).to(context.device),
+                ch.from_numpy(y_).to(context.device),
+                ch.from_numpy(mask).to(context.device))
+
+    def _split(self, X: np.ndarray, y: np.ndarray, rng: np.random.Generator):
+        # Stratified split into train and validation data (as in sklearn)
+        val = []
+        for label in np.unique(y):
+            indices = rng.permutation(np.nonzero(y == label)[0])
+            val.append(indices[:int(np.ceil(self.validation_fraction * len(indices)))])
+        val = np.concatenate(val)
+        train = np.setdiff1d(np.arange(len(y)), val)
+        return (X[train], y[train]), (X[val], y[val])
+
+    def _forward(self, x: ch.Tensor, weights=None, biases=None) -> ch.Tensor:
+        """
+            x: (n_models, batch, n_features). Returns logits (n_models, batch).
+        """
+        weights = self.weights if weights is None else weights
+        biases = self.biases if biases is None else biases
+        for i, (w, b) in enumerate(zip(weights, biases)):
+            x = ch.baddbmm(b, x, w)
+            if i < len(weights) - 1:
+                x = x.relu()
+        return x.squeeze(-1)
+
+    def _init_params(self, generator: ch.Generator):
+        # Glorot-uniform initialization (as in sklearn), with actual fan-in of each classifier
+        context = get_execution_context()
+        n_models = len(self.n_features_)
+        sizes = [self.n_features_in_] + list(self.hidden_layer_sizes) + [1]
+        self.weights, self.biases = [], []
+        for i, (fan_in, fan_out) in enumerate(zip(sizes[:-1], sizes[1:])):
+            fan_ins = ch.tensor(self.n_features_ if i == 0 else [fan_in] * n_models,
+                                dtype=ch.float32)
+            bound = ch.sqrt(6. / (fan_ins + fan_out)).view(-1, 1, 1)
+            w = (2 * ch.rand((n_models, fan_in, fan_out), generator=generator) - 1) * bound
+            b = (2 * ch.rand((n_models, 1, fan_out), generator=generator) - 1) * bound
+            self.weights.append(w.to(context.device))
+            self.biases.append(b.to(context.device))
+
+    def fit(self, Xs: List[np.ndarray], ys: List[np.ndarray]) -> "BatchedMLPClassifier":
+        """
+            Train one classifier per (X, y) pair, all at once.
+            Labels must be binary (0/1). Number of samples and
+            features may differ across classifiers.
+        """
+        for y in ys:
+            if not np.all(np.isin(y, [0, 1])):
+                raise ValueError("Only binary (0/1) labels are supported")
+        rng = np.random.default_rng(self.random_state)
+        generator = ch.Generator()
+        generator.manual_seed(int(rng.integers(2 ** 31)))
+        self.n_features_ = [X.shape[1] for X in Xs]
+        self.n_features_in_ = max(self.n_features_)
+        self.classes_ = np.array([0., 1.])
+
+        if self.early_stopping:
+            splits = [self._split(np.asarray(X), np.asarray(y), rng) for X, y in zip(Xs, ys)]
+            X_val, y_val, mask_val = self._stack([s[1][0] for s in splits],
+                                                 [s[1][1] for s in splits])
+            Xs, ys = [s[0][0] for s in splits], [s[0][1] for s in splits]
+        X_tr, y_tr, mask_tr = self._stack(Xs, ys)
+        n_models, n_samples = mask_tr.shape
+        batch_size = min(self.batch_size, n_samples)
+        n_layers = len(self.hidden_layer_sizes) + 1
+
+        self._init_params(generator)
+        # Parameters kept for each classifier: best (on validation data) with
+        # early stopping, otherwise latest (until that classifier stops)
+        kept = self.weights + self.biases
+        params = [p.clone().requires_grad_() for p in kept]
+        optimizer = ch.optim.Adam(params, lr=self.learning_rate_init)
+        best_score = np.full(n_models, -np.inf)
+        best_loss = np.full(n_models, np.inf)
+        no_improvement = np.zeros(n_models, dtype=int)
+        self.n_iter_ = np.zeros(n_models, dtype=int)
+        # Classifiers (in order) of the batched model being trained:
+        # ones that stopped are dropped from it, along with their data
+        index = np.arange(n_models)
+        for _ in range(self.max_iter):
+            # Shuffle data of each classifier once per epoch
+            order = ch.argsort(ch.rand((len(index), n_samples), generator=generator), dim=1).to(X_tr.device)
+            rows = ch.arange(len(index), device=X_tr.device).unsqueeze(1)
+            X_ep, y_ep, mask_ep = X_tr[rows, order], y_tr[rows, order], mask_tr[rows, order]
+            weights, biases = params[:n_layers], params[n_layers:]
+            epoch_loss = ch.zeros(len(index), device=X_tr.device)
+            for start in range(0, n_samples, batch_size):
+                x = X_ep[:, start:start + batch_size]
+                y = y_ep[:, start:start + batch_size]
+                m = mask_ep[:, start:start + batch_size]
+                n_batch = m.sum(1).clamp(min=1)
+                bce = F.binary_cross_entropy_with_logits(
+                    self._forward(x, weights, biases), y, reduction='none')
+                penalty = sum((w ** 2).sum((1, 2)) for w in weights)
+                # Classifiers have separate parameters: summing their losses trains each independently
+                loss = (bce * m).sum(1) / n_batch + 0.5 * self.alpha * penalty / n_batch
+                optimizer.zero_grad()
+                loss.sum().backward()
+                optimizer.step()
+                epoch_loss += loss.detach() * m.sum(1)
+            active = no_improvement[index] <= self.n_iter_no_change
+            self.n_iter_[index[active]] += 1
+
+            if self.early_stopping:
+                with ch.no_grad():
+                    correct = ((self._forward(X_val, weights, biases) >= 0) == (y_val > 0.5)).float()
+                    score = ((correct * mask_val).sum(1) / mask_val.sum(1).clamp(min=1)).cpu().numpy()
+                improved = active & (score > best_score[index])
+                worse = active & (score < best_score[index] + self.tol)
+                best_score[index[improved]] = score[improved]
+            else:
+                epoch_loss = (epoch_loss / mask_tr.sum(1)).cpu().numpy()
+                improved = active.copy()
+                worse = active & (epoch_loss > best_loss[index] - self.tol)
+                better = active & (epoch_loss < best_loss[index])
+                best_loss[index[better]] = epoch_loss[better]
+            no_improvement[index[worse]] += 1
+            no_improvement[index[active & ~worse]] = 0
+
+            with ch.no_grad():
+                improved_ = ch.from_numpy(improved).to(X_tr.device)
+                kept_rows = ch.from_numpy(index[improved]).to(X_tr.device)
+                for p, p_kept in zip(params, kept):
+                    p_kept[kept_rows] = p[improved_]
+            training = no_improvement[index] <= self.n_iter_no_change
+            if not np.any(training):
+                break
+            # Drop stopped classifiers (once enough of them stopped, to not copy data often)
+            if training.sum() <= 0.75 * len(index):
+                keep = ch.from_numpy(training).to(X_tr.device)
+                index = index[training]
+                X_tr, y_tr, mask_tr = X_tr[keep], y_tr[keep], mask_tr[keep]
+                if self.early_stopping:
+                    X_val, y_val, mask_val = X_val[keep], y_val[keep], mask_val[keep]
+                params, optimizer = self._select(params, optimizer, keep)
+
+        self.weights, self.biases = kept[:n_layers], kept[n_layers:]
+        self.best_validation_score_ = best_score if self.early_stopping else None
+        return self
+
+    def _select(self, params: List[ch.Tensor], optimizer, keep: ch.Tensor):
+        """
+            Parameters (and optimizer, with its state) for given classifiers only
+        """
+        selected = [p.detach()[keep].clone().requires_grad_() for p in params]
+        new_optimizer = ch.optim.Adam(selected, lr=self.learning_rate_init)
+        for p, p_new in zip(params, selected):
+            state = optimizer.state.get(p, {})
+            new_optimizer.state[p_new] = {
+                k: v[keep].clone() if ch.is_tensor(v) and v.dim() > 0 else v
+                for k, v in state.items()}
+        return selected, new_optimizer
+
+    def predict_proba(self, X: np.ndarray, k: int) -> np.ndarray:
+        """
+            P[class] (n_samples, 2) for data X, using k-th classifier
+        """
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features_[k]:
+            raise ValueError(f"X has {X.shape[-1]} features, but classifier {k} "
+                             f"was trained on {self.n_features_[k]} features")
+        X_ = np.zeros((1, len(X), self.n_features_in_), dtype=np.float32)
+        X_[0, :, :X.shape[1]] = X
+        context = get_execution_context()
+        with ch.no_grad():
+            logits = self._forward(ch.from_numpy(X_).to(context.device),
+                                   [w[k:k + 1] for w in self.weights],
+                                   [b[k:k + 1] for b in self.biases])
+        p = ch.sigmoid(logits[0]).double().cpu().numpy()
+        return np.stack((1 - p, p), 1)
+
+
+class BatchedMLPView:
+    """
+        One of the classifiers in a BatchedMLPClassifier, with
+        sklearn-compatible predict/predict_proba/score
+    """
+    def __init__(self, batched: BatchedMLPClassifier, k: int):
+        self.batched = batched
+        self.k = k
+        self.classes_ = batched.classes_
+        self.best_validation_score_ = None
+        if batched.best_validation_score_ is not None:
+            self.best_validation_score_ = float(batched.best_validation_score_[k])
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.batched.predict_proba(X, self.k)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+    def score(self, X: np.ndarray, y: np.ndarray) -> float:
+        return float(np.mean(self.predict(X) == y))
@@ -10,8 +10,9 @@ from distribution_inference.config import BlackBoxAttackConfig
 from distribution_inference.attacks.blackbox.per_point import PerPointThresholdAttack
 
 class BinaryPerPointThresholdAttack(PerPointThresholdAttack):
-    def __init__(self, config: BlackBoxAttackConfig):
-        super().__init__(config)
+    def __init__(self, config: BlackBoxAttackConfig,
+                 rng: np.random.Generator = None):
+        super().__init__(config, rng=rng)
         assert not config.multi_class
 
     def attack(self,
@@ -0,0 +1,134 @@
+"""
+    Preallocated output arrays for predictions. Predictions are written
+    in-place, batch by batch, instead of being collected in lists and
+    concatenated/stacked at the end (which holds multiple copies in memory).
+    Large arrays can be backed by a memory-mapped file on local disk, and
+    arrays that worker processes write into are backed by a (shared) file that
+    workers map as well.
+"""
+import os
+import mmap
+import weakref
+import tempfile
+import numpy as np
+from typing import Tuple
+
+from distribution_inference.utils import ensure_dir_exists
+
+
+class _MemmapSettings:
+    directory = os.environ.get('DDI_MEMMAP_DIRECTORY')
+    min_bytes = 64 * (1024 ** 2)
+
+
+def set_memmap_directory(directory: str, min_size_mb: float = 64):
+    """
+        Back prediction arrays of at least min_size_mb with memory-mapped
+        files in given directory (should be on local disk). None to disable.
+    """
+    _MemmapSettings.directory = directory
+    _MemmapSettings.min_bytes = int(min_size_mb * (1024 ** 2))
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def allocate_predictions(shape: Tuple, dtype=np.float32,
+                         shared: bool = False) -> np.ndarray:
+    """
+        Allocate (uninitialized) array to write predictions into.
+        If shared is True, array is backed by a file (in shared memory, unless
+        large enough to go in the memmap directory) that other processes can
+        write into (see share_spec).
+    """
+    dtype = np.dtype(dtype)
+    n_bytes = int(np.prod(shape)) * dtype.itemsize
+    use_memmap_directory = _MemmapSettings.directory is not None and \
+        n_bytes >= _MemmapSettings.min_bytes
+    if not (shared or use_memmap_directory):
+        return np.empty(shape, dtype=dtype)
+
+    if use_memmap_directory:
+        directory = _MemmapSettings.directory
+        ensure_dir_exists(directory)
+    else:
+        # tmpfs (RAM) if available
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".npy")
+    os.close(fd)
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    if shared:
+        # Other processes open the file by name: remove it once array (and its views) are released
+        weakref.finalize(array.base, _remove_file, path)
+    else:
+        # Mapping stays valid after unlinking; disk space is freed once array is released
+        os.remove(path)
+    return array
+
+
+def share_spec(array: np.ndarray):
+    """
+        (path, offset, shape, dtype) with which another process can map given
+        array (a shared array from allocate_predictions, or a contiguous part of
+        one) with np.memmap. None if array cannot be shared.
+    """
+    if not isinstance(array, np.memmap) or not array.flags['C_CONTIGUOUS']:
+        return None
+    root = array
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not isinstance(root.base, mmap.mmap) or root.filename is None or \
+            not os.path.exists(root.filename):
+        return None
+    offset = root.offset + (array.ctypes.data - root.ctypes.data)
+    return root.filename, int(offset), array.shape, array.dtype.str
+
+
+def open_shared(spec) -> np.ndarray:
+    """
+        Map array described by share_spec() (writes are seen by all processes)
+    """
+    path, offset, shape, dtype = spec
+    return np.memmap(path, mode='r+', dtype=np.dtype(dtype),
+                     offset=offset, shape=tuple(shape))
+
+
+class PredictionWriter:
+    """
+        Streaming writer for predictions of n_models models on n_points points.
+        Output array (n_models, n_points, ...) is allocated on the first write,
+        once the per-point shape and type of predictions are known.
+    """
+    def __init__(self, n_models: int, n_points: int, out: np.ndarray = None):
+        """
+            out: if given, write predictions into this array instead
+        """
+        self.n_models = n_models
+        self.n_points = n_points
+        self.predictions = out
+
+    def _allocate(self, prediction: np.ndarray, leading: int):
+        if self.predictions is None:
+            shape = (self.n_models, self.n_points) + prediction.shape[leading:]
+            self.predictions = allocate_predictions(shape, prediction.dtype)
+
+    def write(self, model_index: int, start: int, prediction: np.ndarray):
+        """
+            Write predictions (batch, ...) of one model, for points start onwards
+        """
+        self._allocate(prediction, 1)
+        self.predictions[model_index, start:start + len(prediction)] = prediction
+
+    def write_models(self, start: int, prediction: np.ndarray):
+        """
+            Write predictions (n_models, batch, ...) of all models, for points start onwards
+        """
+        self._allocate(prediction, 2)
+        self.predictions[:, start:start + prediction.shape[1]] = prediction
+
+    def get(self) -> np.ndarray:
+        if self.predictions is None:
+            raise ValueError("No predictions written")
+        return self.predictions
@@ -0,0 +1,233 @@
+"""
+    Persistent, content-addressed cache for model predictions.
+    Predictions are stored as .npy files (loaded back memory-mapped),
+    with an index that tracks size and last access for LRU eviction.
+    Entries are written to their own temporary directories, and the index is
+    updated under a lock on the cache directory, so that concurrent runs can
+    share the cache. Accesses (hits) are written to the index in batches.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from typing import List, Tuple
+
+from distribution_inference.utils import ensure_dir_exists, get_cache_path, directory_lock
+from distribution_inference.training.zoo import model_file_stat
+
+
+class PredictionCache:
+    INDEX_NAME = "index.json"
+    PREDS_NAME = "preds.npy"
+    GT_NAME = "ground_truth.npy"
+    # Number of cache hits after which accesses are written to the index
+    ACCESS_FLUSH_EVERY = 32
+
+    def __init__(self,
+                 cache_dir: str = None,
+                 max_size_gb: float = 10.0):
+        """
+            cache_dir: directory to store predictions in (defaults to get_cache_path())
+            max_size_gb: total size (in GB) after which least-recently used entries are evicted
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_path(), "predictions")
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_gb * (1024 ** 3))
+        ensure_dir_exists(self.cache_dir)
+        # Accesses not written to index yet: key -> (last access, hits)
+        self._accesses = {}
+
+    @staticmethod
+    def model_signature(model_paths: List[str]) -> List:
+        """
+            Identify model files by (path, mtime, size). Cheaper than hashing
+            file contents, and changes whenever a model is re-trained.
+        """
+        signature = []
+        for path in model_paths:
+            # Models in packed zoos are identified by the packed file
+            stat = model_file_stat(path)
+            signature.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+        return signature
+
+    def make_key(self,
+                 model_paths: List[str],
+                 data_ids: np.ndarray,
+                 latent: int = None,
+                 multi_class: bool = False,
+                 processed_variant: bool = False,
+                 data_description: str = None,
+                 precision: str = "fp32") -> str:
+        """
+            Content-addressed key for predictions of given models on given data.
+        """
+        description = {
+            "models": PredictionCache.model_signature(model_paths),
+            "data_ids": hashlib.sha256(
+                np.ascontiguousarray(data_ids).tobytes()).hexdigest(),
+            "n_data": len(data_ids),
+            "data": data_description,
+            "latent": latent,
+            "multi_class": multi_class,
+            "processed_variant": processed_variant,
+            "precision": precision,
+        }
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, self.INDEX_NAME)
+
+    def _load_index(self) -> dict:
+        if not os.path.exists(self._index_path()):
+            return {}
+        with open(self._index_path(), 'r') as f:
+            return json.load(f)
+
+    def _save_index(self, index: dict):
+        # Write to (own) temporary file first, to not corrupt index on crash
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.cache_dir, prefix=self.INDEX_NAME + ".", suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(temp_path, self._index_path())
+
+    def _apply_accesses(self, index: dict):
+        for key, (last_access, hits) in self._accesses.items():
+            if key in index:
+                index[key]["last_access"] = max(index[key]["last_access"], last_access)
+                index[key]["hits"] = index[key].get("hits", 0) + hits
+        self._accesses = {}
+
+    def flush(self):
+        """
+            Write accesses (since last write) to the index
+        """
+        if len(self._accesses) == 0:
+            return
+        with directory_lock(self.cache_dir):
+            index = self._load_index()
+            self._apply_accesses(index)
+            self._save_index(index)
+
+    def get(self, key: str, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Return (predictions, ground_truth) for given key, or None
+            if not cached. Arrays are memory-mapped (copy-on-write) by default.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        mmap_mode = 'c' if mmap else None
+        # Shared lock: entry is not replaced or evicted while being opened
+        with directory_lock(self.cache_dir, exclusive=False):
+            if key not in self._load_index() or not os.path.isdir(entry_dir):
+                return None
+            predictions = np.load(os.path.join(
+                entry_dir, self.PREDS_NAME), mmap_mode=mmap_mode)
+            ground_truth = np.load(os.path.join(
+                entry_dir, self.GT_NAME), mmap_mode=mmap_mode)
+        _, hits = self._accesses.get(key, (None, 0))
+        self._accesses[key] = (time.time(), hits + 1)
+        if sum(h for _, h in self._accesses.values()) >= self.ACCESS_FLUSH_EVERY:
+            self.flush()
+        return predictions, ground_truth
+
+    def get_info(self, key: str) -> dict:
+        """
+            Extra information stored alongside predictions (if cached)
+        """
+        entry = self._load_index().get(key, None)
+        if entry is None:
+            return None
+        return entry.get("info", {})
+
+    def put(self, key: str,
+            predictions: np.ndarray,
+            ground_truth: np.ndarray,
+            info: dict = None):
+        """
+            Store predictions (and ground truth) for given key,
+            evicting least-recently used entries if over budget.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        # Write outside the lock, into a directory of this call's own
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + ".tmp.")
+        np.save(os.path.join(temp_dir, self.PREDS_NAME), predictions)
+        np.save(os.path.join(temp_dir, self.GT_NAME), ground_truth)
+
+        old_dir = None
+        with directory_lock(self.cache_dir):
+            if os.path.exists(entry_dir):
+                # Replaced entry is removed after releasing the lock
+                old_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + ".old.")
+                os.replace(entry_dir, os.path.join(old_dir, key))
+            os.replace(temp_dir, entry_dir)
+
+            index = self._load_index()
+            self._apply_accesses(index)
+            now = time.time()
+            index[key] = {
+                "size": predictions.nbytes + ground_truth.nbytes,
+                "shape": list(predictions.shape),
+                "created": now,
+                "last_access": now,
+                "hits": 0,
+                "info": info if info is not None else {},
+            }
+            self._evict(index, keep=key)
+            self._save_index(index)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _evict(self, index: dict, keep: str = None):
+        # Remove least-recently used entries until within budget
+        total = sum(v["size"] for v in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total <= self.max_size_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index[key]["size"]
+            self._remove_entry(key)
+            del index[key]
+
+    def _remove_entry(self, key: str):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def entries(self) -> dict:
+        """
+            Mapping of key to stored metadata (size, shape, access times)
+        """
+        return self._load_index()
+
+    def total_size(self) -> int:
+        return sum(v["size"] for v in self._load_index().values())
+
+    def remove(self, key: str):
+        with directory_lock(self.cache_dir):
+            index = self._load_index()
+            if key in index:
+                del index[key]
+                self._save_index(index)
+            self._remove_entry(key)
+        self._accesses.pop(key, None)
+
+    def purge(self, older_than: float = None):
+        """
+            Remove all entries (or only those not accessed in
+            the last 'older_than' seconds)
+        """
+        with directory_lock(self.cache_dir):
+            index = self._load_index()
+            self._apply_accesses(index)
+            now = time.time()
+            for key in list(index.keys()):
+                if older_than is None or now - index[key]["last_access"] > older_than:
+                    self._remove_entry(key)
+                    del index[key]
+            self._save_index(index)
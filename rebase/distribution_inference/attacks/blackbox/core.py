@@ -7,6 +7,10 @@ from tqdm import tqdm
 from distribution_inference.config import BlackBoxAttackConfig
 
 
+# Step size for threshold sweeps that cannot be done exactly (multi-dimensional scores)
+DEFAULT_GRANULARITY = 0.005
+
+
 class PredictionsOnOneDistribution:
     def __init__(self,
                  preds_property_1: List,
@@ -33,9 +37,18 @@ class PredictionsOnDistributions:
 
 
 class Attack:
-    def __init__(self, config: BlackBoxAttackConfig):
+    def __init__(self, config: BlackBoxAttackConfig,
+                 rng: np.random.Generator = None):
+        """
+            rng: for random sampling (victim models in multi model settings, pairs
+            of points). Should be shared across trials (one per run), so that trials
+            draw different samples. Seeded with config.multi_sampling_seed if not given.
+        """
         self.config = config
         self.supports_saving_preds = False
+        if rng is None:
+            rng = np.random.default_rng(config.multi_sampling_seed)
+        self.rng = rng
 
     def attack(self,
                preds_adv: PredictionsOnDistributions,
@@ -57,24 +70,46 @@ class Attack:
                 "Method should be implemented if attack generated soft-labels")
 
 
-def multi_model_sampling(arr, multi):
-    res = np.zeros(arr.shape)
-    if len(arr.shape) == 2:
-        leng = arr.shape[1]
-
-        for i in range(leng):
-            use = arr[:, np.random.permutation(leng)[:multi]]
-            use = np.average(use, axis=1)
-            res[:, i] = use
-    elif len(arr.shape) == 1:
-        leng = arr.shape[0]
-        for i in range(leng):
-            use = arr[np.random.permutation(leng)[:multi]]
-            use = np.average(use)
-            res[i] = use
-    else:
+def sample_model_subsets(n_models: int, n_subsets: int, size: int,
+                         rng: np.random.Generator = None):
+    """
+        Indices (n_subsets, min(size, n_models)) of random subsets of models,
+        each sampled without replacement (like np.random.permutation(n_models)[:size]).
+        Subsets are the smallest entries of a random-key matrix, in chunks of rows.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    size = min(size, n_models)
+    indices = np.empty((n_subsets, size), dtype=np.int64)
+    chunk_size = max(1, (1 << 22) // max(1, n_models))
+    for start in range(0, n_subsets, chunk_size):
+        keys = rng.random((min(chunk_size, n_subsets - start), n_models))
+        if size < n_models:
+            keys = np.argpartition(keys, size - 1, axis=1)[:, :size]
+        else:
+            keys = np.argsort(keys, axis=1)
+        indices[start:start + keys.shape[0]] = keys
+    return indices
+
+
+def multi_model_sampling(arr, multi, rng: np.random.Generator = None):
+    """
+        Replace each model's values (along last axis) with average
+        of values of 'multi' randomly sampled models
+    """
+    arr = np.asarray(arr)
+    if len(arr.shape) not in [1, 2]:
         raise ValueError("Dimension mismatch")
-    return res
+    leng = arr.shape[-1]
+    sampling = sample_model_subsets(leng, leng, multi, rng)
+    averaged = np.empty(arr.shape, dtype=np.float64)
+    # Values of sampled models are gathered for a chunk of models at a time
+    n_points = arr.shape[0] if len(arr.shape) == 2 else 1
+    chunk_size = max(1, (1 << 22) // (n_points * sampling.shape[1]))
+    for start in range(0, leng, chunk_size):
+        averaged[..., start:start + chunk_size] = np.mean(
+            arr[..., sampling[start:start + chunk_size]], axis=-1)
+    return averaged
 
 
 def _acc_per_dis(preds_d1: PredictionsOnOneDistribution,
@@ -96,15 +131,29 @@ def _acc_per_dis(preds_d1: PredictionsOnOneDistribution,
     return (np.array(acc1), np.array(acc2))
 
 
+def _epochwise_accs(calc_acc: Callable, preds, labels,
+                    multi_class: bool = False):
+    """
+        calc_acc for models of all epochs in one call.
+        preds: (n_epochs, n_points, n_models, ...). Returns (n_epochs, n_models).
+    """
+    n_epochs, n_points, n_models = preds.shape[:3]
+    merged = np.moveaxis(preds, 0, 1).reshape(
+        (n_points, n_epochs * n_models) + preds.shape[3:])
+    return calc_acc(merged, labels, multi_class=multi_class).reshape(n_epochs, n_models)
+
+
 def threshold_test_per_dist(calc_acc: Callable,
                             preds_adv: PredictionsOnOneDistribution,
                             preds_victim: PredictionsOnOneDistribution,
                             y_gt: np.ndarray,
                             config: BlackBoxAttackConfig,
-                            epochwise_version: bool = False):
+                            epochwise_version: bool = False,
+                            rng: np.random.Generator = None):
     """
         Perform threshold-test on predictions of adversarial and victim models,
         for each of the given ratios. Returns statistics on all ratios.
+        rng is used to sample victim models in multi model settings.
     """
     assert not (
         epochwise_version and config.multi), "No implementation for both epochwise and multi model"
@@ -126,8 +175,9 @@ def threshold_test_per_dist(calc_acc: Callable,
     p1 = np.transpose(p1, transpose_order)[order][::-1]
     p2 = np.transpose(p2, transpose_order)[order][::-1]
     if epochwise_version:
-        pv1 = [np.transpose(x, transpose_order)[order][::-1] for x in pv1]
-        pv2 = [np.transpose(x, transpose_order)[order][::-1] for x in pv2]
+        # Models of all epochs are evaluated together: (n_epochs, n_points, n_models, ...)
+        pv1 = np.stack([np.transpose(x, transpose_order)[order][::-1] for x in pv1])
+        pv2 = np.stack([np.transpose(x, transpose_order)[order][::-1] for x in pv2])
     else:
         pv1 = np.transpose(pv1, transpose_order)[order][::-1]
         pv2 = np.transpose(pv2, transpose_order)[order][::-1]
@@ -140,8 +190,7 @@ def threshold_test_per_dist(calc_acc: Callable,
         leng = int(ratio * p1.shape[0])
         p1_use, p2_use, yg_use = p1[:leng], p2[:leng], yg[:leng]
         if epochwise_version:
-            pv1_use = [x[:leng] for x in pv1]
-            pv2_use = [x[:leng] for x in pv2]
+            pv1_use, pv2_use = pv1[:, :leng], pv2[:, :leng]
         else:
             pv1_use, pv2_use = pv1[:leng], pv2[:leng]
 
@@ -155,34 +204,34 @@ def threshold_test_per_dist(calc_acc: Callable,
             accs_1, accs_2, granularity=config.granularity)
         adv_accs.append(100 * tracc)
         if epochwise_version:
-            accs_victim_1 = [100 * calc_acc(pv1_use_inside, yg_use, multi_class=multi_class)
-                             for pv1_use_inside in pv1_use]
-            accs_victim_2 = [100 * calc_acc(pv2_use_inside, yg_use, multi_class=multi_class)
-                             for pv2_use_inside in pv2_use]
+            accs_victim_1 = 100 * \
+                _epochwise_accs(calc_acc, pv1_use, yg_use, multi_class=multi_class)
+            accs_victim_2 = 100 * \
+                _epochwise_accs(calc_acc, pv2_use, yg_use, multi_class=multi_class)
         else:
             accs_victim_1 = 100 * \
                 calc_acc(pv1_use, yg_use, multi_class=multi_class)
             accs_victim_2 = 100 * \
                 calc_acc(pv2_use, yg_use, multi_class=multi_class)
         if config.multi:
-            accs_victim_1 = multi_model_sampling(accs_victim_1, config.multi)
-            accs_victim_2 = multi_model_sampling(accs_victim_2, config.multi)
+            accs_victim_1 = multi_model_sampling(accs_victim_1, config.multi, rng)
+            accs_victim_2 = multi_model_sampling(accs_victim_2, config.multi, rng)
         allaccs_1.append(accs_victim_1)
         allaccs_2.append(accs_victim_2)
 
         # Get accuracy on victim models using these thresholds
         if epochwise_version:
-            combined = [np.concatenate((x, y)) for (
-                x, y) in zip(accs_victim_1, accs_victim_2)]
-            classes = [np.concatenate((np.zeros_like(x), np.ones_like(y))) for (
-                x, y) in zip(accs_victim_1, accs_victim_2)]
-            specific_acc = [get_threshold_acc(
-                x, y, threshold, rule) for (x, y) in zip(combined, classes)]
-            f_accs.append([100 * x for x in specific_acc])
+            # For all epochs at once
+            combined = np.concatenate((accs_victim_1, accs_victim_2), 1)
+            classes = np.concatenate(
+                (np.zeros(accs_victim_1.shape[1]), np.ones(accs_victim_2.shape[1])))
+            specific_acc = get_threshold_acc(
+                combined, classes, threshold, rule, axis=1)
+            f_accs.append(100 * specific_acc)
         else:
             if config.multi2:
                 specific_acc = get_threshold_acc_multi(
-                    accs_victim_1, accs_victim_2, threshold, config.multi2, rule)
+                    accs_victim_1, accs_victim_2, threshold, config.multi2, rule, rng=rng)
             else:
                 combined = np.concatenate((accs_victim_1, accs_victim_2))
                 classes = np.concatenate(
@@ -202,11 +251,81 @@ def threshold_test_per_dist(calc_acc: Callable,
     return np.array(adv_accs), f_accs, (allaccs_1, allaccs_2)
 
 
-def find_threshold_acc(accs_1, accs_2, granularity: float = 0.1):
+def find_thresholds_per_point(pred_1, pred_2):
+    """
+        Exact best threshold and rule for every data point at once.
+        pred_1: (n_points, n_models_1) and pred_2: (n_points, n_models_2) are
+        predictions of models from the two distributions. Returns (accs,
+        thresholds, rules), each of shape (n_points,), same as calling
+        find_threshold_acc(pred_1[i], pred_2[i]) for each point i
+        (rule 0 where no rule gets non-zero accuracy).
+    """
+    combined = np.concatenate((pred_1, pred_2), 1)
+    if not np.issubdtype(combined.dtype, np.floating):
+        combined = combined.astype(np.float64)
+    n_points, n = combined.shape
+    # Want to predict first set as 0s, second set as 1s
+    classes = np.concatenate(
+        (np.zeros(pred_1.shape[1], dtype=np.int64), np.ones(pred_2.shape[1], dtype=np.int64)))
+
+    # Sort scores of each point
+    order = np.argsort(combined, axis=1, kind='stable')
+    values = np.take_along_axis(combined, order, 1)
+    # Number of class-1 scores before each position (in sorted order)
+    ones_before = np.zeros((n_points, n + 1), dtype=np.int64)
+    np.cumsum(classes[order], axis=1, out=ones_before[:, 1:])
+    n_ones = ones_before[:, -1:]
+
+    # Only values taken by the scores need to be tried as thresholds: any other
+    # threshold splits them the same way as one of these (for the same rule).
+    # Find where the run of equal values at each position starts and ends
+    positions = np.arange(n)
+    is_first = np.ones((n_points, n), dtype=bool)
+    is_first[:, 1:] = values[:, 1:] != values[:, :-1]
+    is_last = np.ones((n_points, n), dtype=bool)
+    is_last[:, :-1] = is_first[:, 1:]
+    start = np.maximum.accumulate(np.where(is_first, positions, 0), axis=1)
+    end = np.minimum.accumulate(
+        np.where(is_last, positions + 1, n)[:, ::-1], axis=1)[:, ::-1]
+
+    # Class-1 scores below (<) and up to (<=) each value
+    ones_below = np.take_along_axis(ones_before, start, 1)
+    ones_upto = np.take_along_axis(ones_before, end, 1)
+    zeros_below = start - ones_below
+    zeros_upto = end - ones_upto
+    # Rule-1: everything above threshold is 1 class
+    acc_1 = ((n_ones - ones_below) + zeros_below) / n
+    # Rule-2: everything below threshold is 1 class
+    acc_2 = (ones_upto + ((n - n_ones) - zeros_upto)) / n
+
+    # Ties are broken like the sweep: lowest threshold, then rule 1
+    best_of_two = np.maximum(acc_1, acc_2)
+    best = np.argmax(best_of_two, axis=1)[:, None]
+    accs = np.take_along_axis(best_of_two, best, 1)[:, 0]
+    thresholds = np.take_along_axis(values, best, 1)[:, 0]
+    rules = np.where(np.take_along_axis(acc_1, best, 1)[:, 0] >=
+                     np.take_along_axis(acc_2, best, 1)[:, 0], 1, 2)
+    rules[accs <= 0] = 0
+    thresholds[accs <= 0] = 0
+    return accs, thresholds, rules
+
+
+def find_threshold_acc(accs_1, accs_2, granularity: float = None):
     """
         Find thresholds and rules for differentiating between two
-        sets of predictions.
+        sets of predictions. If granularity is None, the exact best
+        threshold is found (sorting scores once). Otherwise, thresholds
+        from min to max score (in steps of granularity) are tried.
     """
+    if granularity is None and len(accs_1.shape) == 1:
+        accs, thresholds, rules = find_thresholds_per_point(
+            accs_1[np.newaxis], accs_2[np.newaxis])
+        if rules[0] == 0:
+            return 0.0, 0, None
+        return accs[0], thresholds[0], int(rules[0])
+    if granularity is None:
+        granularity = DEFAULT_GRANULARITY
+
     if len(accs_1.shape) == 2:
         # TODO: Implement the rest of this variant
         # For now, we will use loss values for the multi-class case
@@ -238,19 +357,22 @@ def find_threshold_acc(accs_1, accs_2, granularity: float = 0.1):
     return best_acc, best_threshold, best_rule
 
 
-def get_threshold_acc(X, Y, threshold, rule=None, get_preds: bool = False):
+def get_threshold_acc(X, Y, threshold, rule=None, get_preds: bool = False,
+                      axis: int = None):
     """
         Get accuracy of predictions using given threshold,
         considering both possible (<= and >=) rules. Also
         return which of the two rules gives a better accuracy.
+        If axis is given (along with rule), accuracies are
+        computed along that axis (e.g. for models of all epochs at once).
     """
 
     p1 = (X >= threshold) == Y
     p2 = (X <= threshold) == Y
     # Rule-1: everything above threshold is 1 class
-    acc_1 = np.mean(p1)
+    acc_1 = np.mean(p1, axis=axis)
     # Rule-2: everything below threshold is 1 class
-    acc_2 = np.mean(p2)
+    acc_2 = np.mean(p2, axis=axis)
     if get_preds:
         if rule == 1:
             return acc_1, p1
@@ -270,37 +392,19 @@ def get_threshold_acc(X, Y, threshold, rule=None, get_preds: bool = False):
     return acc_2, 2
 
 
-def get_threshold_acc_multi(X1, X2, threshold, multi2: int, rule=None):
+def get_threshold_acc_multi(X1, X2, threshold, multi2: int, rule=None,
+                            rng: np.random.Generator = None):
     l1 = X1.shape[0]
     l2 = X2.shape[0]
-    Y1 = np.zeros(l1)
-    Y2 = np.ones(l2)
-    X1_use1 = []
-    X2_use1 = []
-    X1_use2 = []
-    X2_use2 = []
-    # For first set of models
-    for i in range(l1):
-        # For random sample of models
-        x = X1[np.random.permutation(l1)[:multi2]]
-        # Try both classification rules
-        X1_use1.append(np.mean(x >= threshold) >= 0.5)
-        X1_use2.append(np.mean(x <= threshold) >= 0.5)
-    # For second set of models
-    for i in range(l2):
-        # For random sample of models
-        x = X2[np.random.permutation(l2)[:multi2]]
-        # Try both classification rules
-        X2_use1.append(np.mean(x >= threshold) >= 0.5)
-        X2_use2.append(np.mean(x <= threshold) >= 0.5)
-    Y = np.concatenate((Y1, Y2))
-    X1_use1 = np.array(X1_use1)
-    X1_use2 = np.array(X1_use2)
-    X2_use1 = np.array(X2_use1)
-    X2_use2 = np.array(X2_use2)
-    # Concatenate predictions from both sets of models
-    M1 = np.concatenate((X1_use1, X2_use1))
-    M2 = np.concatenate((X1_use2, X2_use2))
+    Y = np.concatenate((np.zeros(l1), np.ones(l2)))
+    # Random sample of models, for each model
+    sampling_1 = sample_model_subsets(l1, l1, multi2, rng)
+    sampling_2 = sample_model_subsets(l2, l2, multi2, rng)
+    # Try both classification rules
+    M1 = np.concatenate((np.mean((X1 >= threshold)[sampling_1], 1) >= 0.5,
+                         np.mean((X2 >= threshold)[sampling_2], 1) >= 0.5))
+    M2 = np.concatenate((np.mean((X1 <= threshold)[sampling_1], 1) >= 0.5,
+                         np.mean((X2 <= threshold)[sampling_2], 1) >= 0.5))
     # Rule-1: everything above threshold is 1 class
     acc_1 = np.mean(M1 == Y)
     # Rule-2: everything below threshold is 1 class
@@ -319,27 +423,32 @@ def get_threshold_acc_multi(X1, X2, threshold, multi2: int, rule=None):
 
 
 def find_threshold_pred(pred_1, pred_2,
-                        granularity: float = 0.005,
+                        granularity: float = None,
                         verbose: bool = True):
     """
         Find thresholds and rules for differentiating between two
-        sets of predictions.
+        sets of predictions. If granularity is None, exact thresholds
+        for all points are found together (see find_thresholds_per_point).
     """
     if pred_1.shape[0] != pred_2.shape[0]:
         raise ValueError('Dimension Mismatch')
-    thres, rules = [], []
-    iterator = range(pred_1.shape[0])
-    if verbose:
-        iterator = tqdm(iterator)
-    for i in tqdm(iterator):
-        _, t, r = find_threshold_acc(pred_1[i], pred_2[i], granularity)
-        while r is None:
-            granularity /= 10
+    if granularity is None and len(pred_1.shape) == 2:
+        _, thres, rules = find_thresholds_per_point(pred_1, pred_2)
+        rules = rules - 1
+    else:
+        thres, rules = [], []
+        iterator = range(pred_1.shape[0])
+        if verbose:
+            iterator = tqdm(iterator)
+        for i in iterator:
             _, t, r = find_threshold_acc(pred_1[i], pred_2[i], granularity)
-        thres.append(t)
-        rules.append(r - 1)
-    thres = np.array(thres)
-    rules = np.array(rules)
+            while r is None:
+                granularity = DEFAULT_GRANULARITY if granularity is None else granularity / 10
+                _, t, r = find_threshold_acc(pred_1[i], pred_2[i], granularity)
+            thres.append(t)
+            rules.append(r - 1)
+        thres = np.array(thres)
+        rules = np.array(rules)
     predictions_combined = np.concatenate((pred_1, pred_2), axis=1)
     ground_truth = np.concatenate(
         (np.zeros(pred_1.shape[1]), np.ones(pred_2.shape[1])))
@@ -371,22 +480,75 @@ def get_threshold_pred(X, Y, threshold, rule,
     if X.shape[0] != threshold.shape[0]:
         raise ValueError('Dimension mismatch between X and threshold: %d and %d should match' % (
             X.shape[0], threshold.shape[0]))
-    res = []
+    # Expected P[distribution=1] for each model, using given data, threshold, rules
+    res = get_threshold_votes(X, threshold, rule, voting=voting)[0]
+    acc, final_threshold = get_votes_acc(res, Y, tune_final_threshold)
 
-    # For each model
-    for i in range(X.shape[1]):
-        # Compute expected P[distribution=1] using given data, threshold, rules
-        if voting:
-            prob = np.average((X[:, i] <= threshold) == rule)
-        else:
-            raw_prob = (X[:, i] - threshold)*((-2*rule)+1)
-            raw_prob -= np.min(raw_prob)
-            raw_prob /= np.max(raw_prob)
-            prob = np.mean(raw_prob)
-        # Store direct average P[distribution=1]
-        res.append(prob)
-    res = np.array(res)
+    # Return predictions, if requested
+    if get_pred:
+        return res, acc, final_threshold
+    return acc, final_threshold
 
+
+def get_threshold_votes(X, threshold, rule,
+                        lengths: List[int] = None,
+                        voting: bool = True):
+    """
+        Expected P[distribution=1] for each model, using given thresholds and
+        rules on the first l datapoints, for each l in lengths (all datapoints
+        if None). All models (and lengths) are handled at once.
+        Args:
+            X: predictions for models on datapoints, shape (n_samples, n_models)
+            threshold: thresholds for prediction rules, shape (n_samples)
+            rule: prediction rules, shape (n_samples)
+            voting: average of per-point votes (otherwise, of distances from
+                    thresholds scaled to [0, 1] per model)
+        Returns array of shape (len(lengths), n_models).
+    """
+    if lengths is None:
+        lengths = [X.shape[0]]
+    lengths = np.asarray(lengths)
+    threshold = np.asarray(threshold)[:, np.newaxis]
+    rule = np.asarray(rule)[:, np.newaxis]
+
+    if voting:
+        # Votes of all points, summed over prefixes of points
+        votes = np.cumsum((X <= threshold) == rule, axis=0)
+        return votes[lengths - 1] / lengths[:, np.newaxis]
+
+    raw_prob = (X - threshold) * ((-2 * rule) + 1)
+    if len(lengths) == 1:
+        raw_prob = raw_prob[:lengths[0]]
+        raw_prob = raw_prob - np.min(raw_prob, 0)
+        raw_prob /= np.max(raw_prob, 0)
+        return np.mean(raw_prob, 0)[np.newaxis]
+    # Mean of (x - min) / (max - min) over each prefix is (mean - min) / (max - min)
+    sums = np.cumsum(raw_prob, axis=0)[lengths - 1]
+    mins = np.minimum.accumulate(raw_prob, axis=0)[lengths - 1]
+    maxs = np.maximum.accumulate(raw_prob, axis=0)[lengths - 1]
+    return (sums / lengths[:, np.newaxis] - mins) / (maxs - mins)
+
+
+def get_threshold_votes_epochwise(Xs, threshold, rule,
+                                  lengths: List[int] = None,
+                                  voting: bool = True):
+    """
+        get_threshold_votes for each of the given arrays of predictions (e.g.
+        of models from different epochs), with models of all arrays handled
+        in one call. Returns list of arrays of shape (len(lengths), n_models).
+    """
+    splits = np.cumsum([X.shape[1] for X in Xs])[:-1]
+    votes = get_threshold_votes(np.concatenate(Xs, axis=1), threshold, rule,
+                                lengths=lengths, voting=voting)
+    return np.split(votes, splits, axis=1)
+
+
+def get_votes_acc(res, Y,
+                  tune_final_threshold: Union[bool, float] = False):
+    """
+        Distinguishing accuracy for given P[distribution=1] of models (see
+        get_threshold_votes) and ground truth. Returns (accuracy, final threshold).
+    """
     # Default threshold value- 0.5
     final_threshold = 0.5
     if type(tune_final_threshold) != bool:
@@ -396,54 +558,39 @@ def get_threshold_pred(X, Y, threshold, rule,
         # Requested generation of threshold
         final_threshold = find_max_acc_threshold(res, Y)
     acc = np.mean((res >= final_threshold) == Y)
-
-    # Return predictions, if requested
-    if get_pred:
-        return res, acc, final_threshold
     return acc, final_threshold
 
 
+def get_votes_on_ratio(votes, classes,
+                       tune_final_threshold: Union[bool, float] = False):
+    """
+        Accuracy (in %), votes and final threshold, for votes of models
+        (on points of a ratio) that are already computed (see get_threshold_votes)
+    """
+    acc, final_thresh = get_votes_acc(votes, classes, tune_final_threshold)
+    return 100 * acc, votes, final_thresh
+
+
 def get_threshold_pred_multi(
         X1, X2, threshold,
         rule, multi2: int,
-        get_pred: bool = False):
+        get_pred: bool = False,
+        rng: np.random.Generator = None):
     # X Shape: (n_samples, n_models)
     # Y Shape: (n_models)
     # threshold shape: (n_samples)
-    res = []
     l1 = X1.shape[1]
     l2 = X2.shape[1]
     Y1 = np.zeros(l1)
     Y2 = np.ones(l2)
-    res1 = []
-    res2 = []
-    r1 = []
-    r2 = []
-    # For each model
-    for i in range(X1.shape[1]):
-        # Compute expected P[distribution=1] using given data, threshold, rules
-        prob = np.average((X1[:, i] <= threshold) == rule)
-
-        # If majority (>0.5) points indicate some distribution,
-        # it must be that one indeed
-        res1.append(prob >= 0.5)
-    for i in range(X2.shape[1]):
-        # Compute expected P[distribution=1] using given data, threshold, rules
-        prob = np.average((X2[:, i] <= threshold) == rule)
-
-        # If majority (>0.5) points indicate some distribution,
-        # it must be that one indeed
-        res2.append(prob >= 0.5)
-    res1 = np.array(res1)
-    res2 = np.array(res2)
-    for i in range(l1):
-        x = res1[np.random.permutation(l1)[:multi2]]
-        r1.append(np.mean(x) >= 0.5)
-    for i in range(l1):
-        x = res2[np.random.permutation(l2)[:multi2]]
-        r2.append(np.mean(x) >= 0.5)
-    r1 = np.array(r1)
-    r2 = np.array(r2)
+    # Compute expected P[distribution=1] for each model using given data, threshold, rules
+    # If majority (>0.5) points indicate some distribution,
+    # it must be that one indeed
+    res1 = get_threshold_votes(X1, threshold, rule)[0] >= 0.5
+    res2 = get_threshold_votes(X2, threshold, rule)[0] >= 0.5
+    # Majority vote over random sample of models, for each model
+    r1 = np.mean(res1[sample_model_subsets(l1, l1, multi2, rng)], 1) >= 0.5
+    r2 = np.mean(res2[sample_model_subsets(l2, l2, multi2, rng)], 1) >= 0.5
     acc = (np.mean(r1 == Y1)+np.mean(r2 == Y2))/2
     res = np.concatenate((r1, r2))
     # Return predictions, if requested
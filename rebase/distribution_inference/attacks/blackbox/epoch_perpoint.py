@@ -2,7 +2,7 @@ import numpy as np
 import torch as ch
 from typing import List, Tuple, Callable, Union
 
-from distribution_inference.attacks.blackbox.core import Attack, find_threshold_pred, get_threshold_pred, epoch_order_p, PredictionsOnOneDistribution, PredictionsOnDistributions, multi_model_sampling, get_threshold_pred_multi
+from distribution_inference.attacks.blackbox.core import Attack, find_threshold_pred, get_threshold_pred, get_threshold_votes, get_threshold_votes_epochwise, get_votes_on_ratio, epoch_order_p, PredictionsOnOneDistribution, PredictionsOnDistributions, multi_model_sampling, get_threshold_pred_multi
 from distribution_inference.config import BlackBoxAttackConfig
 DUMPING = 10
 
@@ -55,14 +55,16 @@ class Epoch_Perpoint(Attack):
             pv1,
             self.config,
             order=o1,
-            ground_truth=ground_truth[0])
+            ground_truth=ground_truth[0],
+            rng=self.rng)
         # Get data for second distribution
         adv_accs_2, adv_preds_2, victim_accs_2, victim_preds_2, final_thresholds_2, classes_use = perpoint_threshold_test_per_dist(
             p2,
             pv2,
             self.config,
             order=o2,
-            ground_truth=ground_truth[1])
+            ground_truth=ground_truth[1],
+            rng=self.rng)
 
         # Get best adv accuracies for both distributions and compare
         chosen_distribution = 0
@@ -103,7 +105,8 @@ def _perpoint_threshold_on_ratio(
         preds_1, preds_2, classes,
         threshold, rule,
         multi2: int = 0,
-        tune_final_threshold: Union[bool, float] = False):
+        tune_final_threshold: Union[bool, float] = False,
+        rng: np.random.Generator = None):
     """
         Run perpoint threshold test (confidence)
         for a given "quartile" ratio
@@ -116,7 +119,7 @@ def _perpoint_threshold_on_ratio(
 
         preds, acc = get_threshold_pred_multi(
             preds_1, preds_2, threshold, rule, get_pred=True,
-            multi2=multi2)
+            multi2=multi2, rng=rng)
         final_thresh = None
     else:
         # Combine predictions into one vector
@@ -136,7 +139,8 @@ def perpoint_threshold_test_per_dist(
         config: BlackBoxAttackConfig,
         epochwise_version: bool = False,
         ground_truth: Tuple[List, List] = None,
-        order=None):
+        order=None,
+        rng: np.random.Generator = None):
     """
         Compute thresholds (based on probabilities) for each given datapoint,
         search for thresholds using given adv model's predictions.
@@ -193,8 +197,8 @@ def perpoint_threshold_test_per_dist(
             pv2 = np.transpose(pv2, transpose_order)[order]
             
         if config.multi:
-            pv1 = multi_model_sampling(pv1, config.multi)
-            pv2 = multi_model_sampling(pv2, config.multi)
+            pv1 = multi_model_sampling(pv1, config.multi, rng)
+            pv2 = multi_model_sampling(pv2, config.multi, rng)
     
     if config.multi_class:
         # If multi-class, replace predictions with loss values
@@ -217,10 +221,27 @@ def perpoint_threshold_test_per_dist(
             classes_victim = np.concatenate(
                 (np.zeros(pv1.shape[1]), np.ones(pv2.shape[1])))
 
+    # Votes of models for all ratios are computed together
+    # (unless sampling of models is needed)
+    lengths = [int(ratio * p1.shape[0]) for ratio in config.ratios]
+    all_ratios = not config.multi2
+    if all_ratios:
+        adv_votes = get_threshold_votes(np.concatenate((p1, p2), axis=1),
+                                        thres, rs, lengths=lengths)
+        if victim_preds_present:
+            if epochwise_version:
+                # Models of all epochs are handled together
+                victim_votes = get_threshold_votes_epochwise(
+                    [np.concatenate((x, y), axis=1) for (x, y) in zip(pv1, pv2)],
+                    thres, rs, lengths=lengths)
+            else:
+                victim_votes = get_threshold_votes(np.concatenate((pv1, pv2), axis=1),
+                                                   thres, rs, lengths=lengths)
+
     adv_accs, victim_accs, victim_preds, adv_preds, adv_final_thress = [], [], [], [], []
-    for ratio in config.ratios:
+    for i, ratio in enumerate(config.ratios):
         # Get first <ratio> percentile of points
-        leng = int(ratio * p1.shape[0])
+        leng = lengths[i]
         p1_use, p2_use = p1[:leng], p2[:leng]
         thres_use, rs_use = thres[:leng], rs[:leng]
         if victim_preds_present:
@@ -231,9 +252,14 @@ def perpoint_threshold_test_per_dist(
                 pv1_use, pv2_use = pv1[:leng], pv2[:leng]
 
         # Compute accuracy for given data size on adversary's models
-        adv_acc, adv_pred, adv_final_thres = _perpoint_threshold_on_ratio(
-            p1_use, p2_use, classes_adv, thres_use, rs_use,
-            tune_final_threshold=config.tune_final_threshold,)
+        if all_ratios:
+            adv_acc, adv_pred, adv_final_thres = get_votes_on_ratio(
+                adv_votes[i], classes_adv,
+                tune_final_threshold=config.tune_final_threshold)
+        else:
+            adv_acc, adv_pred, adv_final_thres = _perpoint_threshold_on_ratio(
+                p1_use, p2_use, classes_adv, thres_use, rs_use,
+                tune_final_threshold=config.tune_final_threshold,)
         if not config.tune_final_threshold:
             adv_final_thres = config.tune_final_threshold
         adv_accs.append(adv_acc)
@@ -241,17 +267,26 @@ def perpoint_threshold_test_per_dist(
             # Compute accuracy for given data size on victim's models
             if epochwise_version:
                 victim_acc, victim_pred = [], []
-                for (x, y, c) in zip(pv1_use, pv2_use, classes_victim):
-                    acc, pred, _ = _perpoint_threshold_on_ratio(
-                        x, y, c, thres_use, rs_use,
-                        config.multi2,
-                        tune_final_threshold=adv_final_thres)
+                for j, (x, y, c) in enumerate(zip(pv1_use, pv2_use, classes_victim)):
+                    if all_ratios:
+                        acc, pred, _ = get_votes_on_ratio(
+                            victim_votes[j][i], c,
+                            tune_final_threshold=adv_final_thres)
+                    else:
+                        acc, pred, _ = _perpoint_threshold_on_ratio(
+                            x, y, c, thres_use, rs_use,
+                            config.multi2,
+                            tune_final_threshold=adv_final_thres, rng=rng)
                     victim_acc.append(acc)
                     victim_pred.append(pred)
+            elif all_ratios:
+                victim_acc, victim_pred, _ = get_votes_on_ratio(
+                    victim_votes[i], classes_victim,
+                    tune_final_threshold=adv_final_thres)
             else:
                 victim_acc, victim_pred, _ = _perpoint_threshold_on_ratio(
                     pv1_use, pv2_use, classes_victim, thres_use, rs_use,
-                    config.multi2, tune_final_threshold=adv_final_thres)
+                    config.multi2, tune_final_threshold=adv_final_thres, rng=rng)
             victim_accs.append(victim_acc)
             # Keep track of predictions on victim's models
         victim_preds.append(victim_pred)
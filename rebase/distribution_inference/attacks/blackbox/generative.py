@@ -6,6 +6,7 @@ from distribution_inference.attacks.blackbox.core import PredictionsOnDistributi
 from distribution_inference.config.core import GenerativeAttackConfig
 from torch.utils.data import Dataset
 from distribution_inference.attacks.blackbox.per_point import PerPointThresholdAttack
+from distribution_inference.device import to_device, empty_cache
 def get_differences(models, x_use, latent_focus, reduce=True):
     # View resulting activation distribution for current models
     reprs = ch.stack([m(x_use, latent=latent_focus).detach()
@@ -23,7 +24,7 @@ def ordered_samples(models_0, models_1, loader, latent_focus,n_samples):
     for tup in loader:
         x = tup[0]
         inputs.append(x)
-        x = x.cuda()
+        x = to_device(x)
         reprs_0 = get_differences(models_0, x, latent_focus, reduce=False)
         reprs_1 = get_differences(models_1, x, latent_focus, reduce=False)
         diffs_0.append(reprs_0)
@@ -38,7 +39,7 @@ def ordered_samples(models_0, models_1, loader, latent_focus,n_samples):
     # Pick examples with maximum difference
     diff_ids = np.argsort(-np.abs(diffs))[:n_samples]
     print("Best samples had differences", diffs[diff_ids])
-    return inputs[diff_ids].cuda()
+    return to_device(inputs[diff_ids])
 
 
 
@@ -53,9 +54,9 @@ def gen_optimal(m1,m2, sample_shape, n_samples,
     
     
     if use_normal is None:
-        x_rand_data = ch.rand(*((n_samples,) + sample_shape)).cuda()
+        x_rand_data = to_device(ch.rand(*((n_samples,) + sample_shape)))
     else:
-        x_rand_data = use_normal.clone().cuda()
+        x_rand_data = to_device(use_normal.clone())
 
     x_rand_data_start = x_rand_data.clone().detach()
     
@@ -136,7 +137,7 @@ def generate_data(X_train_1, X_train_2, ds, batch_size:int, config:GenerativeAtt
         normal_data = next(iter(test_loader))[0]
     else:
         _, test_loader = ds.get_loaders(100,shuffle=True)
-        normal_data = next(iter(test_loader))[0].cuda()
+        normal_data = to_device(next(iter(test_loader))[0])
     shape=normal_data[0].shape
     
     if config.start_natural:
@@ -156,8 +157,8 @@ def generate_data(X_train_1, X_train_2, ds, batch_size:int, config:GenerativeAtt
                 shape, 1,
                 config.steps, config.step_size,
                 config.latent_focus,
-                use_normal=normal_data[i:i +
-                                       1].cuda() if (config.use_normal or config.start_natural) else None,
+                use_normal=to_device(normal_data[i:i +
+                                       1]) if (config.use_normal or config.start_natural) else None,
                 constrained=config.constrained,
                 model_ratio=config.model_ratio,
                 clamp=config.clamp)
@@ -197,16 +198,16 @@ class GenerativeAttack(Attack):
         assert not multi_class
         ps = []
         for model in tqdm(m):
-            model = model.cuda()
+            model = to_device(model)
         # Make sure model is in evaluation mode
             model.eval()
-            ch.cuda.empty_cache()
+            empty_cache()
             with ch.no_grad():
-                ps.append(model(x.cuda()).detach()[:, 0])
+                ps.append(model(to_device(x)).detach()[:, 0])
             model = model.cpu()
             del model
             gc.collect()
-            ch.cuda.empty_cache()
+            empty_cache()
         ps = ch.stack(ps, 0).to(ch.device('cpu')).numpy()
         
         return ps
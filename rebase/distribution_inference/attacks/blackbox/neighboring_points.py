@@ -1,43 +1,54 @@
 import numpy as np
 from typing import Tuple
 from typing import List
-import gc
 from distribution_inference.attacks.blackbox.core import PredictionsOnOneDistribution, PredictionsOnOneDistribution
-from torch.distributions import normal
 import torch as ch
 import torch.nn as nn
-from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 from distribution_inference.datasets.base import CustomDatasetWrapper
 from distribution_inference.attacks.blackbox.utils import get_preds
+from distribution_inference.device import to_device, empty_cache, free_memory
 
 
-class AddGaussianNoise():
-    def __init__(self, mean=0., std=0.1):
-        self.std = std
-        self.mean = mean
-        self.dist = normal.Normal(mean, std)
-
-    def __call__(self, tensor):
-        return tensor + self.dist.sample(tensor.shape).to(tensor.device)
-
-    def __repr__(self):
-        return self.__class__.__name__ + '(mean={0}, std={1})'.format(self.mean, self.std)
-
-
-class neighborDataset(Dataset):
-    def __init__(self, num_neighbors, original, transform):
+class GaussianNeighbors:
+    def __init__(self, num_neighbors: int,
+                 mean: float = 0.,
+                 std: float = 0.1,
+                 rng: np.random.Generator = None):
+        """
+            Noisy copies (neighbors) of batches of data, of shape
+            (num_neighbors, batch, ...), generated with one RNG call
+            into a buffer that is re-used across batches (and models).
+            Every call draws new noise (so each model is evaluated on its
+            own neighbors), from a generator seeded from rng.
+        """
         self.num_neighbors = num_neighbors
-        self.X = []
-        for _ in range(num_neighbors):
-            self.X.append(transform(original))
-        self.X = ch.cat(self.X, 0)
+        self.mean = mean
+        self.std = std
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+        self.buffer = None
+        self.generator = None
 
-    def __getitem__(self, index):
-        return self.X[index]
+    def _allocate(self, data_points: ch.Tensor):
+        shape = (self.num_neighbors,) + tuple(data_points.shape)
+        if self.buffer is None or self.buffer.device != data_points.device or \
+                self.buffer.dtype != data_points.dtype or \
+                self.buffer.shape[2:] != shape[2:] or self.buffer.shape[1] < shape[1]:
+            self.buffer = ch.empty(shape, dtype=data_points.dtype,
+                                   device=data_points.device)
+        if self.generator is None or self.generator.device != data_points.device:
+            self.generator = ch.Generator(device=data_points.device)
+            self.generator.manual_seed(int(self.rng.integers(2 ** 63)))
 
-    def __len__(self):
-        return self.X.shape[0]
+    def __call__(self, data_points: ch.Tensor) -> ch.Tensor:
+        self._allocate(data_points)
+        # View into buffer (last batch can be smaller)
+        neighbors = self.buffer[:, :len(data_points)]
+        neighbors.normal_(self.mean, self.std, generator=self.generator)
+        neighbors.add_(data_points)
+        return neighbors
 
 
 def get_estimate(loader, models: List[nn.Module],
@@ -47,11 +58,19 @@ def get_estimate(loader, models: List[nn.Module],
                  not_using_logits: bool = False,
                  num_neighbor: int = 10,
                  mean: float = 0.0,
-                 std: float = 0.1):
+                 std: float = 0.1,
+                 preload: bool = False,
+                 rng: np.random.Generator = None):
+    """
+        Fraction of Gaussian-noise neighbors of each data point that each
+        model classifies as positive. Each model sees its own (independently
+        drawn) neighbors, generated from rng (random if not given).
+    """
     assert not models[0].is_graph_model, "No support for graph model"
-    noise = AddGaussianNoise(mean, std)
+    neighbor_generator = GaussianNeighbors(num_neighbor, mean, std, rng=rng)
     predictions = []
     ground_truth = []
+    inputs = []
     thre = 0.5 if not_using_logits else 0
     # Accumulate all data for given loader
     for data in loader:
@@ -60,56 +79,56 @@ def get_estimate(loader, models: List[nn.Module],
         else:
             features, labels, _ = data
         ground_truth.append(labels.cpu().numpy())
+        if preload:
+            inputs.append(to_device(features))
     ground_truth = np.concatenate(ground_truth, axis=0)
 
+    def batches():
+        if preload:
+            yield from inputs
+        else:
+            for data in loader:
+                yield to_device(data[0])
+
     # Get predictions for each model
     iterator = models
     if verbose:
         iterator = tqdm(iterator, desc="Generating Predictions")
     for model in iterator:
-        # Shift model to GPU
-        model = model.cuda()
+        # Shift model to device
+        model = to_device(model)
         # Make sure model is in evaluation mode
         model.eval()
         # Clear GPU cache
-        ch.cuda.empty_cache()
+        empty_cache()
 
         with ch.no_grad():
             predictions_on_model = []
 
-            for data in loader:
-                data_points, labels, _ = data
-                data_points = data_points.cuda()
-                # Infer batch size
-                batch_size_desired = len(data_points)
-                
-                # Create new loader that adds noise to data
-                new_loader = DataLoader(dataset=neighborDataset(
-                    num_neighbor, data_points, noise),
-                    batch_size=batch_size_desired)
-                p_collected = []
-                for neighbor in new_loader:
+            for data_points in batches():
+                # Neighbors (noisy copies) of data, one batch per neighbor
+                neighbors = neighbor_generator(data_points)
+                n_positive = None
+                for neighbor in neighbors:
                     # Get prediction
                     if latent != None:
-                        prediction = model(
-                                neighbor, latent=latent).detach()
+                        prediction = model(neighbor, latent=latent).detach()
                     else:
                         prediction = model(neighbor).detach()
                         if not multi_class:
                             prediction = prediction[:, 0]
-                    p_collected.append(1. * (prediction.cpu().numpy() >= thre))
-                # Tile predictions and average over appropriate means
-                p_collected = np.array(p_collected).flatten().reshape(num_neighbor, -1)
-                predictions_on_model.append(np.mean(p_collected, 0))
+                    positive = (prediction >= thre).float()
+                    n_positive = positive if n_positive is None else n_positive + positive
+                # Average over neighbors
+                predictions_on_model.append(
+                    n_positive.reshape(-1).cpu().numpy().astype(np.float64) / num_neighbor)
         predictions.append(np.concatenate(predictions_on_model, 0))
         # Shift model back to CPU
         model = model.cpu()
         del model
-        gc.collect()
-        ch.cuda.empty_cache()
+        free_memory()
     predictions = np.stack(predictions, 0)
-    gc.collect()
-    ch.cuda.empty_cache()
+    free_memory()
 
     return predictions, ground_truth
 
@@ -123,7 +142,8 @@ def _get_preds_for_vic_and_adv(
         neighbors: int,
         epochwise_version: bool = False,
         preload: bool = False,
-        multi_class: bool = False,):
+        multi_class: bool = False,
+        rng: np.random.Generator = None):
 
     # Sklearn models do not support logits- take care of that
     use_prob_adv = models_adv[0].is_sklearn_model
@@ -168,7 +188,8 @@ def _get_preds_for_vic_and_adv(
                 verbose=False, multi_class=multi_class,
                 not_using_logits=use_prob_vic,
                 num_neighbor=neighbors,
-                mean = mean, std=std)
+                mean = mean, std=std,
+                preload=preload, rng=rng)
 
             # In epoch-wise mode, we need prediction results
             # across epochs, not models
@@ -179,7 +200,8 @@ def _get_preds_for_vic_and_adv(
             multi_class=multi_class,
             not_using_logits=use_prob_vic,
             num_neighbor=neighbors,
-            mean = mean, std=std)
+            mean = mean, std=std,
+            preload=preload, rng=rng)
     assert np.all(ground_truth ==
                   ground_truth_repeat), "Val loader is shuffling data!"
     return preds_vic, preds_adv, ground_truth, not_using_logits
@@ -196,7 +218,8 @@ def get_vic_adv_preds_on_distr(
         epochwise_version: bool = False,
         preload: bool = False,
         multi_class: bool = False,
-        make_processed_version: bool = False):
+        make_processed_version: bool = False,
+        rng: np.random.Generator = None):
 
     # Check if models are graph-related
     are_graph_models = False
@@ -238,7 +261,8 @@ def get_vic_adv_preds_on_distr(
         neighbors = neighbors,
         epochwise_version=epochwise_version,
         preload=preload,
-        multi_class=multi_class)
+        multi_class=multi_class,
+        rng=rng)
     # Get predictions for second set of models
     preds_vic_2, preds_adv_2, _, _ = _get_preds_for_vic_and_adv(
         models_vic[1], models_adv[1],
@@ -248,7 +272,8 @@ def get_vic_adv_preds_on_distr(
         neighbors=neighbors,
         epochwise_version=epochwise_version,
         preload=preload,
-        multi_class=multi_class)
+        multi_class=multi_class,
+        rng=rng)
     adv_preds = PredictionsOnOneDistribution(
         preds_property_1=preds_adv_1,
         preds_property_2=preds_adv_2
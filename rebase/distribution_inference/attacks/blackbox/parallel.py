@@ -0,0 +1,235 @@
+"""
+    Collect predictions from many models in parallel (on CPU), by sharding
+    the list of models across worker processes. Workers are started once (per
+    run) and re-used for all calls. Evaluation data lives in shared memory and
+    the output array is a shared file, so each worker reads the data without a
+    copy and writes its predictions in-place. Models of lazy collections are
+    loaded by the workers themselves, from their files.
+"""
+import atexit
+import copy
+import queue
+import traceback
+import numpy as np
+import torch as ch
+import torch.multiprocessing as mp
+from typing import List
+import torch.nn as nn
+
+from distribution_inference.models.utils import StackedMLPEnsemble
+from distribution_inference.training.utils import read_model_file, load_model_contents
+from distribution_inference.attacks.blackbox.buffers import allocate_predictions, share_spec, open_shared
+from distribution_inference.attacks.blackbox.precision import reduce_precision, cast_inputs, to_numpy
+
+
+def _model_output(model, x: ch.Tensor, multi_class: bool, latent: int):
+    if latent is not None:
+        return model(x, latent=latent)
+    prediction = model(x)
+    if not multi_class:
+        prediction = prediction[:, 0]
+    return prediction
+
+
+def _load_shard(models):
+    # Either models themselves, or (template, paths) to load them from
+    if isinstance(models, tuple):
+        template, paths = models
+        loaded = []
+        for path in paths:
+            contents = read_model_file(path, template.is_sklearn_model, on_cpu=True)
+            model = load_model_contents(copy.deepcopy(template), contents)
+            # Train/test ids (if saved with model) are not needed
+            loaded.append(model[0] if type(model) == tuple else model)
+        return loaded
+    return models
+
+
+@ch.no_grad()
+def _predict_shard(models,
+                   start: int,
+                   inputs: ch.Tensor,
+                   output_spec: tuple,
+                   batch_size: int,
+                   multi_class: bool,
+                   latent: int,
+                   ensemble: bool,
+                   precision: str = "fp32"):
+    """
+        Worker: write predictions of models (global indices start onwards)
+        on inputs into shared output array.
+    """
+    models = _load_shard(models)
+    output = open_shared(output_spec)
+    end = start + len(models)
+    inputs = cast_inputs(inputs, precision)
+    if ensemble and StackedMLPEnsemble.supports(models) and precision != "int8":
+        stacked = StackedMLPEnsemble(models)
+        if precision == "bf16":
+            stacked = stacked.to(ch.bfloat16)
+        for i in range(0, len(inputs), batch_size):
+            prediction = stacked(inputs[i:i + batch_size], latent=latent)
+            if latent is None and not multi_class:
+                prediction = prediction[:, :, 0]
+            output[start:end, i:i + batch_size] = to_numpy(prediction)
+    else:
+        for j, model in enumerate(models):
+            model.eval()
+            model = reduce_precision(model, precision)
+            for i in range(0, len(inputs), batch_size):
+                output[start + j, i:i + batch_size] = to_numpy(_model_output(
+                    model, inputs[i:i + batch_size], multi_class, latent))
+    output.flush()
+    del output
+
+
+def _worker_loop(tasks, results, worker_id: int, num_threads: int):
+    ch.set_num_threads(num_threads)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        try:
+            _predict_shard(**task)
+            results.put((worker_id, None))
+        except Exception:
+            results.put((worker_id, traceback.format_exc()))
+
+
+class PredictionWorkerPool:
+    def __init__(self, num_workers: int):
+        """
+            Start num_workers worker processes, with available threads split across them
+        """
+        self.num_workers = num_workers
+        num_threads = max(1, ch.get_num_threads() // num_workers)
+        # Spawn (instead of fork) to not inherit OpenMP state of parent
+        ctx = mp.get_context("spawn")
+        self.results = ctx.Queue()
+        self.tasks, self.workers = [], []
+        for k in range(num_workers):
+            tasks = ctx.Queue()
+            worker = ctx.Process(target=_worker_loop,
+                                 args=(tasks, self.results, k, num_threads),
+                                 daemon=True)
+            worker.start()
+            self.tasks.append(tasks)
+            self.workers.append(worker)
+
+    def is_alive(self) -> bool:
+        return all(w.is_alive() for w in self.workers)
+
+    def run(self, tasks: List[dict]):
+        """
+            Run given tasks (at most one per worker), and wait for all of them
+        """
+        for k, task in enumerate(tasks):
+            self.tasks[k].put(task)
+        errors = []
+        pending = len(tasks)
+        while pending > 0:
+            try:
+                _, error = self.results.get(timeout=1)
+            except queue.Empty:
+                if not self.is_alive():
+                    raise RuntimeError("Worker process died while generating predictions")
+                continue
+            pending -= 1
+            if error is not None:
+                errors.append(error)
+        if len(errors) > 0:
+            raise RuntimeError(
+                f"{len(errors)} worker(s) failed while generating predictions:\n{errors[0]}")
+
+    def close(self):
+        for tasks, worker in zip(self.tasks, self.workers):
+            if worker.is_alive():
+                tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+
+
+# Worker pool (started on first use, re-used for rest of the run)
+_POOL = None
+
+
+def get_worker_pool(num_workers: int) -> PredictionWorkerPool:
+    global _POOL
+    if _POOL is not None and (_POOL.num_workers != num_workers or not _POOL.is_alive()):
+        _POOL.close()
+        _POOL = None
+    if _POOL is None:
+        _POOL = PredictionWorkerPool(num_workers)
+    return _POOL
+
+
+def shutdown_worker_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL = None
+
+
+atexit.register(shutdown_worker_pool)
+
+
+def get_preds_parallel(inputs: ch.Tensor,
+                       models: List[nn.Module],
+                       num_workers: int,
+                       batch_size: int,
+                       multi_class: bool = False,
+                       latent: int = None,
+                       ensemble: bool = False,
+                       precision: str = "fp32",
+                       out: np.ndarray = None) -> np.ndarray:
+    """
+        Get predictions of models (on CPU) on given inputs, splitting
+        models into contiguous shards, one per worker process.
+        Models can be a lazy ModelCollection: workers then load their shard
+        from the model files, instead of models being loaded and sent to them.
+        Returns array of shape (n_models, n_points, ...), same as get_preds.
+        If out is given, predictions are written into it (directly by workers,
+        if it is a shared array from allocate_predictions).
+    """
+    inputs = inputs.cpu().share_memory_()
+    n_models = len(models)
+    pool = get_worker_pool(num_workers)
+    files = models.files() if hasattr(models, "files") else None
+
+    # Infer shape and type of predictions from first model
+    with ch.no_grad():
+        models[0].eval()
+        probe = _model_output(models[0], inputs[:1], multi_class, latent)
+
+    output = out
+    spec = share_spec(out) if out is not None else None
+    if spec is None:
+        # (written in fp32 for reduced-precision models)
+        output = allocate_predictions(
+            (n_models, len(inputs)) + tuple(probe.shape[1:]),
+            to_numpy(probe).dtype, shared=True)
+        spec = share_spec(output)
+
+    tasks = []
+    for shard in np.array_split(np.arange(n_models), min(num_workers, n_models)):
+        if len(shard) == 0:
+            continue
+        start, end = int(shard[0]), int(shard[-1]) + 1
+        if files is not None:
+            shard_models = (models.template, files[start:end])
+        else:
+            shard_models = list(models[start:end])
+        tasks.append(dict(models=shard_models, start=start, inputs=inputs,
+                          output_spec=spec, batch_size=batch_size,
+                          multi_class=multi_class, latent=latent,
+                          ensemble=ensemble, precision=precision))
+    pool.run(tasks)
+
+    if out is not None and output is not out:
+        # Given array is not shared with workers
+        out[:] = output
+        return out
+    return output
@@ -28,14 +28,16 @@ class PerPointChooseAttack(Attack):
             preds_vic.preds_on_distr_1,
             self.config,
             epochwise_version=epochwise_version,
-            ground_truth=ground_truth[0])
+            ground_truth=ground_truth[0],
+            rng=self.rng)
         # Get data for second distribution
         adv_accs_2, adv_preds_2, victim_accs_2, victim_preds_2, rs_2 = perpoint_threshold_test_per_dist(
             preds_adv.preds_on_distr_2,
             preds_vic.preds_on_distr_2,
             self.config,
             epochwise_version=epochwise_version,
-            ground_truth=ground_truth[1])
+            ground_truth=ground_truth[1],
+            rng=self.rng)
 
         # Get best adv accuracies for both distributions and compare
         chosen_distribution = 0
@@ -60,27 +62,31 @@ class PerPointChooseAttack(Attack):
         save_dic = {'victim_preds': victim_preds, 'adv_preds': adv_preds}
         return save_dic
 
-def pair_order(leng:int):
+def pair_order(leng:int, rng: np.random.Generator = None):
     """
-    Get different pairs
+    Get different pairs: 'leng' distinct pairs (i < j) of 'leng' points,
+    sampled as linear indices into triu_indices(leng, k=1) in one call
     """
-    order_set = set()
-    while len(order_set)<leng:
-        order_set.add(frozenset(np.random.choice(leng,size=2,replace=False)))
-    order_set = [np.array(list(x)) for x in order_set]
-    return np.array(order_set)
-
-def order_pairs(p,order):
+    if rng is None:
+        rng = np.random.default_rng()
+    n_pairs = leng * (leng - 1) // 2
+    picked = rng.choice(n_pairs, size=min(leng, n_pairs), replace=False)
+    # Row i of the upper triangle holds pairs (i, i+1), ..., (i, leng-1)
+    row_starts = np.cumsum(np.arange(leng - 1, 0, -1)) - np.arange(leng - 1, 0, -1)
+    first = np.searchsorted(row_starts, picked, side='right') - 1
+    second = picked - row_starts[first] + first + 1
+    return np.stack((first, second), 1)
+
+def pair_comparisons(p,order):
     """
-    Simple wrapper to get a list of pairs
+    Whether value for first point of pair is larger (or equal) than that of
+    the second, shape (n_pairs, n_models)
     """
-    return np.array([p[o] for o in order])
+    return p[order[:, 0]] >= p[order[:, 1]]
 
 def find_rules(p1,p2,order):
-    p1o = order_pairs(p1,order)
-    p2o = order_pairs(p2,order)
-    r1 = np.array([np.average(p[0,:]>=p[1,:])>=0.5 for p in p1o])
-    r2 = np.array([np.average(p[0,:]<p[1,:])>=0.5 for p in p2o])
+    r1 = np.mean(pair_comparisons(p1,order), 1)>=0.5
+    r2 = np.mean(~pair_comparisons(p2,order), 1)>=0.5
     
     #discard points that have same rules for both distributions
     rs = r1==r2
@@ -94,15 +100,10 @@ def find_rules(p1,p2,order):
     return rs, ord,acc,preds
 
 def acc_rule(p1,p2,order,rule):
-    p1 = order_pairs(p1,order)
-    p2 = order_pairs(p2,order)
-    r1 =  np.repeat(np.expand_dims(rule,1),p1.shape[2],axis=1)
-    r2 = np.repeat(np.expand_dims(rule,1),p2.shape[2],axis=1)
-    preds1 =np.array( [p[0,:]>=p[1,:] for p in p1])
-    preds1 =  preds1==r1
+    rule = np.expand_dims(rule,1)
+    preds1 = pair_comparisons(p1,order)==rule
     preds1 = np.average(preds1,axis=0)
-    preds2 =np.array( [p[0,:]<p[1,:] for p in p2])
-    preds2 =  preds2==r2
+    preds2 = (~pair_comparisons(p2,order))==rule
     preds2 = np.average(preds2,axis=0)
     preds = np.hstack((1-preds1,preds2))
     accs = (np.average(preds1)+np.average(preds2))/2
@@ -116,7 +117,8 @@ def perpoint_threshold_test_per_dist(
         preds_victim: PredictionsOnOneDistribution,
         config: BlackBoxAttackConfig,
         epochwise_version: bool = False,
-        ground_truth: Tuple[List, List] = None):
+        ground_truth: Tuple[List, List] = None,
+        rng: np.random.Generator = None):
     """
         Compute the rule (based on probabilities) for each pair of datapoints by adv models.
         Compute accuracy and predictions using given data and predictions
@@ -149,7 +151,9 @@ def perpoint_threshold_test_per_dist(
             pv2 = np_compute_losses(pv2, ground_truth, multi_class=False)
 
     
-    order = np.random.permutation(p1.shape[1])
+    if rng is None:
+        rng = np.random.default_rng()
+    order = rng.permutation(p1.shape[1])
     # Order points according to computed utility
     transpose_order = (1, 0, 2) if config.multi_class else (1, 0)
     p1 = np.transpose(p1, transpose_order)[order][::-1]
@@ -160,8 +164,8 @@ def perpoint_threshold_test_per_dist(
         pv1 = np.transpose(pv1, transpose_order)[order][::-1]
         pv2 = np.transpose(pv2, transpose_order)[order][::-1]
         if config.multi:
-            pv1 = multi_model_sampling(pv1, config.multi)
-            pv2 = multi_model_sampling(pv2, config.multi)
+            pv1 = multi_model_sampling(pv1, config.multi, rng)
+            pv2 = multi_model_sampling(pv2, config.multi, rng)
 
     if config.multi_class:
         # If multi-class, replace predictions with loss values
@@ -204,7 +208,7 @@ def perpoint_threshold_test_per_dist(
             pv1_use = pv1
             pv2_use = pv2
 
-    ord = pair_order(p1.shape[0])
+    ord = pair_order(p1.shape[0], rng)
     rs,ord,adv_acc,adv_preds = find_rules(p1_use,p2_use,ord)
     vic_preds,vic_acc = acc_rule(pv1_use,pv2_use,ord,rs)
     return adv_acc, adv_preds, vic_acc, vic_preds, rs
@@ -0,0 +1,74 @@
+"""
+    Plan prediction work for black-box attacks across property values and trials.
+    Each (model set, evaluation data) pair is a prediction block: blocks shared
+    by several (property value, trial) combinations (like victim models on
+    evaluation data that is re-used across trials) are computed only once.
+    Blocks can only be shared if evaluation data is re-used across trials:
+    dataset wrappers sample new evaluation data on every get_loaders() call,
+    so without reuse_data_across_trials, every block is unique.
+"""
+from collections import Counter
+from typing import Callable, List, Tuple
+
+
+class PredictionPlanner:
+    def __init__(self,
+                 values: List,
+                 tries: int,
+                 reuse_data: bool = False):
+        """
+            values: property values experimented with
+            tries: number of trials per property value
+            reuse_data: whether the same evaluation data is used across trials
+                (if not, every block is unique and nothing is shared)
+        """
+        self.reuse_data = reuse_data
+        self.blocks = {}
+        # Number of times each block will be asked for
+        self.uses = Counter()
+        for prop_value in values:
+            for trial in range(tries):
+                for distr in [1, 2]:
+                    data_key = self.data_key(distr, prop_value, trial)
+                    for models_key in self.models_keys(prop_value, trial):
+                        self.uses[(models_key, data_key)] += 1
+        self.n_requests = sum(self.uses.values())
+
+    def data_key(self, distr: int, prop_value, trial: int) -> Tuple:
+        """
+            Identifier for evaluation data from distribution 1 (fixed)
+            or 2 (for given property value), for given trial
+        """
+        if not self.reuse_data:
+            return (distr, prop_value, trial)
+        if distr == 1:
+            return (distr,)
+        return (distr, prop_value)
+
+    @staticmethod
+    def models_keys(prop_value, trial: int) -> Tuple:
+        """
+            Identifiers for (victim 1, victim 2, adversary 1, adversary 2) models.
+            Victim models for the first distribution are the same across
+            property values, and victim models do not change across trials.
+        """
+        return (("vic", 1),
+                ("vic", 2, prop_value),
+                ("adv", 1, prop_value, trial),
+                ("adv", 2, prop_value, trial))
+
+    def n_unique(self) -> int:
+        return len(self.uses)
+
+    def get(self, block_key: Tuple, compute: Callable):
+        """
+            Get prediction block (computing it only if not already available).
+            Blocks are released once all planned uses have been served.
+        """
+        if block_key not in self.blocks:
+            self.blocks[block_key] = compute()
+        block = self.blocks[block_key]
+        self.uses[block_key] -= 1
+        if self.uses[block_key] <= 0:
+            del self.blocks[block_key]
+        return block
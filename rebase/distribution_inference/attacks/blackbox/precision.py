@@ -0,0 +1,101 @@
+"""
+    Reduced-precision inference for prediction collection: models run in
+    bfloat16, or with dynamically int8-quantized Linear layers (CPU only).
+    Predictions are cast back to float32 when written to output arrays.
+"""
+import copy
+import warnings
+import torch as ch
+import torch.nn as nn
+import numpy as np
+from typing import List
+
+from distribution_inference.utils import warning_string
+from distribution_inference.device import get_execution_context
+
+
+PRECISIONS = ["fp32", "bf16", "int8"]
+
+
+def resolve_precision(precision: str, models: List[nn.Module]) -> str:
+    """
+        Precision to actually use for given models (on current device)
+    """
+    if precision is None:
+        return "fp32"
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precision {precision} not supported. Choose from {PRECISIONS}")
+    if precision == "fp32":
+        return precision
+    if models[0].is_sklearn_model:
+        # Not torch models
+        return "fp32"
+    if precision == "int8" and get_execution_context().is_cuda:
+        warnings.warn(warning_string(
+            "\nint8 inference is only supported on CPU, using fp32"))
+        return "fp32"
+    return precision
+
+
+def reduce_precision(model: nn.Module, precision: str) -> nn.Module:
+    """
+        Version of model to run in given precision.
+        Model itself is left unchanged (a copy is returned if precision is not fp32).
+    """
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        return copy.deepcopy(model).to(ch.bfloat16)
+    if precision == "int8":
+        return ch.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=ch.qint8)
+    raise ValueError(f"Precision {precision} not supported")
+
+
+def cast_inputs(x: ch.Tensor, precision: str) -> ch.Tensor:
+    """
+        Cast (floating-point) inputs to match model precision
+    """
+    if precision == "bf16" and x.is_floating_point():
+        return x.to(ch.bfloat16)
+    return x
+
+
+def to_numpy(prediction: ch.Tensor) -> np.ndarray:
+    """
+        Predictions as numpy array (reduced-precision outputs cast back to float32)
+    """
+    if prediction.dtype in [ch.bfloat16, ch.float16]:
+        prediction = prediction.float()
+    return prediction.cpu().numpy()
+
+
+class PrecisionCheck:
+    """
+        Check of reduced-precision predictions against fp32 predictions, done
+        once per run: on the first n_models victim and adversary models (the
+        first time predictions are collected for each), reported together.
+    """
+    ROLES = ["victim", "adversary"]
+
+    def __init__(self, n_models: int):
+        self.n_models = n_models
+        self.deviations = {}
+        self.reported = False
+
+    def pending(self, role: str) -> bool:
+        return self.n_models > 0 and role not in self.deviations
+
+    def record(self, role: str, deviation: dict):
+        self.deviations[role] = deviation
+        if all(r in self.deviations for r in self.ROLES):
+            self.report()
+
+    def report(self):
+        """
+            Print deviations (if any were recorded, and not printed already)
+        """
+        if self.reported or len(self.deviations) == 0:
+            return
+        print("Reduced-precision check on %d models: %s" % (self.n_models, self.deviations))
+        self.reported = True
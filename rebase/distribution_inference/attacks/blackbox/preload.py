@@ -0,0 +1,55 @@
+"""
+    Evaluation data materialized in memory, so that it is read (and decoded)
+    only once and then re-used by all prediction passes over it.
+"""
+import torch as ch
+import numpy as np
+
+from distribution_inference.device import get_execution_context
+
+
+class PreloadedLoader:
+    def __init__(self, loader, pin_memory: bool = None):
+        """
+            loader: data loader to materialize (walked exactly once)
+            pin_memory: keep data in page-locked memory for faster copies to GPU
+                (defaults to True when running on CUDA)
+        """
+        features, labels, extras = [], [], []
+        self.with_extras = None
+        for data in loader:
+            if len(data) == 2:
+                x, y = data
+                e = None
+            else:
+                x, y, e = data
+            if self.with_extras is None:
+                self.with_extras = e is not None
+            features.append(x)
+            labels.append(y)
+            if self.with_extras:
+                extras.append(ch.as_tensor(e))
+
+        self.features = ch.cat(features, 0)
+        self.labels = ch.cat(labels, 0)
+        self.extras = ch.cat(extras, 0) if self.with_extras else None
+        self.batch_size = loader.batch_size
+
+        if pin_memory is None:
+            pin_memory = get_execution_context().is_cuda
+        if pin_memory:
+            self.features = self.features.pin_memory()
+
+    def __len__(self):
+        return int(np.ceil(len(self.features) / self.batch_size))
+
+    def __iter__(self):
+        for i in range(0, len(self.features), self.batch_size):
+            batch = (self.features[i:i + self.batch_size],
+                     self.labels[i:i + self.batch_size])
+            if self.with_extras:
+                batch += (self.extras[i:i + self.batch_size],)
+            yield batch
+
+    def get_ground_truth(self) -> np.ndarray:
+        return self.labels.cpu().numpy()
@@ -2,7 +2,7 @@ import numpy as np
 from typing import Tuple
 from typing import List, Callable
 
-from distribution_inference.attacks.blackbox.core import Attack, threshold_test_per_dist, PredictionsOnDistributions
+from distribution_inference.attacks.blackbox.core import Attack, threshold_test_per_dist, sample_model_subsets, PredictionsOnDistributions
 
 
 class LossAndThresholdAttack(Attack):
@@ -30,7 +30,8 @@ class LossAndThresholdAttack(Attack):
             preds_vic.preds_on_distr_1,
             ground_truth[0],
             self.config,
-            epochwise_version=epochwise_version)
+            epochwise_version=epochwise_version,
+            rng=self.rng)
         # Get accuracies on second data distribution
         adv_accs_2, victim_accs_2, acc_2 = threshold_test_per_dist(
             calc_acc,
@@ -38,7 +39,8 @@ class LossAndThresholdAttack(Attack):
             preds_vic.preds_on_distr_2,
             ground_truth[1],
             self.config,
-            epochwise_version=epochwise_version)
+            epochwise_version=epochwise_version,
+            rng=self.rng)
 
         # Get best adv accuracies for both distributions, across all ratios
         chosen_distribution = 0
@@ -57,15 +59,9 @@ class LossAndThresholdAttack(Attack):
             victim_acc_use = victim_accs_use[chosen_ratio_index]
         # Loss test
         if epochwise_version:
-            basic = []
-            for i in range(acc_1[0].shape[0]):
-                basic.append(
-                    self._loss_test(
-                        (acc_1[0][i], acc_1[1][i]),
-                        (acc_2[0][i], acc_2[1][i])
-                    )
-                )
-            basic_chosen = [x[chosen_ratio_index] for x in basic]
+            # Accuracies have a leading epoch axis: all epochs at once
+            basic = self._loss_test(acc_1, acc_2)
+            basic_chosen = list(basic[chosen_ratio_index])
         else:
             if self.config.multi2:
                 basic = self._loss_multi(acc_1, acc_2)
@@ -79,24 +75,21 @@ class LossAndThresholdAttack(Attack):
     def _loss_test(self, acc_1, acc_2):
         basic = []
         for r in range(len(self.config.ratios)):
-            preds_1 = (acc_1[0][r, :] > acc_2[0][r, :])
-            preds_2 = (acc_1[1][r, :] <= acc_2[1][r, :])
-            basic.append(100*(np.mean(preds_1) + np.mean(preds_2)) / 2)
+            preds_1 = (acc_1[0][..., r, :] > acc_2[0][..., r, :])
+            preds_2 = (acc_1[1][..., r, :] <= acc_2[1][..., r, :])
+            basic.append(100*(np.mean(preds_1, -1) + np.mean(preds_2, -1)) / 2)
         return basic
 
     def _loss_multi(self, acc_1, acc_2):
         basic = []
         l = acc_1[0].shape[1]
         for r in range(len(self.config.ratios)):
-            preds_1 = []
-            preds_2 = []
-            for i in range(l):
-                # Pick 'multi2' random samples
-                sampling = np.random.permutation(l)[:self.config.multi2]
-                # Equivalent to majority voting on each model's prediction
-                preds_1.append(
-                    np.mean(acc_1[0][r, sampling] > acc_2[0][r, sampling]) >= 0.5)
-                preds_2.append(
-                    np.mean(acc_1[1][r, sampling] <= acc_2[1][r, sampling]) >= 0.5)
+            # Pick 'multi2' random samples, for each model
+            sampling = sample_model_subsets(l, l, self.config.multi2, self.rng)
+            # Equivalent to majority voting on each model's prediction
+            preds_1 = np.mean(
+                (acc_1[0][r] > acc_2[0][r])[sampling], 1) >= 0.5
+            preds_2 = np.mean(
+                (acc_1[1][r] <= acc_2[1][r])[sampling], 1) >= 0.5
             basic.append(100*(np.mean(preds_1) + np.mean(preds_2)) / 2)
         return basic
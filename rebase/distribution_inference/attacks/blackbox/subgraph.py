@@ -0,0 +1,105 @@
+"""
+    Inference for graph models on the computational subgraph of requested nodes,
+    instead of the full graph. For a model with L graph-convolution layers, the
+    output for a node depends only on its L-hop neighbourhood, so each batch of
+    target nodes is evaluated on (the induced subgraph of) its (L+1)-hop
+    in-neighbourhood: the extra hop keeps the degree normalization of all nodes
+    within L hops the same as in the full graph.
+    Outputs are exact for graphs with symmetric adjacency (in-degree equal to
+    out-degree for every node), which is how ogbn-arxiv is prepared.
+"""
+import dgl
+import warnings
+import torch as ch
+import numpy as np
+from typing import List
+
+from distribution_inference.utils import warning_string
+
+
+class SubgraphBatches:
+    def __init__(self, graph: dgl.DGLGraph,
+                 indices,
+                 n_hops: int,
+                 batch_size: int):
+        """
+            graph: full graph
+            indices: target nodes to get predictions for
+            n_hops: number of message-passing layers in models
+            batch_size: number of target nodes per subgraph
+        """
+        self.n_hops = n_hops
+        self.n_targets = len(indices)
+        indices = ch.as_tensor(indices, device=graph.device)
+        self.batches = []
+        for i in range(0, len(indices), batch_size):
+            targets = indices[i:i + batch_size]
+            subgraph, target_positions = dgl.khop_in_subgraph(
+                graph, targets, k=n_hops + 1)
+            self.batches.append(
+                (subgraph, subgraph.ndata[dgl.NID], target_positions))
+
+    @staticmethod
+    def is_exact(graph: dgl.DGLGraph) -> bool:
+        return bool(ch.all(graph.in_degrees() == graph.out_degrees()))
+
+    def __iter__(self):
+        """
+            Yield (subgraph, node IDs in full graph, positions of target nodes)
+        """
+        return iter(self.batches)
+
+
+# Subgraph structure is the same for all models (and all calls) on the same data
+_SUBGRAPH_CACHE = {}
+_SUBGRAPH_CACHE_SIZE = 4
+
+
+def get_subgraph_batches(graph: dgl.DGLGraph,
+                         indices,
+                         n_hops: int,
+                         batch_size: int) -> SubgraphBatches:
+    """
+        Get (cached) subgraphs for target nodes of given graph.
+        Returns None if the graph does not support exact subgraph inference.
+    """
+    if isinstance(indices, ch.Tensor):
+        indices = indices.cpu().numpy()
+    indices = np.asarray(indices)
+    key = (id(graph), graph.num_nodes(), graph.num_edges(),
+           hash(indices.tobytes()), n_hops, batch_size)
+    if key in _SUBGRAPH_CACHE:
+        return _SUBGRAPH_CACHE[key]
+
+    if not SubgraphBatches.is_exact(graph):
+        warnings.warn(warning_string(
+            "\nGraph is not symmetric: falling back to full-graph inference"))
+        return None
+
+    batches = SubgraphBatches(graph, indices, n_hops, batch_size)
+    if len(_SUBGRAPH_CACHE) >= _SUBGRAPH_CACHE_SIZE:
+        # Drop oldest entry
+        del _SUBGRAPH_CACHE[next(iter(_SUBGRAPH_CACHE))]
+    _SUBGRAPH_CACHE[key] = batches
+    return batches
+
+
+@ch.no_grad()
+def subgraph_forward(model, batches: SubgraphBatches,
+                     features: ch.Tensor,
+                     latent: int = None) -> ch.Tensor:
+    """
+        Outputs of model for target nodes, computed batch-wise on subgraphs
+    """
+    outputs = []
+    for subgraph, node_ids, target_positions in batches:
+        output = model(subgraph, features[node_ids], latent=latent)
+        outputs.append(output[target_positions])
+    return ch.cat(outputs, 0)
+
+
+def get_n_hops(models: List) -> int:
+    """
+        Receptive field (number of graph-convolution layers) of given models
+    """
+    return max(len(model.layers) for model in models)
@@ -4,8 +4,18 @@ import torch.nn as nn
 from tqdm import tqdm
 import numpy as np
 import torch as ch
-import gc
-
+import warnings
+
+from distribution_inference.utils import warning_string
+from distribution_inference.device import to_device, empty_cache, free_memory, get_execution_context
+from distribution_inference.models.utils import StackedMLPEnsemble
+from distribution_inference.attacks.blackbox.cache import PredictionCache
+from distribution_inference.attacks.blackbox.parallel import get_preds_parallel
+from distribution_inference.attacks.blackbox.buffers import PredictionWriter, allocate_predictions
+from distribution_inference.attacks.blackbox.preload import PreloadedLoader
+from distribution_inference.attacks.blackbox.planner import PredictionPlanner
+from distribution_inference.attacks.blackbox.precision import resolve_precision, reduce_precision, cast_inputs, to_numpy, PrecisionCheck
+from distribution_inference.attacks.blackbox.subgraph import get_subgraph_batches, subgraph_forward, get_n_hops
 from distribution_inference.attacks.blackbox.per_point import PerPointThresholdAttack
 from distribution_inference.attacks.blackbox.standard import LossAndThresholdAttack
 from distribution_inference.attacks.blackbox.core import PredictionsOnOneDistribution
@@ -77,98 +87,238 @@ def get_graph_preds(ds, indices,
                     models: List[nn.Module],
                     verbose: bool = False,
                     multi_class: bool = False,
-                    latent: int = None):
+                    latent: int = None,
+                    subgraph_batch_size: int = None,
+                    out: np.ndarray = None):
     """
-        Get predictions for given graph models
+        Get predictions for given graph models.
+        If subgraph_batch_size is given, models are run only on the computational
+        subgraphs of (batches of that many) requested nodes, instead of the full graph.
+        If out is given, predictions are written into it (instead of a new array).
     """
     X = ds.get_features()
     Y = ds.get_labels()
 
-    predictions = []
+    batches = None
+    if subgraph_batch_size is not None:
+        batches = get_subgraph_batches(
+            ds.g, indices, get_n_hops(models), subgraph_batch_size)
+
+    writer = PredictionWriter(len(models), len(indices), out=out)
     iterator = models
     if verbose:
         iterator = tqdm(iterator, desc="Generating Predictions")
-    for model in iterator:
-        # Shift model to GPU
-        model = model.cuda()
+    for i, model in enumerate(iterator):
+        # Shift model to device
+        model = to_device(model)
         # Make sure model is in evaluation mode
         model.eval()
         # Clear GPU cache
-        ch.cuda.empty_cache()
+        empty_cache()
 
         # Get model outputs/preds
-        prediction = model(ds.g, X, latent=latent)[indices].detach().cpu().numpy()
+        if batches is not None:
+            prediction = subgraph_forward(model, batches, X, latent=latent)
+        else:
+            with ch.no_grad():
+                prediction = model(ds.g, X, latent=latent)[indices]
+        prediction = prediction.detach().cpu().numpy()
         if latent != None and not multi_class:
             prediction = prediction[:, 0]
-        predictions.append(prediction)
+        writer.write(i, 0, prediction)
     
         # Shift model back to CPU
         model = model.cpu()
         del model
-        gc.collect()
-        ch.cuda.empty_cache()
+        free_memory()
 
-    predictions = np.stack(predictions, 0)
-    gc.collect()
-    ch.cuda.empty_cache()
+    predictions = writer.get()
+    free_memory()
 
     labels = Y[indices].cpu().numpy()[:, 0]
     return predictions, labels
 
 
+@ch.no_grad()
+def _get_stacked_preds(loader, models: List[nn.Module],
+                       writer: PredictionWriter,
+                       inputs: List[ch.Tensor] = None,
+                       multi_class: bool = False,
+                       latent: int = None,
+                       precision: str = "fp32"):
+    """
+        Get predictions for all given models at once, by stacking
+        their parameters into an ensemble.
+    """
+    ensemble = to_device(StackedMLPEnsemble(models))
+    if precision == "bf16":
+        ensemble = ensemble.to(ch.bfloat16)
+    if inputs is None:
+        inputs = (data[0] for data in loader)
+
+    start = 0
+    for data_batch in inputs:
+        prediction = ensemble(cast_inputs(to_device(data_batch), precision), latent=latent)
+        if latent is None and not multi_class:
+            prediction = prediction[:, :, 0]
+        writer.write_models(start, to_numpy(prediction))
+        start += prediction.shape[1]
+    del ensemble
+    return writer.get()
+
+
 def get_preds(loader, models: List[nn.Module],
               preload: bool = False,
               verbose: bool = True,
               multi_class: bool = False,
-              latent: int = None):
+              latent: int = None,
+              ensemble: bool = False,
+              cache: PredictionCache = None,
+              cache_key: str = None,
+              num_workers: int = None,
+              out: np.ndarray = None,
+              subgraph_batch_size: int = None,
+              precision: str = "fp32"):
     """
-        Get predictions for given models on given data
+        Get predictions for given models on given data.
+        If ensemble is True and models share the same MLP architecture,
+        all models are evaluated together on each batch.
+        If num_workers > 1 (and running on CPU), models are split across
+        that many worker processes.
+        If cache (and cache_key) is given, predictions are served from/stored
+        in the cache. In that case, models can also be a function that returns
+        the list of models, so that they are loaded only on a cache miss.
+        If out is given, predictions are written into it (instead of a new array).
+        For graph models, subgraph_batch_size enables inference on the computational
+        subgraphs of requested nodes (see get_graph_preds).
+        precision ('fp32', 'bf16' or 'int8') sets the precision models are run in.
     """
+    if cache is not None and cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if out is not None:
+                out[:] = cached[0]
+                return out, cached[1]
+            return cached
+    if callable(models):
+        models = models()
+
+    predictions, ground_truth = _get_preds(
+        loader, models,
+        preload=preload,
+        verbose=verbose,
+        multi_class=multi_class,
+        latent=latent,
+        ensemble=ensemble,
+        num_workers=num_workers,
+        out=out,
+        subgraph_batch_size=subgraph_batch_size,
+        precision=precision)
+
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, predictions, ground_truth,
+                  info={"is_sklearn_model": bool(models[0].is_sklearn_model)})
+    return predictions, ground_truth
+
+
+def _get_preds(loader, models: List[nn.Module],
+               preload: bool = False,
+               verbose: bool = True,
+               multi_class: bool = False,
+               latent: int = None,
+               ensemble: bool = False,
+               num_workers: int = None,
+               out: np.ndarray = None,
+               subgraph_batch_size: int = None,
+               precision: str = "fp32"):
     # Check if models are graph-related
     if models[0].is_graph_model:
-        return get_graph_preds(ds=loader[0],
-                               indices=loader[1],
-                               models=models,
-                               verbose=verbose,
-                               latent=latent,
-                               multi_class=multi_class)
-
-    predictions = []
+        predictions, labels = get_graph_preds(ds=loader[0],
+                                              indices=loader[1],
+                                              models=models,
+                                              verbose=verbose,
+                                              latent=latent,
+                                              multi_class=multi_class,
+                                              subgraph_batch_size=subgraph_batch_size,
+                                              out=out)
+        return predictions, labels
+
+    precision = resolve_precision(precision, models)
+
+    # Process-level parallelism only makes sense on CPU
+    use_workers = num_workers is not None and num_workers > 1 and not get_execution_context().is_cuda
+
     ground_truth = []
     inputs = []
     # Accumulate all data for given loader
+    # (cheap for a PreloadedLoader, which is already in memory)
     for data in loader:
         if len(data) == 2:
             features, labels = data
         else:
             features, labels, _ = data
         ground_truth.append(labels.cpu().numpy())
-        if preload:
-            inputs.append(features.cuda())
+        if use_workers:
+            inputs.append(features)
+        elif preload:
+            inputs.append(cast_inputs(to_device(features), precision))
     ground_truth = np.concatenate(ground_truth, axis=0)
+    # Predictions are written in-place into a preallocated array
+    writer = PredictionWriter(len(models), len(ground_truth), out=out)
+
+    if use_workers:
+        if isinstance(loader, PreloadedLoader):
+            inputs = [loader.features]
+        predictions = get_preds_parallel(
+            ch.cat(inputs, 0), models,
+            num_workers=num_workers,
+            batch_size=loader.batch_size,
+            multi_class=multi_class,
+            latent=latent,
+            ensemble=ensemble,
+            precision=precision,
+            out=out)
+        del inputs
+        return predictions, ground_truth
+
+    if ensemble:
+        if StackedMLPEnsemble.supports(models) and precision != "int8":
+            predictions = _get_stacked_preds(
+                loader, models, writer,
+                inputs=inputs if preload else None,
+                multi_class=multi_class,
+                latent=latent,
+                precision=precision)
+            if preload:
+                del inputs
+            return predictions, ground_truth
+        warnings.warn(warning_string(
+            "\nModels cannot be stacked into an ensemble, evaluating one at a time"))
 
     # Get predictions for each model
     iterator = models
     if verbose:
         iterator = tqdm(iterator, desc="Generating Predictions")
-    for model in iterator:
-        # Shift model to GPU
-        model = model.cuda()
+    for i, model in enumerate(iterator):
+        # Shift model to device
+        model = to_device(model)
         # Make sure model is in evaluation mode
         model.eval()
         # Clear GPU cache
-        ch.cuda.empty_cache()
+        empty_cache()
+        # Version of model to run (same model, unless reduced precision)
+        model_run = reduce_precision(model, precision)
 
         with ch.no_grad():
-            predictions_on_model = []
+            start = 0
 
             # Skip multiple CPU-CUDA copy ops
             if preload:
                 for data_batch in inputs:
                     if latent != None:
-                        prediction = model(data_batch, latent=latent).detach()
+                        prediction = model_run(data_batch, latent=latent).detach()
                     else:
-                        prediction = model(data_batch).detach()
+                        prediction = model_run(data_batch).detach()
 
                         # If None for whatever reason, re-run
                         # Weird bug that pops in every now and then
@@ -181,56 +331,119 @@ def get_preds(loader, models: List[nn.Module],
 
                         if not multi_class:
                             prediction = prediction[:, 0]
-                    predictions_on_model.append(prediction.cpu())
+                    writer.write(i, start, to_numpy(prediction))
+                    start += len(prediction)
             else:
                 # Iterate through data-loader
                 for data in loader:
                     data_points, labels, _ = data
                     # Get prediction
+                    data_points = cast_inputs(to_device(data_points), precision)
                     if latent != None:
-                        prediction = model(data_points.cuda(), latent=latent).detach()
+                        prediction = model_run(data_points, latent=latent).detach()
                     else:
-                        prediction = model(data_points.cuda()).detach()
+                        prediction = model_run(data_points).detach()
                         if not multi_class:
                             prediction = prediction[:, 0]
-                    predictions_on_model.append(prediction)
-        predictions_on_model = ch.cat(predictions_on_model).cpu().numpy()
-        predictions.append(predictions_on_model)
+                    writer.write(i, start, to_numpy(prediction))
+                    start += len(prediction)
         # Shift model back to CPU
+        del model_run
         model = model.cpu()
         del model
-        gc.collect()
-        ch.cuda.empty_cache()
-    predictions = np.stack(predictions, 0)
+        free_memory()
+    predictions = writer.get()
     if preload:
         del inputs
-    gc.collect()
-    ch.cuda.empty_cache()
+    free_memory()
 
     return predictions, ground_truth
 
 
+def check_precision(loader, models: List[nn.Module],
+                    predictions: np.ndarray,
+                    ground_truth: np.ndarray,
+                    multi_class: bool = False,
+                    latent: int = None) -> dict:
+    """
+        Compare reduced-precision predictions of (first few) given models
+        against fp32 predictions: maximum deviation in outputs and
+        in per-model accuracy on the data.
+    """
+    preds_fp32, _ = _get_preds(loader, models, verbose=False,
+                               multi_class=multi_class, latent=latent)
+    preds_reduced = predictions[:len(models)]
+    deviation = {
+        "max_output_deviation": float(np.max(np.abs(preds_fp32 - preds_reduced))),
+    }
+    if latent is None:
+        # Accuracies are computed on (points, models) arrays
+        acc_fp32 = calculate_accuracies(
+            np.swapaxes(preds_fp32, 0, 1), ground_truth, multi_class=multi_class)
+        acc_reduced = calculate_accuracies(
+            np.swapaxes(preds_reduced, 0, 1), ground_truth, multi_class=multi_class)
+        deviation["max_accuracy_deviation"] = float(np.max(np.abs(acc_fp32 - acc_reduced)))
+    return deviation
+
+
+def _check_precision_once(precision_check: PrecisionCheck, role: str,
+                          loader, models, predictions: np.ndarray,
+                          ground_truth: np.ndarray,
+                          multi_class: bool = False,
+                          precision: str = "fp32"):
+    """
+        Run precision check for given role (victim/adversary), if not done yet in this run
+    """
+    if precision_check is None or not precision_check.pending(role):
+        return
+    if precision in [None, "fp32"]:
+        return
+    if callable(models):
+        # Victim predictions were cached: load models only for the check
+        models = models()
+    if resolve_precision(precision, models) == "fp32":
+        return
+    precision_check.record(role, check_precision(
+        loader, models[:precision_check.n_models], predictions,
+        ground_truth, multi_class=multi_class))
+
+
 def _get_preds_accross_epoch(models,
                              loader,
                              preload: bool = False,
-                             multi_class: bool = False):
-    preds = []
-    for e in models:
-        p, gt = get_preds(loader, e, preload, multi_class=multi_class)
-        preds.append(p)
+                             multi_class: bool = False,
+                             ensemble: bool = False,
+                             num_workers: int = None):
+    preds = None
+    for i, e in enumerate(models):
+        if preds is None:
+            # Shape of predictions known only after first epoch
+            p, gt = get_preds(loader, e, preload, multi_class=multi_class,
+                              ensemble=ensemble, num_workers=num_workers)
+            # Shared with prediction workers (if any), so they write into it directly
+            preds = allocate_predictions((len(models),) + p.shape, p.dtype,
+                                         shared=num_workers is not None and num_workers > 1)
+            preds[0] = p
+            del p
+        else:
+            get_preds(loader, e, preload, multi_class=multi_class,
+                      ensemble=ensemble, num_workers=num_workers,
+                      out=preds[i])
 
-    return (np.array(preds), np.array(gt))
+    return (preds, np.array(gt))
 
 
 def get_preds_epoch_on_dis(
         models,
         loader,
         preload: bool = False,
-        multi_class: bool = False):
+        multi_class: bool = False,
+        ensemble: bool = False,
+        num_workers: int = None):
     preds1, gt = _get_preds_accross_epoch(
-        models[0], loader, preload, multi_class)
+        models[0], loader, preload, multi_class, ensemble, num_workers)
     preds2, _ = _get_preds_accross_epoch(
-        models[1], loader, preload, multi_class)
+        models[1], loader, preload, multi_class, ensemble, num_workers)
     preds_wrapped = [PredictionsOnOneDistribution(
         preds_property_1=p1,
         preds_property_2=p2
@@ -244,14 +457,37 @@ def _get_preds_for_vic_and_adv(
         loader,
         epochwise_version: bool = False,
         preload: bool = False,
-        multi_class: bool = False):
+        multi_class: bool = False,
+        ensemble: bool = False,
+        cache: PredictionCache = None,
+        vic_cache_key: str = None,
+        num_workers: int = None,
+        planner: PredictionPlanner = None,
+        block_keys: Tuple[Tuple, Tuple] = (None, None),
+        subgraph_batch_size: int = None,
+        precision: str = "fp32",
+        precision_check: PrecisionCheck = None):
+
+    def planned(block_key, compute):
+        if planner is None or block_key is None:
+            return compute()
+        return planner.get(block_key, compute)
 
     # Sklearn models do not support logits- take care of that
     use_prob_adv = models_adv[0].is_sklearn_model
     if epochwise_version:
         use_prob_vic = models_vic[0][0].is_sklearn_model
     else:
-        use_prob_vic = models_vic[0].is_sklearn_model
+        cached_info = None
+        if cache is not None and vic_cache_key is not None:
+            cached_info = cache.get_info(vic_cache_key)
+        if cached_info is not None:
+            # Cache hit: no need to load victim models
+            use_prob_vic = cached_info["is_sklearn_model"]
+        else:
+            if callable(models_vic):
+                models_vic = models_vic()
+            use_prob_vic = models_vic[0].is_sklearn_model
     not_using_logits = use_prob_adv or use_prob_vic
 
     if type(loader) == tuple:
@@ -267,30 +503,53 @@ def _get_preds_for_vic_and_adv(
         return exp / (1 + exp)
 
     # Get predictions for adversary models and data
-    preds_adv, ground_truth_repeat = get_preds(
+    preds_adv, ground_truth_repeat = planned(block_keys[1], lambda: get_preds(
         loader_adv, models_adv, preload=preload,
-        multi_class=multi_class)
+        multi_class=multi_class, ensemble=ensemble,
+        num_workers=num_workers,
+        subgraph_batch_size=subgraph_batch_size,
+        precision=precision))
+    _check_precision_once(precision_check, "adversary", loader_adv, models_adv,
+                          preds_adv, ground_truth_repeat,
+                          multi_class=multi_class, precision=precision)
     if not_using_logits and not use_prob_adv:
         preds_adv = to_preds(preds_adv)
 
     # Get predictions for victim models and data
     if epochwise_version:
-        # Track predictions for each epoch
-        preds_vic = []
-        for models_inside_vic in tqdm(models_vic):
-            preds_vic_inside, ground_truth = get_preds(
-                loader_vic, models_inside_vic, preload=preload,
-                verbose=False, multi_class=multi_class)
-            if not_using_logits and not use_prob_vic:
-                preds_vic_inside = to_preds(preds_vic_inside)
-
-            # In epoch-wise mode, we need prediction results
-            # across epochs, not models
-            preds_vic.append(preds_vic_inside)
+        def get_epochwise_preds_vic():
+            # Track predictions for each epoch
+            preds_vic = []
+            for models_inside_vic in tqdm(models_vic):
+                preds_vic_inside, ground_truth = get_preds(
+                    loader_vic, models_inside_vic, preload=preload,
+                    verbose=False, multi_class=multi_class,
+                    ensemble=ensemble, num_workers=num_workers,
+                    subgraph_batch_size=subgraph_batch_size,
+                    precision=precision)
+                # In epoch-wise mode, we need prediction results
+                # across epochs, not models
+                preds_vic.append(preds_vic_inside)
+            return preds_vic, ground_truth
+
+        preds_vic, ground_truth = planned(block_keys[0], get_epochwise_preds_vic)
+        # Checked on models of first epoch
+        _check_precision_once(precision_check, "victim", loader_vic, models_vic[0],
+                              preds_vic[0], ground_truth,
+                              multi_class=multi_class, precision=precision)
+        if not_using_logits and not use_prob_vic:
+            preds_vic = [to_preds(x) for x in preds_vic]
     else:
-        preds_vic, ground_truth = get_preds(
+        preds_vic, ground_truth = planned(block_keys[0], lambda: get_preds(
             loader_vic, models_vic, preload=preload,
-            multi_class=multi_class)
+            multi_class=multi_class, ensemble=ensemble,
+            cache=cache, cache_key=vic_cache_key,
+            num_workers=num_workers,
+            subgraph_batch_size=subgraph_batch_size,
+            precision=precision))
+        _check_precision_once(precision_check, "victim", loader_vic, models_vic,
+                              preds_vic, ground_truth,
+                              multi_class=multi_class, precision=precision)
     assert np.all(ground_truth ==
                   ground_truth_repeat), "Val loader is shuffling data!"
     return preds_vic, preds_adv, ground_truth, not_using_logits
@@ -334,51 +593,106 @@ def get_vic_adv_preds_on_distr(
         epochwise_version: bool = False,
         preload: bool = False,
         multi_class: bool = False,
-        make_processed_version: bool = False):
-
+        make_processed_version: bool = False,
+        ensemble: bool = False,
+        cache: PredictionCache = None,
+        vic_model_paths: Tuple[List[str], List[str]] = None,
+        num_workers: int = None,
+        materialize: bool = False,
+        loaders: Tuple = None,
+        planner: PredictionPlanner = None,
+        models_keys: Tuple = None,
+        data_key: Tuple = None,
+        subgraph_batch_size: int = None,
+        precision: str = "fp32",
+        precision_check: PrecisionCheck = None):
+    """
+        Get predictions for victim and adversary models on data from ds_obj.
+        If cache and vic_model_paths (files for both sets of victim models) are given,
+        victim predictions are cached. Victim models can then also be given as
+        functions that load them, so that they are loaded only on a cache miss.
+        If materialize is True, evaluation data is read once into memory and
+        shared by all four (victim/adversary, property) prediction passes.
+        Loaders from get_evaluation_loaders() can be passed via loaders,
+        to re-use the same evaluation data across calls (trials).
+        If planner is given, predictions are looked up/stored as blocks identified
+        by models_keys (victim 1, victim 2, adversary 1, adversary 2) and data_key,
+        so that blocks shared across calls are computed only once.
+        For graph models, subgraph_batch_size enables inference on the computational
+        subgraphs of requested nodes (see get_graph_preds).
+        precision sets reduced-precision inference (see get_preds). If precision_check
+        is given, reduced-precision predictions of its first few victim and adversary
+        models are compared against fp32 ones, once per run (see PrecisionCheck).
+    """
     # Check if models are graph-related
     are_graph_models = False
     if epochwise_version:
         if models_vic[0][0][0].is_graph_model:
             are_graph_models = True
+    elif callable(models_vic[0]):
+        are_graph_models = ds_obj.is_graph_data
     else:
         if models_vic[0][0].is_graph_model:
             are_graph_models = True
 
-    if are_graph_models:
-        # No concept of 'processed'
-        data_ds, (_, test_idx) = ds_obj.get_loaders(batch_size=batch_size)
-        loader_vic = (data_ds, test_idx)
-        loader_adv = loader_vic
-    else:
-        loader_for_shape, loader_vic = ds_obj.get_loaders(batch_size=batch_size)
-        adv_datum_shape = next(iter(loader_for_shape))[0].shape[1:]
-
-        if make_processed_version:
-            # Make version of DS for victim that processes data
-            # before passing on
-            adv_datum_shape = ds_obj.prepare_processed_data(loader_vic)
-            loader_adv = ds_obj.get_processed_val_loader(batch_size=batch_size)
-        else:
-            # Get val data loader (should be same for all models, since get_loaders() gets new data for every call)
-            loader_adv = loader_vic
-
-        # TODO: Use preload logic here to speed things even more
+    if loaders is None:
+        loaders = get_evaluation_loaders(
+            ds_obj, batch_size,
+            are_graph_models=are_graph_models,
+            make_processed_version=make_processed_version,
+            materialize=materialize)
+    loader_vic, loader_adv = loaders
+
+    # Keys for victim predictions (only when data used can be identified)
+    vic_cache_keys = (None, None)
+    if cache is not None and vic_model_paths is not None and not epochwise_version:
+        data_ids = _get_data_ids(ds_obj, loader_vic[1] if are_graph_models else None)
+        if data_ids is not None:
+            vic_cache_keys = tuple(cache.make_key(
+                paths, data_ids,
+                multi_class=multi_class,
+                processed_variant=make_processed_version,
+                data_description=str(ds_obj),
+                precision=precision) for paths in vic_model_paths)
+
+    # Keys for prediction blocks (victim, adversary) for both sets of models
+    block_keys = ((None, None), (None, None))
+    if planner is not None:
+        block_keys = tuple(((models_keys[i], data_key), (models_keys[i + 2], data_key))
+                           for i in range(2))
 
     # Get predictions for first set of models
     preds_vic_1, preds_adv_1, ground_truth, not_using_logits = _get_preds_for_vic_and_adv(
         models_vic[0], models_adv[0],
-        (loader_vic, loader_adv),
+        loaders,
         epochwise_version=epochwise_version,
         preload=preload,
-        multi_class=multi_class)
+        multi_class=multi_class,
+        ensemble=ensemble,
+        cache=cache,
+        vic_cache_key=vic_cache_keys[0],
+        num_workers=num_workers,
+        planner=planner,
+        block_keys=block_keys[0],
+        subgraph_batch_size=subgraph_batch_size,
+        precision=precision,
+        precision_check=precision_check)
     # Get predictions for second set of models
     preds_vic_2, preds_adv_2, _, _ = _get_preds_for_vic_and_adv(
         models_vic[1], models_adv[1],
-        (loader_vic, loader_adv),
+        loaders,
         epochwise_version=epochwise_version,
         preload=preload,
-        multi_class=multi_class)
+        multi_class=multi_class,
+        ensemble=ensemble,
+        cache=cache,
+        vic_cache_key=vic_cache_keys[1],
+        num_workers=num_workers,
+        planner=planner,
+        block_keys=block_keys[1],
+        subgraph_batch_size=subgraph_batch_size,
+        precision=precision,
+        precision_check=precision_check)
     adv_preds = PredictionsOnOneDistribution(
         preds_property_1=preds_adv_1,
         preds_property_2=preds_adv_2
@@ -390,6 +704,56 @@ def get_vic_adv_preds_on_distr(
     return adv_preds, vic_preds, ground_truth, not_using_logits
 
 
+def get_evaluation_loaders(ds_obj: CustomDatasetWrapper,
+                           batch_size: int,
+                           are_graph_models: bool = False,
+                           make_processed_version: bool = False,
+                           materialize: bool = False):
+    """
+        Get (victim, adversary) loaders for evaluation data from ds_obj.
+        If materialize is True, data is read once and kept in memory.
+    """
+    if are_graph_models:
+        # No concept of 'processed'
+        data_ds, (_, test_idx) = ds_obj.get_loaders(batch_size=batch_size)
+        loader_vic = (data_ds, test_idx)
+        return loader_vic, loader_vic
+
+    _, loader_vic = ds_obj.get_loaders(batch_size=batch_size)
+    if materialize:
+        loader_vic = PreloadedLoader(loader_vic)
+
+    if make_processed_version:
+        # Make version of DS for victim that processes data
+        # before passing on
+        ds_obj.prepare_processed_data(loader_vic)
+        loader_adv = ds_obj.get_processed_val_loader(batch_size=batch_size)
+        if materialize:
+            loader_adv = PreloadedLoader(loader_adv)
+    else:
+        # Get val data loader (should be same for all models, since get_loaders() gets new data for every call)
+        loader_adv = loader_vic
+    return loader_vic, loader_adv
+
+
+def _get_data_ids(ds_obj: CustomDatasetWrapper, graph_indices=None):
+    """
+        Identify evaluation data (indices of validation split) used by ds_obj,
+        if possible. Returns None if data cannot be identified.
+    """
+    if graph_indices is not None:
+        if isinstance(graph_indices, ch.Tensor):
+            graph_indices = graph_indices.cpu().numpy()
+        return np.array(graph_indices)
+    try:
+        (_, _), (_, val_ids) = ds_obj.get_used_indices()
+    except (NotImplementedError, AttributeError):
+        return None
+    if val_ids is None:
+        return None
+    return np.array(val_ids)
+
+
 def compute_metrics(dataset_true, dataset_pred,
                     unprivileged_groups, privileged_groups):
     """ Compute the key metrics """
@@ -5,7 +5,9 @@ import numpy as np
 from typing import Tuple
 from typing import List, Callable
 from sklearn.neural_network import MLPClassifier
+from distribution_inference.config import BlackBoxAttackConfig
 from distribution_inference.attacks.blackbox.core import Attack, PredictionsOnDistributions,PredictionsOnOneDistribution,PredictionsOnOneDistribution
+from distribution_inference.attacks.blackbox.batched_mlp import BatchedMLPClassifier
 
 
 class ZhangAttack(Attack):
@@ -16,75 +18,85 @@ class ZhangAttack(Attack):
                calc_acc: Callable = None,
                epochwise_version: bool = False,
                not_using_logits: bool = False):
-        
+        data = self.prepare(preds_adv, preds_vic,
+                            epochwise_version=epochwise_version,
+                            not_using_logits=not_using_logits)
+        return self.finish(fit_meta_models(self.config, data))
+
+    def prepare(self,
+                preds_adv: PredictionsOnDistributions,
+                preds_vic: PredictionsOnDistributions,
+                epochwise_version: bool = False,
+                not_using_logits: bool = False) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+            Training data (X, y) for the meta-classifiers this attack needs:
+            one per distribution, for victim models (of each epoch, in epoch-wise
+            mode). Meta-classifiers trained on these (in same order) are passed
+            to finish(). Victim data is kept, so predictions can be freed.
+        """
         assert not (
             self.config.multi2 and self.config.multi), "No implementation for both multi model"
         assert not (
             epochwise_version and self.config.multi2), "No implementation for both epochwise and multi model"
-        if not epochwise_version:
-            return self.attack_not_epoch(preds_adv,preds_vic,ground_truth,calc_acc,not_using_logits)
-        else:
+        self.not_using_logits = not_using_logits
+        self.epochwise_version = epochwise_version
+        if epochwise_version:
             preds_v = [PredictionsOnDistributions(
                 PredictionsOnOneDistribution(preds_vic.preds_on_distr_1.preds_property_1[i],preds_vic.preds_on_distr_1.preds_property_2[i]),
                 PredictionsOnOneDistribution(preds_vic.preds_on_distr_2.preds_property_1[i],preds_vic.preds_on_distr_2.preds_property_2[i])
             ) for i in range(len(preds_vic.preds_on_distr_2.preds_property_1))]
-            accs,preds=[],[]
-            for x in preds_v:
-                result = self.attack_not_epoch(preds_adv,x,ground_truth,calc_acc,not_using_logits)
-                accs.append(result[0][0])
-                preds.append(result[0][1])
-            return [(accs, preds), (None, None), (None,None)]
-
-    def _attack_on_data(self,
-                        preds_adv: PredictionsOnOneDistribution,
-                        preds_vic: PredictionsOnOneDistribution,
-                        not_using_logits: bool = False):
-        ka, kb = preds_adv.preds_property_1, preds_adv.preds_property_2
-        kc1, kc2 = preds_vic.preds_property_1, preds_vic.preds_property_2
+        else:
+            preds_v = [preds_vic]
+        self.test_data = [(self._data(x.preds_on_distr_1), self._data(x.preds_on_distr_2))
+                          for x in preds_v]
+        train_data = [self._data(preds_adv.preds_on_distr_1),
+                      self._data(preds_adv.preds_on_distr_2)]
+        # New meta-classifiers for each epoch (as for separate attacks)
+        return train_data * len(self.test_data)
+
+    def finish(self, meta_models: List):
+        """
+            Attack victim models with meta-classifiers trained on data from prepare()
+        """
+        results = []
+        for i, (data_1, data_2) in enumerate(self.test_data):
+            results.append(self._attack_with_meta_models(
+                meta_models[2 * i: 2 * i + 2], (data_1, data_2)))
+        if not self.epochwise_version:
+            return results[0]
+        accs = [result[0][0] for result in results]
+        preds = [result[0][1] for result in results]
+        return [(accs, preds), (None, None), (None,None)]
+
+    def _data(self, preds: PredictionsOnOneDistribution):
+        ka, kb = preds.preds_property_1, preds.preds_property_2
         # Apply sigmoid to ones that are not already sigmoided
         if not self.not_using_logits:
             if self.config.multi_class:
                 ka, kb = softmax(ka), softmax(kb)
-                kc1, kc2 = softmax(kc1), softmax(kc2)
                 # Reshape (n, k, l) to (n, k * l) for multi-class
                 ka = ka.reshape(ka.shape[0], -1)
                 kb = kb.reshape(kb.shape[0], -1)
-                kc1 = kc1.reshape(kc1.shape[0], -1)
-                kc2 = kc2.reshape(kc2.shape[0], -1)
             else:
                 ka, kb = sigmoid(ka), sigmoid(kb)
-                kc1, kc2 = sigmoid(kc1), sigmoid(kc2)
-        
-        # Use same architecture as in paper
-        self.meta_model = MLPClassifier((20, 8), early_stopping=True)
+        X = np.concatenate((ka, kb), axis=0)
+        y = np.concatenate((np.ones(len(ka)), np.zeros(len(kb))), axis=0)
+        return X, y
 
-        # Train BB meta-classifier
-        X_train = np.concatenate((ka, kb), axis=0)
-        y_train = np.concatenate((np.ones(len(ka)), np.zeros(len(kb))), axis=0)
-        self.meta_model.fit(X_train, y_train)
-        val_acc = self.meta_model.best_validation_score_
+    def _attack_on_data(self, meta_model, data: Tuple[np.ndarray, np.ndarray]):
+        val_acc = meta_model.best_validation_score_
 
         # Predict on victim
-        X_test = np.concatenate((kc1, kc2), axis=0)
-        y_test = np.concatenate((np.ones(len(kc1)), np.zeros(len(kc2))), axis=0)
-        y_pred = self.meta_model.predict_proba(X_test)[:, 1]
-        test_acc = self.meta_model.score(X_test, y_test)
+        X_test, y_test = data
+        y_pred = meta_model.predict_proba(X_test)[:, 1]
+        test_acc = meta_model.score(X_test, y_test)
 
         return y_pred, (val_acc, test_acc)
 
-    def attack_not_epoch(self,
-               preds_adv: PredictionsOnDistributions,
-               preds_vic: PredictionsOnDistributions,
-               ground_truth: Tuple[List, List] = None,
-               calc_acc: Callable = None,
-               not_using_logits: bool = False):
-        
-        self.not_using_logits = not_using_logits
-        self.meta_model = MLPClassifier((20, 8)) # Use same architecture as in paper
-
+    def _attack_with_meta_models(self, meta_models, data):
         # Try attack with data from both distributions
-        preds_1, (tr_acc_1, te_acc_1) = self._attack_on_data(preds_adv.preds_on_distr_1, preds_vic.preds_on_distr_1)
-        preds_2, (tr_acc_2, te_acc_2) = self._attack_on_data(preds_adv.preds_on_distr_2, preds_vic.preds_on_distr_2)
+        preds_1, (tr_acc_1, te_acc_1) = self._attack_on_data(meta_models[0], data[0])
+        preds_2, (tr_acc_2, te_acc_2) = self._attack_on_data(meta_models[1], data[1])
 
         # Pick the one that performs best locally
         if tr_acc_1 > tr_acc_2:
@@ -96,6 +108,65 @@ class ZhangAttack(Attack):
         return [(100*victim_acc_use, victim_pred_use), (None, None), (None,None)]
 
 
+class DeferredZhangAttacks:
+    def __init__(self, config: BlackBoxAttackConfig):
+        """
+            Zhang attacks (of all ratios and trials of a run) whose
+            meta-classifiers are trained together in run(), as batched
+            models with the 'torch' backend
+        """
+        self.config = config
+        self.attacks, self.keys, self.data = [], [], []
+
+    def __len__(self):
+        return len(self.attacks)
+
+    def add(self, attacker: ZhangAttack,
+            preds_adv: PredictionsOnDistributions,
+            preds_vic: PredictionsOnDistributions,
+            key=None,
+            epochwise_version: bool = False,
+            not_using_logits: bool = False):
+        self.data.append(attacker.prepare(preds_adv, preds_vic,
+                                          epochwise_version=epochwise_version,
+                                          not_using_logits=not_using_logits))
+        self.attacks.append(attacker)
+        self.keys.append(key)
+
+    def run(self):
+        """
+            Train meta-classifiers of all added attacks, and
+            yield (key, result) for each attack, in order added
+        """
+        meta_models = fit_meta_models(
+            self.config, [d for data in self.data for d in data])
+        start = 0
+        for attacker, key, data in zip(self.attacks, self.keys, self.data):
+            yield key, attacker.finish(meta_models[start:start + len(data)])
+            start += len(data)
+        self.attacks, self.keys, self.data = [], [], []
+
+
+def fit_meta_models(config: BlackBoxAttackConfig,
+                    data: List[Tuple[np.ndarray, np.ndarray]]) -> List:
+    """
+        Train one meta-classifier per (X, y) in data, with
+        backend (and batch size, for 'torch') given in config
+    """
+    # Use same architecture as in paper
+    if config.meta_classifier_backend == "torch":
+        meta_models = []
+        batch_size = config.meta_classifier_batch_size
+        for start in range(0, len(data), batch_size):
+            chunk = data[start:start + batch_size]
+            batched = BatchedMLPClassifier((20, 8), early_stopping=True)
+            batched.fit([X for X, _ in chunk], [y for _, y in chunk])
+            meta_models.extend(batched[k] for k in range(len(chunk)))
+        return meta_models
+    return [MLPClassifier((20, 8), early_stopping=True).fit(X, y)
+            for X, y in data]
+
+
 def sigmoid(x):
     exp = np.exp(x)
     return exp / (1 + exp)
@@ -1,4 +1,5 @@
 import numpy as np
+from distribution_inference.device import to_device, get_device
 
 
 def wrap_data(models_neg, models_pos,
@@ -17,7 +18,7 @@ def wrap_data(models_neg, models_pos,
     np_x = prepare_batched_data(neg_w, verbose=False)
     X = [ch.cat((x, y), 0) for x, y in zip(pp_x, np_x)]
     Y = ch.cat((pos_labels, neg_labels))
-    return X, Y.cuda().float()
+    return X, Y.to(get_device()).float()
 
 
 def align_all_features(reference_point, features):
@@ -69,7 +70,7 @@ def coordinate_descent(models_train, models_val,
     metamodel = ActivationMetaClassifier(
         n_samples, dims,
         reduction_dims=reduction_dims)
-    metamodel = metamodel.cuda()
+    metamodel = to_device(metamodel)
 
     best_clf, best_tacc = None, 0
     val_data = None
@@ -89,7 +90,7 @@ def coordinate_descent(models_train, models_val,
             metamodel = ActivationMetaClassifier(
                 n_samples, dims,
                 reduction_dims=reduction_dims)
-            metamodel = metamodel.cuda()
+            metamodel = to_device(metamodel)
 
         # Train meta-classifier for a few epochs
         # Make sure meta-classifier is in train mode
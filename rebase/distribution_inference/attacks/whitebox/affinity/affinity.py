@@ -11,6 +11,7 @@ from distribution_inference.attacks.whitebox.affinity.models import AffinityMeta
 from distribution_inference.config import WhiteBoxAttackConfig, DatasetConfig, TrainConfig
 from distribution_inference.utils import warning_string, get_save_path, ensure_dir_exists
 from distribution_inference.models.core import BaseModel
+from distribution_inference.device import to_device, get_device
 from distribution_inference.training.core import train, validate_epoch
 
 
@@ -39,7 +40,7 @@ class AffinityAttack(Attack):
             self.num_logit_features,
             self.config.multi_class,)
         if self.config.gpu:
-            self.model = self.model.cuda()
+            self.model = to_device(self.model)
 
     def _collect_features(self,
                           model: BaseModel,
@@ -48,7 +49,7 @@ class AffinityAttack(Attack):
         features = None
         for data in loader:
             if self.config.gpu:
-                data = data.cuda()
+                data = to_device(data)
             model_features = model(
                 data, get_all=True,
                 detach_before_return=detach,
@@ -80,9 +81,9 @@ class AffinityAttack(Attack):
         for model in tqdm(models, desc="Building affinity matrix"):
             # Steps 2 & 3: get all model features and affinity scores
 
-            # Shift model to GPU if it is on CPU
-            if not next(model.parameters()).is_cuda:
-                model = model.cuda()
+            # Shift model to device if it is not there already
+            if next(model.parameters()).device != get_device():
+                model = to_device(model)
 
             affinity_feature, num_features, num_logit_features, num_layers = self._make_affinity_feature(
                     model, loader, detach=detach,
@@ -456,7 +457,7 @@ class AffinityAttack(Attack):
     def _collect_latents(self, loader):
         latents = []
         for x, y in loader:
-            data = [x_.cuda() for x_ in x]
+            data = [to_device(x_) for x_ in x]
             with ch.no_grad():
                 latent = self.model(data, get_latent=True)
                 latents.append(latent.detach().cpu().numpy())
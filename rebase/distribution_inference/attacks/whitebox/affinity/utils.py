@@ -14,6 +14,7 @@ from distribution_inference.utils import warning_string
 from distribution_inference.models.core import BaseModel
 from distribution_inference.attacks.blackbox.utils import get_preds
 from distribution_inference.attacks.blackbox.core import order_points
+from distribution_inference.device import to_device
 
 
 def get_seed_data_loader(ds_list: List[CustomDatasetWrapper],
@@ -214,7 +215,7 @@ def coordinate_descent(models_train,
 
     # Define meta-classifier model
     metamodel = AffinityMetaClassifier(num_features, num_layers)
-    metamodel = metamodel.cuda()
+    metamodel = to_device(metamodel)
 
     all_accs = []
     for _ in range(n_times):
@@ -231,7 +232,7 @@ def coordinate_descent(models_train,
         # Re-init meta-classifier if requested
         if restart_meta:
             metamodel = AffinityMetaClassifier(num_features, num_layers)
-            metamodel = metamodel.cuda()
+            metamodel = to_device(metamodel)
 
         # Train meta-classifier for a few epochs
         # Make sure meta-classifier is in train mode
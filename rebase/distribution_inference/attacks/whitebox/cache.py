@@ -0,0 +1,203 @@
+"""
+    Persistent cache for model features (per-layer parameters) extracted for
+    white-box attacks. One entry per directory of models and layer selection:
+    each layer is stored as one (n_models, ...) .npy array (loaded back
+    memory-mapped), with an index mapping model names to rows.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import torch as ch
+from typing import Dict, List, Tuple
+
+from distribution_inference.config import WhiteBoxAttackConfig
+from distribution_inference.utils import ensure_dir_exists, get_cache_path
+from distribution_inference.training.zoo import model_file_stat
+
+
+def _encode_dims(dims):
+    # Tuples and lists of dimensions mean different things to attacks: keep them apart
+    if isinstance(dims, tuple):
+        return {"tuple": [_encode_dims(x) for x in dims]}
+    if isinstance(dims, list):
+        return [_encode_dims(x) for x in dims]
+    if isinstance(dims, np.integer):
+        return int(dims)
+    return dims
+
+
+def _to_numpy(feature) -> np.ndarray:
+    # Features can be tensors on any device (e.g. GPU, if models were not loaded on CPU)
+    if ch.is_tensor(feature):
+        return feature.detach().cpu().numpy()
+    return np.asarray(feature)
+
+
+def _decode_dims(dims):
+    if isinstance(dims, dict):
+        return tuple(_decode_dims(x) for x in dims["tuple"])
+    if isinstance(dims, list):
+        return [_decode_dims(x) for x in dims]
+    return dims
+
+
+class FeatureCacheEntry:
+    def __init__(self, entry_dir: str, index: dict):
+        self.entry_dir = entry_dir
+        self.index = index
+        self.dims = _decode_dims(index["dims"])
+        self.layers = [np.load(os.path.join(entry_dir, FeatureCache.layer_name(j)), mmap_mode='c')
+                       for j in range(index["n_layers"])]
+
+    def lookup(self, name: str, signature: List) -> List[ch.Tensor]:
+        """
+            Features of given model (memory-mapped), or None if not cached
+            or if model file changed since features were extracted
+        """
+        entry = self.index["models"].get(name, None)
+        if entry is None or entry["signature"] != list(signature):
+            return None
+        return [ch.from_numpy(np.asarray(layer[entry["row"]])) for layer in self.layers]
+
+    def items(self):
+        # (name, signature, features) for all cached models
+        for name, entry in self.index["models"].items():
+            yield name, entry["signature"], [layer[entry["row"]] for layer in self.layers]
+
+
+class FeatureCache:
+    INDEX_NAME = "index.json"
+
+    def __init__(self, cache_dir: str = None):
+        """
+            cache_dir: directory to store features in (defaults to get_cache_path())
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_path(), "features")
+        self.cache_dir = cache_dir
+        ensure_dir_exists(self.cache_dir)
+
+    @staticmethod
+    def layer_name(j: int) -> str:
+        return "layer_%d.npy" % j
+
+    @staticmethod
+    def model_signature(path: str) -> List:
+        """
+            Identify model file by (mtime, size)
+        """
+        # Models in packed zoos are identified by the packed file
+        stat = model_file_stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    @staticmethod
+    def layer_selection(attack_config: WhiteBoxAttackConfig) -> dict:
+        """
+            Fields of attack config that decide which features are extracted
+        """
+        focus = None
+        if attack_config.permutation_config is not None:
+            focus = attack_config.permutation_config.focus
+        return {
+            "first_n_fc": attack_config.first_n_fc,
+            "start_n_fc": attack_config.start_n_fc,
+            "custom_layers_fc": attack_config.custom_layers_fc,
+            "first_n_conv": attack_config.first_n_conv,
+            "start_n_conv": attack_config.start_n_conv,
+            "custom_layers_conv": attack_config.custom_layers_conv,
+            "focus": focus,
+        }
+
+    def make_key(self,
+                 folder_path: str,
+                 attack_config: WhiteBoxAttackConfig,
+                 model_arch: str = None) -> str:
+        """
+            Key for features of models in given directory, with given layer selection
+        """
+        description = {
+            "folder": os.path.abspath(folder_path),
+            "model_arch": model_arch,
+            "layers": FeatureCache.layer_selection(attack_config),
+        }
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> FeatureCacheEntry:
+        """
+            Cached features for given key, or None
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        index_path = os.path.join(entry_dir, self.INDEX_NAME)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            return FeatureCacheEntry(entry_dir, index)
+        except FileNotFoundError:
+            # Entry was being replaced by another run
+            return None
+
+    def put(self, key: str, dims,
+            features: Dict[str, Tuple[List, List[ch.Tensor]]]):
+        """
+            Add features (name -> (signature, per-layer tensors)) of models
+            to entry for given key, keeping models already cached.
+        """
+        merged = {}
+        existing = self.get(key)
+        if existing is not None:
+            for name, signature, feature in existing.items():
+                merged[name] = (signature, feature)
+        for name, (signature, feature) in features.items():
+            merged[name] = (list(signature), [_to_numpy(f) for f in feature])
+
+        names = list(merged.keys())
+        n_layers = len(merged[names[0]][1])
+        for name in names:
+            if len(merged[name][1]) != n_layers or \
+                    any(a.shape != b.shape for a, b in zip(merged[name][1], merged[names[0]][1])):
+                raise ValueError(f"Features of {name} do not match those of other models: cannot cache")
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        # Unique per call: concurrent runs never touch each other's half-written entries
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + ".tmp.")
+        try:
+            for j in range(n_layers):
+                np.save(os.path.join(temp_dir, FeatureCache.layer_name(j)),
+                        np.stack([merged[name][1][j] for name in names], 0))
+            index = {
+                "dims": _encode_dims(dims),
+                "n_layers": n_layers,
+                "models": {name: {"row": i, "signature": merged[name][0]}
+                           for i, name in enumerate(names)},
+            }
+            with open(os.path.join(temp_dir, self.INDEX_NAME), 'w') as f:
+                json.dump(index, f)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        # Move old entry out of the way (arrays already memory-mapped from it stay readable)
+        if os.path.exists(entry_dir):
+            old_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + ".old.")
+            try:
+                os.replace(entry_dir, old_dir)
+            except FileNotFoundError:
+                # Already moved by another run
+                pass
+            shutil.rmtree(old_dir, ignore_errors=True)
+        try:
+            os.replace(temp_dir, entry_dir)
+        except OSError:
+            # Another run stored an entry for this key in the meantime: keep that one
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def remove(self, key: str):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
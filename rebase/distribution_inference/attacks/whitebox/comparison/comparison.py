@@ -17,6 +17,7 @@ from distribution_inference.config import TrainConfig, DatasetConfig, MiscTrainC
 from distribution_inference.attacks.blackbox.core import  PredictionsOnDistributions,PredictionsOnOneDistribution
 from distribution_inference.attacks.blackbox.KL import sigmoid, KL
 from distribution_inference.training.utils import load_model
+from distribution_inference.training.manifest import ModelManifest
 
 
 class ComparisonAttack:
@@ -171,7 +172,8 @@ class ComparisonAttack:
         else:
             folder_path = self._model_save_path(
                 train_config, model_arch=model_arch)
-        model_paths = os.listdir(folder_path)
+        # Includes models in packed zoo (original files may have been removed)
+        model_paths = ModelManifest.load(folder_path).names()
         if shuffle:
             model_paths = np.random.permutation(model_paths)
         total_models = len(model_paths) if n_models is None else n_models
@@ -199,12 +201,15 @@ class ComparisonAttack:
             shuffle=shuffle,
             model_arch=model_arch,
             custom_models_path=custom_models_path)
+        manifest = ModelManifest.load(folder_path)
         i = 0
         models = []
         mp = []
         with tqdm(total=total_models, desc="Loading models") as pbar:
             model_paths = list(model_paths)
-            model_paths.sort(key=lambda x: int(x.split("_")[0]))
+            # Special entries (like adv_train_*) have no model number: keep them last
+            model_paths.sort(key=lambda x: (manifest.entries[x]["id"] is None,
+                                            manifest.entries[x]["id"] or 0))
             #epochs in ascending order
             for mpath in model_paths:
                 # Break reading if requested number of models is reached
@@ -213,10 +218,10 @@ class ComparisonAttack:
                     break
 
                 # Skip models with model_num below train_config.offset
-                if not (mpath.startswith("adv_train_") or mpath == "full" or mpath == "drop") and (not custom_models_path) and int(mpath.split("_")[0]) <= train_config.offset:
+                if (not custom_models_path) and manifest.is_below_offset(mpath, train_config.offset):
                     continue
 
-                if os.path.isdir(os.path.join(folder_path, mpath)):
+                if manifest.is_dir(mpath):
                     continue
                 else:
                     model = self.load_model(os.path.join(
@@ -4,6 +4,7 @@ from torch.utils.data import Dataset
 
 from distribution_inference.config import WhiteBoxAttackConfig, DatasetConfig
 from distribution_inference.utils import warning_string
+from distribution_inference.device import to_device
 
 
 class Attack:
@@ -72,7 +73,7 @@ class Attack:
         return pred
 
     def to_gpu(self):
-        self.model.cuda()
+        self.model = to_device(self.model)
 
 
 class BasicDataset(Dataset):
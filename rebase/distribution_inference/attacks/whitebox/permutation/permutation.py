@@ -12,6 +12,7 @@ from distribution_inference.attacks.whitebox.core import Attack
 from distribution_inference.attacks.whitebox.permutation.models import PermInvModel, FullPermInvModel, PermInvConvModel
 from distribution_inference.config import WhiteBoxAttackConfig, DatasetConfig
 from distribution_inference.utils import log, get_save_path, warning_string, ensure_dir_exists
+from distribution_inference.device import to_device, get_device
 
 
 class PINAttack(Attack):
@@ -41,7 +42,7 @@ class PINAttack(Attack):
             # Define meta-classifier
             self.model = PermInvModel(self.dims, dropout=0.5)
         if self.config.gpu:
-            self.model = self.model.cuda()
+            self.model = to_device(self.model)
 
     def _acc_fn(self, x, y):
         if self.config.binary:
@@ -178,10 +179,10 @@ class PINAttack(Attack):
             # Iterate through data batches
             running_acc, loss, num_samples = 0, 0, 0
             for param_batch, y_batch in train_loader:
-                # Shift to GPU if requested
+                # Shift to device if requested
                 if self.config.gpu:
-                    y_batch = y_batch.cuda(0)
-                    param_batch = [a.cuda() for a in param_batch]
+                    y_batch = y_batch.to(get_device())
+                    param_batch = [to_device(a) for a in param_batch]
 
                 # Model features stored as list of objects
                 outputs = []
@@ -294,8 +295,8 @@ class PINAttack(Attack):
         for param_batch, y_batch in iterator:
             outputs = []
             if self.config.gpu:
-                y_batch = y_batch.cuda(0)
-                param_batch = [a.cuda() for a in param_batch]
+                y_batch = y_batch.to(get_device())
+                param_batch = [to_device(a) for a in param_batch]
 
             model_output = model(param_batch)
             # Handle binary and regression cases
@@ -4,6 +4,7 @@
 import torch as ch
 from tqdm import tqdm
 import numpy as np
+from distribution_inference.device import to_device, get_device
 
 
 def prepare_batched_data(X, reduce=False, verbose=True):
@@ -34,10 +35,10 @@ def get_ratio_info_for_reg_meta(metamodel, X, Y, num_per_dist, batch_size, combi
         meta-classifier for binary classification.
     """
     # Evaluate
-    metamodel = metamodel.cuda()
+    metamodel = to_device(metamodel)
     loss_fn = ch.nn.MSELoss(reduction='none')
     _, losses, preds = test_meta(
-        metamodel, loss_fn, X, Y.cuda(),
+        metamodel, loss_fn, X, Y.to(get_device()),
         batch_size, None,
         binary=True, regression=True, gpu=True,
         combined=combined, element_wise=True,
@@ -91,7 +92,7 @@ def get_preds(model, X, batch_size, on_gpu=True):
     for i in range(0, len(X), batch_size):
         x_batch = X[i:i+batch_size]
         if on_gpu:
-            x_batch = [x.cuda() for x in x_batch]
+            x_batch = [to_device(x) for x in x_batch]
         batch_preds = model(x_batch)
         preds.append(batch_preds.detach())
     return ch.cat(preds, 0)
@@ -319,40 +319,40 @@ def get_weight_layers(model: BaseModel,
                       prune_mask=[],
                       detach: bool = True,
                       track_grad: bool = False):
-    # TODO: Could speed this up by loading only relevant parts of the model
-    # depending on what the meta-classifier will be using
+    # To read only relevant parts of saved models, see get_weight_layers_from_state_dict()
     if model.is_conv:
         # Model has convolutional layers
         # Process FC and Conv layers separately
-
-        dims_conv, fvec_conv = _get_weight_layers(
-            model.features,
-            first_n=attack_config.first_n_conv,
-            start_n=attack_config.start_n_conv,
-            is_conv=True,
-            custom_layers=attack_config.custom_layers_conv,
-            transpose_features=model.transpose_features,
-            prune_mask=prune_mask,
-            include_all=True,
-            detach=detach,
-            track_grad=track_grad)
-        dims_fc, fvec_fc = _get_weight_layers(
-            model.classifier,
-            first_n=attack_config.first_n_fc,
-            start_n=attack_config.start_n_fc,
-            custom_layers=attack_config.custom_layers_fc,
-            transpose_features=model.transpose_features,
-            prune_mask=prune_mask,
-            detach=detach,
-            track_grad=track_grad)
-        # If PIN requested only FC layers, return only FC layers
+        # If PIN requested only FC (or conv) layers, do not touch the others at all
+        focus = "all"
         if attack_config.permutation_config:
-            if attack_config.permutation_config.focus == "fc":
-                feature_vector = fvec_fc
-            elif attack_config.permutation_config.focus == "conv":
-                feature_vector = fvec_conv
-            else:
-                feature_vector = fvec_conv + fvec_fc
+            focus = attack_config.permutation_config.focus
+        dims_conv, fvec_conv = None, []
+        dims_fc, fvec_fc = None, []
+        if focus != "fc":
+            dims_conv, fvec_conv = _get_weight_layers(
+                model.features,
+                first_n=attack_config.first_n_conv,
+                start_n=attack_config.start_n_conv,
+                is_conv=True,
+                custom_layers=attack_config.custom_layers_conv,
+                transpose_features=model.transpose_features,
+                prune_mask=prune_mask,
+                include_all=True,
+                detach=detach,
+                track_grad=track_grad)
+        if focus != "conv":
+            dims_fc, fvec_fc = _get_weight_layers(
+                model.classifier,
+                first_n=attack_config.first_n_fc,
+                start_n=attack_config.start_n_fc,
+                custom_layers=attack_config.custom_layers_fc,
+                transpose_features=model.transpose_features,
+                prune_mask=prune_mask,
+                detach=detach,
+                track_grad=track_grad)
+        feature_vector = fvec_conv + fvec_fc
+        # Dimensions of layers not in focus are None
         dimensions = (dims_conv, dims_fc)
     else:
         dims_fc, fvec_fc = _get_weight_layers(
@@ -370,6 +370,60 @@ def get_weight_layers(model: BaseModel,
     return dimensions, feature_vector
 
 
+class _StateDictView:
+    """
+        Parameters of a model, taken from its state dict,
+        in the form get_weight_layers() reads them from the model
+    """
+    def __init__(self, state_dict: dict,
+                 param_names: List[str],
+                 is_conv: bool = False,
+                 transpose_features: bool = True,
+                 prefix: str = ""):
+        self.state_dict = state_dict
+        self.param_names = param_names
+        self.is_conv = is_conv
+        self.transpose_features = transpose_features
+        self.prefix = prefix
+
+    def named_parameters(self):
+        # Same order as the model's parameters (buffers are not parameters)
+        for name in self.param_names:
+            if name.startswith(self.prefix):
+                yield name[len(self.prefix):], self.state_dict[name]
+
+    def _child(self, name: str):
+        return _StateDictView(self.state_dict, self.param_names,
+                              is_conv=self.is_conv,
+                              transpose_features=self.transpose_features,
+                              prefix=self.prefix + name + ".")
+
+    @property
+    def features(self):
+        return self._child("features")
+
+    @property
+    def classifier(self):
+        return self._child("classifier")
+
+
+def get_weight_layers_from_state_dict(state_dict: dict,
+                                      reference_model: BaseModel,
+                                      attack_config: WhiteBoxAttackConfig):
+    """
+        Same as get_weight_layers(), but for parameters in given state dict
+        (of a model with the same architecture as reference_model), without
+        loading them into a model. Only parameters of layers selected by
+        attack_config are used, so for lazily-read state dicts (memory-mapped
+        files, packed zoos) only those are read from disk.
+    """
+    param_names = [name for name, _ in reference_model.named_parameters()]
+    view = _StateDictView(state_dict, param_names,
+                          is_conv=reference_model.is_conv,
+                          transpose_features=reference_model.transpose_features)
+    return get_weight_layers(view, attack_config)
+
+
 def eval_regression_preds_for_binary(regression_preds, test_loader,
                                      ratios, raw: bool = False):
     """
@@ -326,14 +326,37 @@ class BlackBoxAttackConfig(Serializable):
     """Batch size to use for loaders when generating predictions"""
     num_adv_models: int = 50
     """Number of models adversary uses per distribution (for estimating statistics)"""
-    granularity: Optional[float] = 0.005
-    """Graunularity while finding threshold candidates"""
+    granularity: Optional[float] = None
+    """Graunularity while finding threshold candidates (if None, exact best thresholds are found where supported)"""
     preload: Optional[bool] = False
     """Pre-load data while launching attack (faster, if memory available)?"""
+    ensemble_inference: Optional[bool] = False
+    """Evaluate same-architecture MLPs together as one stacked ensemble when generating predictions?"""
+    prediction_workers: Optional[int] = None
+    """If > 1 (and running on CPU), number of processes to split models across when generating predictions"""
+    cache_predictions: Optional[bool] = False
+    """Cache victim-model predictions on disk (re-used across trials and runs)?"""
+    cache_max_size_gb: Optional[float] = 10.0
+    """Maximum size (in GB) of prediction cache, after which least-recently used entries are evicted"""
+    memmap_directory: Optional[str] = None
+    """Directory (on local disk) to back large prediction arrays with memory-mapped files"""
+    materialize_data: Optional[bool] = False
+    """Read evaluation data into memory once, and share it across all prediction passes? (needs memory for the whole evaluation set)"""
+    reuse_data_across_trials: Optional[bool] = False
+    """Use the same evaluation data for all trials (instead of fresh data per trial)? Victim predictions are shared across trials (and values) only if enabled: otherwise every trial computes them again"""
+    prediction_precision: Optional[str] = field(
+        default="fp32", choices=["fp32", "bf16", "int8"])
+    """Precision to run models in when collecting predictions (int8: dynamically quantized Linear layers, CPU only)"""
+    precision_check_models: Optional[int] = 0
+    """Number of victim and adversary models to also run in fp32 (once per run), to report deviation of reduced-precision predictions (and accuracies)"""
+    subgraph_batch_size: Optional[int] = None
+    """For graph models: run models only on computational subgraphs of (batches of these many) evaluation nodes, instead of the full graph"""
     multi: Optional[int] = None
     """Multi model setting (1), number of victim models"""
     multi2: Optional[int] = None
     """Multi model setting (2), number of victim models"""
+    multi_sampling_seed: Optional[int] = None
+    """Seed for random sampling in attacks (victim models in multi model settings, pairs of points)"""
     multi_class: Optional[bool] = False
     """Are the model logits > 1 dimension?"""
     save: Optional[bool] = False
@@ -359,6 +382,13 @@ class BlackBoxAttackConfig(Serializable):
     """Frac of pairs to use (if KL test)"""
     kl_voting: Optional[bool] = False
     """Use comparison instead of differences"""
+    kl_memory_budget_gb: Optional[float] = 1.0
+    """Memory (in GB) for intermediate values of KL test, processed in chunks of victim models to fit in it"""
+    meta_classifier_backend: Optional[str] = field(
+        default="sklearn", choices=["sklearn", "torch"])
+    """Backend for meta-classifiers of Zhang attack (torch: meta-classifiers of all ratios, trials and epochs of a run trained together as batched models, after the last trial)"""
+    meta_classifier_batch_size: Optional[int] = 64
+    """Maximum number of meta-classifiers trained together as one batched model (torch backend)"""
     generative_attack: Optional[GenerativeAttackConfig] = None
     """Use generative attack?"""
     order_name: Optional[str] = None
@@ -372,6 +402,8 @@ class BlackBoxAttackConfig(Serializable):
     """Std for noise in merlin-based probability estimation"""
     merlin_neighbors: Optional[int] = 100
     """Number of samples for noise in merlin-based probability estimation"""
+    merlin_seed: Optional[int] = None
+    """Seed for noise in merlin-based probability estimation: seeds one generator for the run, from which every model gets its own noise (random if None)"""
 
 
 @dataclass
@@ -491,6 +523,8 @@ class WhiteBoxAttackConfig(Serializable):
     """Shuffle train data in each epoch?"""
     multi_class: Optional[bool] = False
     """Are the model logits > 1 dimension?"""
+    cache_features: Optional[bool] = False
+    """Cache extracted model features on disk (re-used across runs, instead of loading models again)?"""
 
     # Valid for MLPs
     custom_layers_fc: Optional[List[int]] = None
@@ -561,6 +595,10 @@ class AttackConfig(Serializable):
     """Number of victim models (per distribution) to test on"""
     on_cpu: Optional[bool] = False
     """Keep models read on CPU?"""
+    lazy_model_loading: Optional[bool] = False
+    """Load models only when they are used (streamed), instead of all at once?"""
+    model_cache_size: Optional[int] = 16
+    """With lazy model loading, maximum number of loaded models kept in memory"""
     adv_misc_config: Optional[MiscTrainConfig] = None
     """If given, specifies extra training params (adv, DP, etc) for adv models"""
     num_total_adv_models: Optional[int] = 1000
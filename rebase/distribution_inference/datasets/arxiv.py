@@ -9,6 +9,7 @@ from distribution_inference.config import DatasetConfig, TrainConfig
 from distribution_inference.defenses.active.shuffle import ShuffleDefense
 from collections import Counter
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device, get_device
 from distribution_inference.utils import get_arxiv_node_params_mapping
 
 import dgl
@@ -50,7 +51,7 @@ class DatasetInformation(base.DatasetInformation):
         if cpu:
             model = model.cpu()
         else:
-            model = model.cuda()
+            model = to_device(model)
         return model
     
     def _best_fit_no_intercept(self, x, y):
@@ -166,10 +167,10 @@ class NodeLevelDataset:
         self.g = dgl.to_bidirected(self.g)
 
     def shift_to_gpu(self):
-        # Shift graph, labels to cuda
-        self.g = self.g.to('cuda')
-        self.labels = self.labels.cuda()
-        self.features = self.features.cuda()
+        # Shift graph, labels to device
+        self.g = self.g.to(get_device())
+        self.labels = self.labels.to(get_device())
+        self.features = to_device(self.features)
 
     def get_idx_split(self, test_ratio=0.2):
         num_test = int(test_ratio * self.num_nodes)
@@ -230,7 +231,7 @@ class ArxivNodeDataset(NodeLevelDataset):
         # Extract years
         self.years = ch.squeeze(self.g.ndata['year'], 1)
         if self.on_gpu:
-            self.years = self.years.cuda()
+            self.years = self.years.to(get_device())
 
     def get_idx_split(self):
         return self.train_idx, self.test_idx
@@ -316,9 +317,9 @@ class ArxivNodeDataset(NodeLevelDataset):
             for i, x in enumerate(keep):
                 keep[i] = mapping[x.item()]
 
-            # Shift mask back to GPU
+            # Shift mask back to device
             if self.on_gpu:
-                keep = keep.cuda()
+                keep = keep.to(get_device())
             return keep
 
         # Update masks to account for pruned nodes,  re-indexing
@@ -379,10 +380,15 @@ class ArxivWrapper(base.CustomDatasetWrapper):
     def _filter(self, x):
         return x[self.prop] == 1
 
+    def build_model(self,
+                    on_cpu: bool = False,
+                    model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+
     def load_model(self, path: str,
                    on_cpu: bool = False,
                    model_arch: str = None) -> nn.Module:
-        model = self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
     
     def get_labels(self):
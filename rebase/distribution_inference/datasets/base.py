@@ -1,4 +1,5 @@
 import os
+import copy
 from distribution_inference.defenses.active.shuffle import ShuffleDefense
 import numpy as np
 import torch as ch
@@ -10,8 +11,15 @@ import warnings
 
 from distribution_inference.utils import warning_string, log
 from distribution_inference.config import DatasetConfig, TrainConfig, WhiteBoxAttackConfig
-from distribution_inference.attacks.whitebox.utils import get_weight_layers
+from distribution_inference.attacks.whitebox.utils import get_weight_layers, get_weight_layers_from_state_dict
+from distribution_inference.attacks.whitebox.cache import FeatureCache
 import distribution_inference.datasets.utils as utils
+from distribution_inference.datasets.prefetch import prefetch
+from distribution_inference.datasets.collection import ModelCollection
+from distribution_inference.training.utils import read_model_file, load_model_contents
+from distribution_inference.training.zoo import PackedZoo
+from distribution_inference.training.manifest import ModelManifest
+from distribution_inference.device import to_device
 
 
 class Constants:
@@ -65,7 +73,7 @@ class DatasetInformation:
         all_labels, all_props = [], []
         for data in loader:
             x, y, p = data
-            features = model(x.cuda()).detach().cpu()
+            features = model(to_device(x)).detach().cpu()
             all_features.append(features)
             if collect_all_info:
                 all_labels.append(y)
@@ -272,10 +280,7 @@ class CustomDatasetWrapper:
     # Check with this model exists
     def check_if_exists(self, model_check_path, model_id):
         # Get folder of models to check
-        for model_name in os.listdir(model_check_path):
-            if model_name.startswith(model_id + "_"):
-                return True
-        return False
+        return ModelManifest.load(model_check_path).has_id(model_id)
 
     def load_model(self, path: str,
                    on_cpu: bool = False,
@@ -283,6 +288,71 @@ class CustomDatasetWrapper:
         """Load model from a given path"""
         raise NotImplementedError("Function to load model not implemented")
 
+    def build_model(self,
+                    on_cpu: bool = False,
+                    model_arch: str = None) -> nn.Module:
+        """Build (untrained) model, to load saved parameters into"""
+        raise NotImplementedError("Function to build model not implemented")
+
+    def _model_reader(self, folder_path: str,
+                      on_cpu: bool = False,
+                      model_arch: str = None):
+        """
+            Returns (read, build, template): read(path) reads a model (path relative
+            to folder_path) from its file or the folder's packed zoo (run in background
+            threads), build(contents) turns that into a model. The architecture
+            (template) is built once and cloned for each model (None if not supported).
+        """
+        try:
+            template = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
+        except NotImplementedError:
+            # Build and load entire model in background threads
+            def read(path):
+                return self.load_model(os.path.join(folder_path, path),
+                                       on_cpu=on_cpu, model_arch=model_arch)
+            return read, lambda model: model, None
+
+        zoo = PackedZoo.open(folder_path)
+
+        def read(path):
+            if zoo is not None and path in zoo:
+                # Slices of packed (memory-mapped) parameters
+                return zoo.get_contents(path)
+            return read_model_file(os.path.join(folder_path, path),
+                                   template.is_sklearn_model, on_cpu=on_cpu)
+
+        def build(contents):
+            return load_model_contents(copy.deepcopy(template), contents)
+        return read, build, template
+
+    def _feature_reader(self, folder_path: str,
+                        model_arch: str = None):
+        """
+            Returns read_features(path, attack_config), which extracts features
+            (like get_weight_layers) of a model in folder_path, reading only
+            parameters of the requested layers from its file or the folder's
+            packed zoo, without loading the model. None if not supported.
+        """
+        try:
+            template = self.build_model(on_cpu=True, model_arch=model_arch)
+        except NotImplementedError:
+            return None
+        if template.is_sklearn_model:
+            return None
+
+        zoo = PackedZoo.open(folder_path)
+
+        def read_features(path, attack_config):
+            if zoo is not None and path in zoo:
+                # Slices of packed (memory-mapped) parameters
+                state_dict = zoo.state_dict(zoo.position(path))
+            else:
+                state_dict = read_model_file(os.path.join(folder_path, path), mmap=True)
+                if "actual_model" in state_dict:
+                    state_dict = state_dict["actual_model"]
+            return get_weight_layers_from_state_dict(state_dict, template, attack_config)
+        return read_features
+
     def __str__(self):
         return f"{type(self).__name__}(prop={self.prop}, ratio={self.ratio}, split={self.split}, classify={self.classify})"
     
@@ -307,13 +377,45 @@ class CustomDatasetWrapper:
         else:
             folder_path = self.get_save_dir(
                 train_config, model_arch=model_arch)
-        model_paths = os.listdir(folder_path)
+        # Includes models in packed zoo (original files may have been removed)
+        model_paths = ModelManifest.load(folder_path).names()
         if shuffle:
             model_paths = np.random.permutation(model_paths)
         total_models = len(model_paths) if n_models is None else n_models
         log(f"Available models: {total_models}")
         return model_paths, folder_path, total_models
 
+    def get_model_files(self,
+                        train_config: TrainConfig,
+                        n_models: int = None,
+                        model_arch: str = None,
+                        custom_models_path: str = None) -> List[str]:
+        """
+            Paths to model files that get_models() would load (with shuffle=False,
+            not epoch-wise), in the same order, without loading any of them.
+        """
+        if model_arch==None or model_arch=="None":
+            model_arch=self.info_object.default_model
+        model_paths, folder_path, _ = self._get_model_paths(
+            train_config,
+            n_models=n_models,
+            shuffle=False,
+            model_arch=model_arch,
+            custom_models_path=custom_models_path)
+        manifest = ModelManifest.load(folder_path)
+        model_files = []
+        for mpath in model_paths:
+            if n_models is not None and len(model_files) >= n_models:
+                break
+            # Skip models with model_num below train_config.offset
+            if (not custom_models_path) and manifest.is_below_offset(mpath, train_config.offset):
+                continue
+            # Skip any directories we may stumble upon
+            if manifest.is_dir(mpath):
+                continue
+            model_files.append(os.path.join(folder_path, mpath))
+        return model_files
+
     def get_models(self,
                    train_config: TrainConfig,
                    n_models: int = None,
@@ -323,11 +425,21 @@ class CustomDatasetWrapper:
                    get_names: bool = False,
                    model_arch: str = None,
                    custom_models_path: str = None,
-                   target_epoch: int = None):
+                   target_epoch: int = None,
+                   load_threads: int = 4,
+                   prefetch_models: int = 16,
+                   lazy: bool = False,
+                   cache_models: int = 16):
         """
             Load models. Either return list of requested models, or a 
             list of list of models, where each nested list is the model's
             state across iterations of being trained (sorted in epoch order)
+            Model files are read by load_threads background threads,
+            up to prefetch_models files ahead.
+            If lazy is True, a ModelCollection is returned instead, which loads
+            models only when they are used (keeping at most cache_models in memory).
+            Models that fail to load then raise an error when used, and train/test
+            ids saved with models are not returned.
         """
         # Get path to load models
         if model_arch==None or model_arch=="None":
@@ -338,6 +450,41 @@ class CustomDatasetWrapper:
             shuffle=shuffle,
             model_arch=model_arch,
             custom_models_path=custom_models_path)
+        read_model, build_model, template = self._model_reader(
+            folder_path, on_cpu=on_cpu, model_arch=model_arch)
+
+        def load_models(paths):
+            # Models in same order as paths, with files read ahead in background
+            return prefetch(paths, read_model,
+                            num_threads=load_threads,
+                            max_ahead=prefetch_models)
+
+        manifest = ModelManifest.load(folder_path)
+
+        def candidate_paths():
+            for mpath in model_paths:
+                # Skip models with model_num below train_config.offset
+                if (not custom_models_path) and manifest.is_below_offset(mpath, train_config.offset):
+                    continue
+                yield mpath
+
+        if epochwise_version:
+            model_paths = list(model_paths)
+            model_paths.sort(key=lambda i: int(i))
+
+        if lazy:
+            return self._lazy_models(
+                candidate_paths(), manifest, folder_path,
+                read_model, build_model,
+                template=template,
+                n_models=n_models,
+                epochwise_version=epochwise_version,
+                get_names=get_names,
+                target_epoch=target_epoch,
+                load_threads=load_threads,
+                prefetch_models=prefetch_models,
+                cache_models=cache_models)
+
         i = 0
         n_failed = []
         models = []
@@ -347,66 +494,59 @@ class CustomDatasetWrapper:
             if len(n_failed) >= 5:
                 raise Exception(f"Had trouble loading {len(n_failed)} models ({n_failed}), aborting")
 
-            if epochwise_version:
-                model_paths = list(model_paths)
-                model_paths.sort(key=lambda i: int(i))
             #epochs in ascending order
-            for mpath in model_paths:
-                # Break reading if requested number of models is reached
-                
-                if i >= n_models and not epochwise_version:
-                    break
+            if epochwise_version or (target_epoch is not None):
+                for mpath in candidate_paths():
+                    # Break reading if requested number of models is reached
+                    if i >= n_models and not epochwise_version:
+                        break
 
-                # Skip models with model_num below train_config.offset
-                if not (mpath.startswith("adv_train_") or mpath == "full" or mpath == "drop") and (not custom_models_path) and int(mpath.split("_")[0]) <= train_config.offset:
-                    continue
-
-                # Skip any directories we may stumble upon
-                if epochwise_version or (target_epoch is not None):
-                    if os.path.isdir(os.path.join(folder_path, mpath)):
+                    if manifest.is_dir(mpath):
                         # Make sure not accidentally looking into model with adv-trained models
                         if not (mpath.startswith("adv_train_") or mpath == "full"):
-                            ei = 0
                             models_inside = []
-                            # Sort according to model number in the name : %d_ format
-                            files_inside = os.listdir(
+                            # Sorted according to model number in the name : %d_ format
+                            manifest_inside = ModelManifest.load(
                                 os.path.join(folder_path, mpath))
-                            files_inside.sort(
-                                key=lambda x: int(x.split("_")[0]))
+                            files_inside = manifest_inside.sorted_by_id()
 
                             # Pick only target epoch
                             if target_epoch is not None:
-                                files_inside = [f for f in files_inside if int(f.split("_")[0]) == (target_epoch - 1)]
+                                files_inside = manifest_inside.by_id(target_epoch - 1)
                                 if len(files_inside) == 0:
                                     raise ValueError(f"No model found for epoch {target_epoch}")
 
-                            for mpath_inside in files_inside:
-                                if ei>= n_models:
-                                    break
-                                model = self.load_model(os.path.join(
-                                    folder_path, mpath, mpath_inside),
-                                    on_cpu=on_cpu,
-                                    model_arch=model_arch)
-                                models_inside.append(model)
-                                ei+=1
+                            files_inside = [os.path.join(mpath, f) for f in files_inside[:n_models]]
+                            for mpath_inside, contents, error in load_models(files_inside):
+                                if error is not None:
+                                    raise error
+                                models_inside.append(build_model(contents))
                             models.append(models_inside)
                             i += 1
-                            mp.append(os.path.join(mpath, mpath_inside))
+                            mp.append(mpath_inside)
                     else:
                         # Not a folder- we want to look only at epoch_wise information
                         continue
-                elif os.path.isdir(os.path.join(folder_path, mpath)):
-                    continue
-                else:
+
+                    pbar.update()
+            else:
+                # Skip any directories we may stumble upon
+                model_files = (mpath for mpath in candidate_paths()
+                               if not manifest.is_dir(mpath))
+                for mpath, contents, error in load_models(model_files):
+                    # Break reading if requested number of models is reached
+                    if i >= n_models:
+                        break
+
                     try:
-                        model = self.load_model(os.path.join(
-                            folder_path, mpath), on_cpu=on_cpu,
-                            model_arch=model_arch)
+                        if error is not None:
+                            raise error
+                        model = build_model(contents)
                     except Exception as e:
                         # Could not load (for whatever reason)
                         n_failed.append(mpath)
                         continue
-                    
+
                     # Has before/after information
                     if type(model) == tuple:
                         models.append(model[0])
@@ -417,7 +557,7 @@ class CustomDatasetWrapper:
                     i += 1
                     mp.append(mpath)
 
-                pbar.update()
+                    pbar.update()
 
         if len(models) == 0:
             raise ValueError(
@@ -440,6 +580,76 @@ class CustomDatasetWrapper:
         else:
             return np.array(models, dtype='object')
 
+    def _lazy_models(self, candidates, manifest, folder_path,
+                     read_model, build_model,
+                     template=None,
+                     n_models: int = None,
+                     epochwise_version: bool = False,
+                     get_names: bool = False,
+                     target_epoch: int = None,
+                     load_threads: int = 4,
+                     prefetch_models: int = 16,
+                     cache_models: int = 16):
+        """
+            Models (same selection as get_models) as a ModelCollection, without loading them
+        """
+        specs, names = [], []
+        if epochwise_version or (target_epoch is not None):
+            for mpath in candidates:
+                if n_models is not None and len(specs) >= n_models and not epochwise_version:
+                    break
+                # Not a folder- we want to look only at epoch_wise information
+                if not manifest.is_dir(mpath):
+                    continue
+                # Make sure not accidentally looking into model with adv-trained models
+                if mpath.startswith("adv_train_") or mpath == "full":
+                    continue
+                manifest_inside = ModelManifest.load(
+                    os.path.join(folder_path, mpath))
+                files_inside = manifest_inside.sorted_by_id()
+                # Pick only target epoch
+                if target_epoch is not None:
+                    files_inside = manifest_inside.by_id(target_epoch - 1)
+                    if len(files_inside) == 0:
+                        raise ValueError(f"No model found for epoch {target_epoch}")
+                files_inside = [os.path.join(mpath, f) for f in files_inside[:n_models]]
+                specs.append(files_inside)
+                names.append(files_inside[-1])
+        else:
+            for mpath in candidates:
+                if n_models is not None and len(specs) >= n_models:
+                    break
+                # Skip any directories we may stumble upon
+                if manifest.is_dir(mpath):
+                    continue
+                specs.append(mpath)
+                names.append(mpath)
+
+        if len(specs) == 0:
+            raise ValueError(
+                f"No models found in the given path {folder_path}")
+
+        if epochwise_version:
+            # Assert that all models have the same number of epochs
+            if not np.all([len(x) == len(specs[0]) for x in specs]):
+                raise ValueError(
+                    f"Number of epochs not same in all models")
+
+        if n_models is not None and len(specs) != n_models:
+            warnings.warn(warning_string(
+                f"\nNumber of models available ({len(specs)}) is less than requested ({n_models})"))
+
+        models = ModelCollection(specs, read_model, build_model,
+                                 names=names,
+                                 cache_size=cache_models,
+                                 num_threads=load_threads,
+                                 max_ahead=prefetch_models,
+                                 folder_path=folder_path,
+                                 template=template)
+        if get_names:
+            return models, names
+        return models
+
     def get_model_features(self,
                            train_config: TrainConfig,
                            attack_config: WhiteBoxAttackConfig,
@@ -449,10 +659,13 @@ class CustomDatasetWrapper:
                            epochwise_version: bool = False,
                            model_arch: str = None,
                            custom_models_path: str = None,
-                           target_epoch: int = None):
+                           target_epoch: int = None,
+                           cache: FeatureCache = None):
         """
             Extract features for a given model.
             Make sure only the parts that are needed inside the model are extracted
+            If cache is given, features of (not epoch-wise) models are read from
+            and added to it, so cached models are not loaded at all.
         """
         # Get path to load models
         model_paths, folder_path, total_models = self._get_model_paths(
@@ -461,6 +674,20 @@ class CustomDatasetWrapper:
             shuffle=shuffle,
             model_arch=model_arch,
             custom_models_path=custom_models_path)
+        read_model, build_model, _ = self._model_reader(
+            folder_path, on_cpu=on_cpu, model_arch=model_arch)
+        # Reads only requested layers of each model
+        read_features = self._feature_reader(folder_path, model_arch=model_arch)
+        manifest = ModelManifest.load(folder_path)
+
+        # Features cached for this directory and layer selection
+        cached, cache_key, new_features = None, None, {}
+        if cache is not None and not (epochwise_version or (target_epoch is not None)):
+            cache_key = cache.make_key(folder_path, attack_config, model_arch=model_arch)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                dims = cached.dims
+
         i = 0
         feature_vectors = []
         with tqdm(total=total_models, desc="Loading models") as pbar:
@@ -475,32 +702,29 @@ class CustomDatasetWrapper:
                     break
 
                 # Skip models with model_num below train_config.offset
-                if not (mpath.startswith("adv_train_") or mpath == "full" or mpath == "drop") and (not custom_models_path) and int(mpath.split("_")[0]) <= train_config.offset:
+                if (not custom_models_path) and manifest.is_below_offset(mpath, train_config.offset):
                     continue
 
                 # Skip any directories we may stumble upon
                 if epochwise_version or (target_epoch is not None):
-                    if os.path.isdir(os.path.join(folder_path, mpath)):
+                    if manifest.is_dir(mpath):
                         # Make sure not accidentally looking into model with adv-trained models
                         if not (mpath.startswith("adv_train_") or mpath == "full"):
                             features_inside = []
-                            # Sort according to model number in the name : %d_ format
-                            files_inside = os.listdir(
+                            # Sorted according to model number in the name : %d_ format
+                            manifest_inside = ModelManifest.load(
                                 os.path.join(folder_path, mpath))
-                            files_inside.sort(
-                                key=lambda x: int(x.split("_")[0]))
+                            files_inside = manifest_inside.sorted_by_id()
 
                             # Pick only target epoch
                             if target_epoch is not None:
-                                files_inside = [f for f in files_inside if int(f.split("_")[0]) == (target_epoch - 1)]
+                                files_inside = manifest_inside.by_id(target_epoch - 1)
                                 if len(files_inside) == 0:
                                     raise ValueError(f"No model found for epoch {target_epoch}")
 
                             for mpath_inside in files_inside:
-                                model = self.load_model(os.path.join(
-                                    folder_path, mpath, mpath_inside),
-                                    on_cpu=on_cpu,
-                                    model_arch=model_arch)
+                                model = build_model(read_model(
+                                    os.path.join(mpath, mpath_inside)))
                                 # Extract model features
                                 # Get model params, shift to GPU
                                 dims, feature_vector = get_weight_layers(
@@ -511,24 +735,39 @@ class CustomDatasetWrapper:
                     else:
                         # Not a folder- we want to look only at epoch_wise information
                         continue
-                elif os.path.isdir(os.path.join(folder_path, mpath)):
+                elif manifest.is_dir(mpath):
                     continue
                 else:
-                    # Load model
-                    model = self.load_model(os.path.join(
-                        folder_path, mpath), on_cpu=on_cpu,
-                        model_arch=model_arch)
-
-                    # Has before/after information
-                    model_part_use = model
-                    if type(model) == tuple:
-                        model_part_use = model[0]
+                    if cache_key is not None:
+                        signature = cache.model_signature(os.path.join(folder_path, mpath))
+                        feature_vector = None
+                        if cached is not None:
+                            feature_vector = cached.lookup(mpath, signature)
+                        if feature_vector is not None:
+                            feature_vectors.append(feature_vector)
+                            i += 1
+                            pbar.update(1)
+                            continue
 
-                    # Extract model features
-                    # Get model params, shift to GPU
-                    dims, feature_vector = get_weight_layers(
-                        model_part_use, attack_config)
+                    if read_features is not None:
+                        # Read only requested parameters (from file or packed zoo)
+                        dims, feature_vector = read_features(mpath, attack_config)
+                    else:
+                        # Load model (from file or packed zoo)
+                        model = build_model(read_model(mpath))
+
+                        # Has before/after information
+                        model_part_use = model
+                        if type(model) == tuple:
+                            model_part_use = model[0]
+
+                        # Extract model features
+                        # Get model params, shift to GPU
+                        dims, feature_vector = get_weight_layers(
+                            model_part_use, attack_config)
                     feature_vectors.append(feature_vector)
+                    if cache_key is not None:
+                        new_features[mpath] = (signature, feature_vector)
                     i += 1
 
                 # Update progress
@@ -548,6 +787,9 @@ class CustomDatasetWrapper:
             warnings.warn(warning_string(
                 f"\nNumber of models loaded ({len(feature_vectors)}) is less than requested ({n_models})"))
 
+        if len(new_features) > 0:
+            cache.put(cache_key, dims, new_features)
+
         feature_vectors = np.array(feature_vectors, dtype='object')
         return dims, feature_vectors
 
@@ -3,7 +3,6 @@ import pandas as pd
 import torch as ch
 import torch.nn as nn
 import numpy as np
-import gc
 from PIL import Image
 from sklearn.model_selection import train_test_split
 from torchvision import transforms
@@ -17,6 +16,7 @@ from distribution_inference.config import DatasetConfig, TrainConfig
 from distribution_inference.utils import ensure_dir_exists
 import distribution_inference.datasets.utils as utils
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device, free_memory
 
 
 def get_transforms(augment):
@@ -80,7 +80,7 @@ class DatasetInformation(base.DatasetInformation):
         if cpu:
             model = model.cpu()
         else:
-            model = model.cuda()
+            model = to_device(model)
         return model
 
     def _stratified_df_split(df, second_ratio: float):
@@ -146,7 +146,7 @@ class DatasetInformation(base.DatasetInformation):
     def _extract_pretrained_features(self, df, split: str):
         # Load model
         model = self._get_pre_processor()
-        model = model.cuda()
+        model = to_device(model)
         model = nn.DataParallel(model)
 
         # Ready dataset objects
@@ -323,16 +323,21 @@ class BoneWrapper(base.CustomDatasetWrapper):
     def _filter(self, x):
         return x[self.prop] == 1
 
+    def build_model(self,
+                    on_cpu: bool = False,
+                    model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+
     def load_model(self, path: str,
                    on_cpu: bool = False,
                    model_arch: str = None) -> nn.Module:
-        model = self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
 
     def prepare_processed_data(self, loader):
         # Load model
         model = self.info_object._get_pre_processor()
-        model = model.cuda()
+        model = to_device(model)
         # Collect all processed information
         features, task_labels, prop_labels = self.info_object._collect_features(
             loader, model, collect_all_info=True)
@@ -340,8 +345,7 @@ class BoneWrapper(base.CustomDatasetWrapper):
             task_labels, prop_labels)
         # Clear cache
         del model
-        gc.collect()
-        ch.cuda.empty_cache()
+        free_memory()
         return features.shape[1:]
 
     def load_data(self, indexed_data = None):
@@ -2,7 +2,6 @@ import os
 from distribution_inference.defenses.active.shuffle import ShuffleDefense
 import pandas as pd
 from torchvision import transforms
-import gc
 from PIL import Image
 import torch as ch
 import numpy as np
@@ -15,6 +14,7 @@ import distribution_inference.datasets.utils as utils
 import distribution_inference.models.core as models_core
 from distribution_inference.config import TrainConfig, DatasetConfig
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device, free_memory
 
 
 class DatasetInformation(base.DatasetInformation):
@@ -64,7 +64,7 @@ class DatasetInformation(base.DatasetInformation):
             raise NotImplementedError("Model architecture not supported")
 
         if not cpu:
-            model = model.cuda()
+            model = to_device(model)
         if parallel:
             model = nn.DataParallel(model)
         return model
@@ -78,7 +78,7 @@ class DatasetInformation(base.DatasetInformation):
     def _extract_pretrained_features(self):
         # Load model
         model = self._get_pre_processor()
-        model = model.cuda()
+        model = to_device(model)
         model = nn.DataParallel(model)
         basepath = os.path.join(self.base_data_dir, "img_align_celeba")
 
@@ -114,7 +114,7 @@ class DatasetInformation(base.DatasetInformation):
         i = 0
         feature_mapping = {}
         for x in tqdm(data_loader, desc="Extracting features"):
-            x = x.cuda()
+            x = to_device(x)
             features = model(x)
             features = features.cpu().detach()
             for j in range(features.shape[0]):
@@ -424,7 +424,7 @@ class CelebaWrapper(base.CustomDatasetWrapper):
     def prepare_processed_data(self, loader):
         # Load model
         model = self.info_object._get_pre_processor()
-        model = model.cuda()
+        model = to_device(model)
         # Collect all processed information
         features, task_labels, prop_labels = self.info_object._collect_features(
             loader, model, collect_all_info=True)
@@ -432,8 +432,7 @@ class CelebaWrapper(base.CustomDatasetWrapper):
                                                             task_labels, prop_labels)
         # Clear cache
         del model
-        gc.collect()
-        ch.cuda.empty_cache()
+        free_memory()
         return features.shape[1:]
 
     def load_data(self, indexed_data = None):
@@ -584,10 +583,15 @@ class CelebaWrapper(base.CustomDatasetWrapper):
 
         return save_path
 
+    def build_model(self,
+                    on_cpu: bool = False,
+                    model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+
     def load_model(self, path: str,
                    on_cpu: bool = False,
                    model_arch: str = None) -> nn.Module:
-        model = self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
 
 
@@ -12,6 +12,8 @@ from distribution_inference.models.core import PortedMLPClassifier
 import distribution_inference.datasets.base as base
 import distribution_inference.datasets.utils as utils
 from distribution_inference.training.utils import load_model, save_model
+from distribution_inference.training.manifest import ModelManifest
+from distribution_inference.device import to_device
 
 
 def skload_model(path):
@@ -22,11 +24,13 @@ def get_models(folder_path):
     """
         Load models from given directory.
     """
-    paths = os.listdir(folder_path)
+    # Manifest (and packed zoo) in directory are not models
+    paths = ModelManifest.load(folder_path).names()
     models = []
     names = []
     for mpath in tqdm(paths):
         p = os.path.join(folder_path, mpath)
+        # Only torch models are packed into zoos: sklearn models are always files
         if os.path.isfile(p):
             model = skload_model(p)
             models.append(model)
@@ -82,7 +86,7 @@ class DatasetInformation(base.DatasetInformation):
             raise NotImplementedError("Model architecture not supported")
 
         if not cpu:
-            model = model.cuda()
+            model = to_device(model)
         return model
 
 
@@ -254,9 +258,12 @@ class CensusWrapper(base.CustomDatasetWrapper):
                                    eval_shuffle=eval_shuffle,
                                    num_workers=1)
 
-    def load_model(self, path: str, on_cpu: bool = False) -> nn.Module:
+    def build_model(self, on_cpu: bool = False, model_arch: str = None) -> nn.Module:
         info_object = DatasetInformation()
-        model = info_object.get_model(cpu=on_cpu)
+        return info_object.get_model(cpu=on_cpu)
+
+    def load_model(self, path: str, on_cpu: bool = False) -> nn.Module:
+        model = self.build_model(on_cpu=on_cpu)
         return load_model(model, path, on_cpu=on_cpu)
 
     def get_save_dir(self, train_config: TrainConfig, model_arch: str) -> str:
@@ -0,0 +1,171 @@
+"""
+    Lazy collection of saved models, loaded on demand instead of all at once.
+    At most a fixed number of loaded models are kept in memory (least-recently
+    used ones are dropped), so collections of large models can be streamed
+    through prediction and feature-extraction code.
+"""
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, List, Union
+
+from distribution_inference.datasets.prefetch import prefetch
+
+
+class _ModelLRU:
+    """
+        Loaded models (keyed by spec), shared by a collection and its slices
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+
+class ModelCollection:
+    def __init__(self,
+                 specs: List[Union[str, List[str]]],
+                 read: Callable,
+                 build: Callable,
+                 names: List[str] = None,
+                 cache_size: int = 16,
+                 num_threads: int = 4,
+                 max_ahead: int = 16,
+                 folder_path: str = None,
+                 template=None,
+                 _cache: _ModelLRU = None):
+        """
+            specs: model files (relative paths, passed to read), or lists of
+            model files (epoch-wise models, loaded as lists of models).
+            read(path) reads model file contents (called in background threads),
+            build(contents) turns them into a model (see Dataset._model_reader).
+            cache_size: maximum number of loaded models kept in memory.
+            folder_path, template: directory specs are relative to, and (untrained)
+            model to load file contents into, if known. Lets other processes
+            load models of the collection themselves (see files()).
+        """
+        self.specs = [tuple(s) if isinstance(s, (list, tuple)) else s for s in specs]
+        self.names = list(names) if names is not None else [
+            s[-1] if isinstance(s, tuple) else s for s in self.specs]
+        self.read = read
+        self.build = build
+        self.num_threads = num_threads
+        self.max_ahead = max_ahead
+        self.folder_path = folder_path
+        self.template = template
+        self._cache = _cache if _cache is not None else _ModelLRU(cache_size)
+
+    def _subset(self, indices) -> "ModelCollection":
+        return ModelCollection([self.specs[i] for i in indices],
+                               self.read, self.build,
+                               names=[self.names[i] for i in indices],
+                               num_threads=self.num_threads,
+                               max_ahead=self.max_ahead,
+                               folder_path=self.folder_path,
+                               template=self.template,
+                               _cache=self._cache)
+
+    def files(self) -> List[str]:
+        """
+            Paths to model files (one per model), for loading models of the
+            collection elsewhere (into copies of self.template). None if not
+            known, or for epoch-wise models.
+        """
+        if self.folder_path is None or self.template is None:
+            return None
+        if any(isinstance(s, tuple) for s in self.specs):
+            return None
+        return [os.path.join(self.folder_path, s) for s in self.specs]
+
+    def _read(self, spec):
+        if isinstance(spec, tuple):
+            return [self.read(path) for path in spec]
+        return self.read(spec)
+
+    def _build(self, contents, is_epochwise: bool):
+        if is_epochwise:
+            return [self._unwrap(self.build(c)) for c in contents]
+        return self._unwrap(self.build(contents))
+
+    @staticmethod
+    def _unwrap(model):
+        # Train/test ids (if saved with model) are not kept
+        if type(model) == tuple:
+            return model[0]
+        return model
+
+    def _load(self, spec):
+        model = self._cache.get(spec)
+        if model is None:
+            model = self._build(self._read(spec), isinstance(spec, tuple))
+            self._cache.put(spec, model)
+        return model
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._subset(range(len(self))[index])
+        if isinstance(index, (list, np.ndarray)):
+            index = np.asarray(index)
+            if index.dtype == bool:
+                index = np.nonzero(index)[0]
+            return self._subset([int(i) for i in index])
+        return self._load(self.specs[index])
+
+    def __iter__(self):
+        # Files are read in background threads, ahead of models being used
+        def read_uncached(spec):
+            if spec in self._cache:
+                return None
+            return self._read(spec)
+
+        for spec, contents, error in prefetch(self.specs, read_uncached,
+                                              num_threads=self.num_threads,
+                                              max_ahead=self.max_ahead):
+            if error is not None:
+                raise error
+            model = self._cache.get(spec)
+            if model is None:
+                if contents is None:
+                    # Was dropped from memory after file read was skipped
+                    contents = self._read(spec)
+                model = self._build(contents, isinstance(spec, tuple))
+                self._cache.put(spec, model)
+            yield model
+
+    def sample(self, n: int, seed: int = None) -> "ModelCollection":
+        """
+            Random subset of n models (without replacement)
+        """
+        rng = np.random.default_rng(seed)
+        n = min(n, len(self))
+        return self._subset(rng.choice(len(self), n, replace=False))
+
+    def materialize(self) -> np.ndarray:
+        """
+            Load all models into memory (as returned by get_models() with lazy=False)
+        """
+        return np.array(list(self), dtype='object')
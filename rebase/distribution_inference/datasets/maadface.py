@@ -17,6 +17,7 @@ import distribution_inference.datasets.utils as utils
 import distribution_inference.models.contrastive as models_contrastive
 from distribution_inference.config import TrainConfig, DatasetConfig
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device
 from distribution_inference.utils import model_compile_supported
 import pickle
 
@@ -87,7 +88,7 @@ class DatasetInformation(base.DatasetInformation):
         if parallel:
             model = nn.DataParallel(model)
         if not cpu:
-            model = model.cuda()
+            model = to_device(model)
         
         if for_training and model_compile_supported():
             model = ch.compile(model)
@@ -385,9 +386,14 @@ class MaadFaceWrapper(base.CustomDatasetWrapper):
 
         return save_path
 
+    def build_model(self,
+                    on_cpu: bool = False,
+                    model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(
+            cpu=on_cpu, model_arch=model_arch, n_people=self.n_people)
+
     def load_model(self, path: str,
                    on_cpu: bool = False,
                    model_arch: str = None) -> nn.Module:
-        model = self.info_object.get_model(
-            cpu=on_cpu, model_arch=model_arch, n_people=self.n_people)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
@@ -12,6 +12,7 @@ from distribution_inference.models.core import MLPTwoLayer, RandomForest, LRClas
 import distribution_inference.datasets.base as base
 import distribution_inference.datasets.utils as utils
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device
 
 
 class DatasetInformation(base.DatasetInformation):
@@ -42,7 +43,7 @@ class DatasetInformation(base.DatasetInformation):
             raise NotImplementedError("Model architecture not supported")
 
         if not model.is_sklearn_model and not cpu:
-            model = model.cuda()
+            model = to_device(model)
         return model
 
     def get_model_for_dp(self, cpu: bool = False, model_arch: str = None) -> nn.Module:
@@ -52,7 +53,7 @@ class DatasetInformation(base.DatasetInformation):
             raise NotImplementedError("Model architecture not supported")
 
         if not cpu:
-            model = model.cuda()
+            model = to_device(model)
         return model
 
     def generate_victim_adversary_splits(self,
@@ -347,9 +348,11 @@ class CensusWrapper(base.CustomDatasetWrapper):
         return super().get_loaders(batch_size, shuffle=shuffle,
                                    eval_shuffle=eval_shuffle,)
 
+    def build_model(self, on_cpu: bool = False, model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+
     def load_model(self, path: str, on_cpu: bool = False, model_arch: str = None) -> nn.Module:
-        info_object = self.info_object
-        model = info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
 
     def get_save_dir(self, train_config: TrainConfig, model_arch: str) -> str:
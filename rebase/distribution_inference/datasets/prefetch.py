@@ -0,0 +1,41 @@
+"""
+    Overlap (network) file I/O and deserialization when loading many models,
+    by reading files in background threads while earlier ones are being used.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+
+def prefetch(items: Iterable, fn: Callable,
+             num_threads: int = 4,
+             max_ahead: int = 16):
+    """
+        Apply fn to items in background threads, at most max_ahead items ahead
+        of the consumer. Yields (item, result, exception) in the same order as items.
+        Work still pending when the consumer stops iterating is cancelled.
+    """
+    items = iter(items)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max(1, num_threads))
+
+    def submit_next():
+        for item in items:
+            pending.append((item, executor.submit(fn, item)))
+            return
+
+    try:
+        for _ in range(max(1, max_ahead)):
+            submit_next()
+        while len(pending) > 0:
+            item, future = pending.popleft()
+            # Keep background threads busy while this item is consumed
+            submit_next()
+            try:
+                result = future.result()
+            except Exception as e:
+                yield item, None, e
+                continue
+            yield item, result, None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
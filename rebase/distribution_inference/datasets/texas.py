@@ -13,6 +13,7 @@ from distribution_inference.models.core import MLPFourLayer, MLPFiveLayer, Rando
 import distribution_inference.datasets.base as base
 import distribution_inference.datasets.utils as utils
 from distribution_inference.training.utils import load_model
+from distribution_inference.device import to_device
 
 
 class DatasetInformation(base.DatasetInformation):
@@ -55,7 +56,7 @@ class DatasetInformation(base.DatasetInformation):
             raise NotImplementedError("Model architecture not supported")
         if not model.is_sklearn_model:
             if not cpu:
-                model = model.cuda()
+                model = to_device(model)
             else:
                 model.to("cpu")
         return model
@@ -65,7 +66,7 @@ class DatasetInformation(base.DatasetInformation):
         model = MLPFourLayer(n_inp=num_eff_features,
                              num_classes=self.num_classes)
         if not cpu:
-            model = model.cuda()
+            model = to_device(model)
         return model
 
     # Process, handle one-hot conversion of data etc
@@ -405,9 +406,11 @@ class TexasWrapper(base.CustomDatasetWrapper):
         return super().get_loaders(batch_size, shuffle=shuffle,
                                    eval_shuffle=eval_shuffle,)
 
+    def build_model(self, on_cpu: bool = False, model_arch: str = None) -> nn.Module:
+        return self.info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+
     def load_model(self, path: str, model_arch: str, on_cpu: bool = False) -> nn.Module:
-        info_object = self.info_object
-        model = info_object.get_model(cpu=on_cpu, model_arch=model_arch)
+        model = self.build_model(on_cpu=on_cpu, model_arch=model_arch)
         return load_model(model, path, on_cpu=on_cpu)
 
     def get_save_dir(self, train_config: TrainConfig, model_arch: str) -> str:
@@ -4,6 +4,7 @@ import numpy as np
 from tqdm import tqdm
 
 from distribution_inference.config import UnlearningConfig
+from distribution_inference.device import to_device
 
 
 class Unlearning:
@@ -34,7 +35,7 @@ class Unlearning:
         attacker_obj.to_gpu()
 
         lr_ = self.lr
-        victim_model_ = victim_model.cuda()
+        victim_model_ = to_device(victim_model)
 
         # Take note of initial predicted class
         victim_features = process_fn(victim_model_)
@@ -50,7 +51,7 @@ class Unlearning:
         def _flip_parameters(x):
             for _, param in x.named_parameters():
                 if param.requires_grad:
-                    mask = ch.ones(param.numel()).cuda()
+                    mask = ch.ones(param.numel(), device=param.device)
                     num_elems_to_set = int(
                         param.numel() * self.flip_weight_ratio)
                     mask[ch.randperm(len(mask))[num_elems_to_set]] = -1
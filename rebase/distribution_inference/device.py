@@ -0,0 +1,121 @@
+"""
+    Central execution context: which device (and floating-point dtype)
+    models and data are placed on. Defaults to CUDA if available, else CPU.
+    Can be overridden with the DDI_DEVICE (e.g. 'cpu', 'cuda:1') and
+    DDI_NUM_THREADS environment variables, or set_execution_context().
+"""
+import os
+import gc
+import torch as ch
+import torch.nn as nn
+
+
+class ExecutionContext:
+    def __init__(self,
+                 device: str = None,
+                 dtype: ch.dtype = ch.float32,
+                 num_threads: int = None):
+        """
+            device: device to use (defaults to CUDA if available, else CPU)
+            dtype: floating-point dtype for data (and models) placed on device
+            num_threads: intra-op threads to use on CPU (defaults to available cores)
+        """
+        if device is None:
+            device = "cuda" if ch.cuda.is_available() else "cpu"
+        self.device = ch.device(device)
+        self.dtype = dtype
+        self.num_threads = num_threads
+        if not self.is_cuda:
+            self._configure_cpu_threads()
+
+    @property
+    def is_cuda(self) -> bool:
+        return self.device.type == "cuda"
+
+    def _configure_cpu_threads(self):
+        # Respect CPU affinity (cgroups, taskset) on shared batch nodes,
+        # instead of the total number of cores on the machine
+        if self.num_threads is None:
+            try:
+                self.num_threads = len(os.sched_getaffinity(0))
+            except AttributeError:
+                self.num_threads = os.cpu_count() or 1
+        ch.set_num_threads(self.num_threads)
+
+    def to(self, x):
+        """
+            Move tensor/module (or list/tuple of them) to device.
+            If context dtype is not the default (float32), floating-point
+            tensors and module parameters are also cast to it.
+        """
+        if isinstance(x, (list, tuple)):
+            return type(x)(self.to(x_) for x_ in x)
+        if self.dtype == ch.float32:
+            return x.to(self.device)
+        if isinstance(x, nn.Module):
+            return x.to(device=self.device, dtype=self.dtype)
+        if isinstance(x, ch.Tensor) and x.is_floating_point():
+            return x.to(device=self.device, dtype=self.dtype)
+        return x.to(self.device)
+
+    def empty_cache(self):
+        """
+            Release cached GPU memory. No-op on CPU.
+        """
+        if self.is_cuda:
+            ch.cuda.empty_cache()
+
+    def free_memory(self):
+        """
+            Collect garbage and release cached GPU memory, after moving
+            models off the device. No-op on CPU, where nothing is reclaimed.
+        """
+        if self.is_cuda:
+            gc.collect()
+            ch.cuda.empty_cache()
+
+    @property
+    def map_location(self):
+        """
+            Location to use with ch.load()
+        """
+        return self.device
+
+
+_CONTEXT = None
+
+
+def get_execution_context() -> ExecutionContext:
+    global _CONTEXT
+    if _CONTEXT is None:
+        num_threads = os.environ.get('DDI_NUM_THREADS')
+        _CONTEXT = ExecutionContext(
+            device=os.environ.get('DDI_DEVICE'),
+            num_threads=int(num_threads) if num_threads else None)
+    return _CONTEXT
+
+
+def set_execution_context(device: str = None,
+                          dtype: ch.dtype = ch.float32,
+                          num_threads: int = None) -> ExecutionContext:
+    global _CONTEXT
+    _CONTEXT = ExecutionContext(device=device,
+                                dtype=dtype,
+                                num_threads=num_threads)
+    return _CONTEXT
+
+
+def get_device() -> ch.device:
+    return get_execution_context().device
+
+
+def to_device(x):
+    return get_execution_context().to(x)
+
+
+def empty_cache():
+    get_execution_context().empty_cache()
+
+
+def free_memory():
+    get_execution_context().free_memory()
@@ -42,3 +42,88 @@ class BasicWrapper(nn.Module):
 
     def forward(self, input: ch.Tensor):
         return basic.apply(input)
+
+
+class StackedMLPEnsemble(nn.Module):
+    """
+        Evaluate N same-architecture MLPs in one pass by stacking
+        their Linear layers into batched (N, out, in) weight tensors.
+        Supports models whose 'layers' is an nn.Sequential made
+        only of Linear and ReLU-like (ReLU, FakeReluWrapper) modules.
+    """
+    def __init__(self, models):
+        super(StackedMLPEnsemble, self).__init__()
+        if not StackedMLPEnsemble.supports(models):
+            raise ValueError("Models cannot be stacked into an ensemble")
+        self.n_models = len(models)
+        # Sequence of operations: index of linear layer, or None for activation
+        self.ops = []
+        n_linear = 0
+        for layer in models[0].layers:
+            if isinstance(layer, nn.Linear):
+                weights = ch.stack([m.layers[len(self.ops)].weight.detach() for m in models])
+                biases = ch.stack([_linear_bias(m.layers[len(self.ops)]) for m in models])
+                self.register_buffer(f"weight_{n_linear}", weights)
+                # Shape (N, 1, out) to broadcast across batch
+                self.register_buffer(f"bias_{n_linear}", biases.unsqueeze(1))
+                self.ops.append(n_linear)
+                n_linear += 1
+            else:
+                self.ops.append(None)
+
+    @staticmethod
+    def supports(models) -> bool:
+        """
+            Check if given models can be stacked together.
+        """
+        if len(models) == 0:
+            return False
+        reference = models[0]
+        if getattr(reference, "is_sklearn_model", False) or getattr(reference, "is_graph_model", False):
+            return False
+        if not isinstance(getattr(reference, "layers", None), nn.Sequential):
+            return False
+        if len(reference.layers) == 0 or not isinstance(reference.layers[0], nn.Linear):
+            return False
+        for layer in reference.layers:
+            if not isinstance(layer, (nn.Linear, nn.ReLU, FakeReluWrapper)):
+                return False
+        shapes = [p.shape for p in reference.parameters()]
+        for m in models[1:]:
+            if type(m) != type(reference):
+                return False
+            if [p.shape for p in m.parameters()] != shapes:
+                return False
+        return True
+
+    def forward(self, x: ch.Tensor, latent: int = None) -> ch.Tensor:
+        """
+            x: (batch, n_inp). Returns (n_models, batch, n_out).
+            If latent is given, returns output of that hidden activation
+            (same mapping as the individual models).
+        """
+        # Same input for all models (no copy made)
+        x = x.expand(self.n_models, *x.shape)
+        n_activation = 0
+        for op in self.ops:
+            if op is None:
+                # Output of baddbmm is a fresh tensor, safe to modify in-place
+                x = x.relu_()
+                if latent is not None and n_activation == latent:
+                    return x
+                n_activation += 1
+            else:
+                weight = getattr(self, f"weight_{op}")
+                bias = getattr(self, f"bias_{op}")
+                x = ch.baddbmm(bias, x, weight.transpose(1, 2))
+        if latent is not None:
+            raise ValueError("Invald interal layer requested")
+        return x
+
+
+def _linear_bias(layer: nn.Linear) -> ch.Tensor:
+    if layer.bias is None:
+        return ch.zeros(layer.out_features,
+                        dtype=layer.weight.dtype,
+                        device=layer.weight.device)
+    return layer.bias.detach()
@@ -12,6 +12,7 @@ from distribution_inference.config import TrainConfig, AdvTrainingConfig
 from distribution_inference.training.dp import train as train_with_dp
 from distribution_inference.training.graph import train as gcn_train
 from distribution_inference.utils import warning_string
+from distribution_inference.device import to_device, get_device
 
 
 def train(model, loaders, train_config: TrainConfig,
@@ -59,10 +60,10 @@ def train_epoch(train_loader, model, criterion, optimizer, epoch,
 
         # Support for using same code for AMC
         if input_is_list:
-            data = [x.cuda() for x in data]
+            data = [to_device(x) for x in data]
         else:
-            data = data.cuda()
-        labels = labels.cuda()
+            data = to_device(data)
+        labels = labels.to(get_device())
         N = labels.size(0)
         
         if adv_config is None:
@@ -136,10 +137,10 @@ def validate_epoch(val_loader, model, criterion,
             else:
                 data, labels = tuple
             if input_is_list:
-                data = [x.cuda() for x in data]
+                data = [to_device(x) for x in data]
             else:
-                data = data.cuda()
-            labels = labels.cuda()
+                data = to_device(data)
+            labels = labels.to(get_device())
             N = labels.size(0)
 
             # Get model outputs
@@ -9,6 +9,7 @@ from opacus.privacy_engine import PrivacyEngine
 
 from distribution_inference.config import TrainConfig
 from distribution_inference.training.utils import save_model
+from distribution_inference.device import get_device
 
 #  Ignore warnings from Opacus
 import warnings
@@ -53,7 +54,7 @@ def train(model, loaders, train_config: TrainConfig,
     assert dp_config.delta < 1 / \
         len(train_loader.dataset), "delta should be < the inverse of the size of the training dataset"
 
-    device = ch.device("cuda")
+    device = get_device()
     model = model.to(device)
 
     optimizer = ch.optim.Adam(
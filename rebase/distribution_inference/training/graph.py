@@ -5,6 +5,7 @@ import numpy as np
 from copy import deepcopy
 from distribution_inference.config import TrainConfig
 from distribution_inference.utils import warning_string
+from distribution_inference.device import get_device
 
 
 @ch.no_grad()
@@ -65,7 +66,7 @@ def train(model, loaders, train_config: TrainConfig,
         model.parameters(),
         lr=train_config.learning_rate,
         weight_decay=train_config.weight_decay)
-    loss_fn = ch.nn.CrossEntropyLoss().cuda()
+    loss_fn = ch.nn.CrossEntropyLoss().to(get_device())
     iterator = tqdm(range(1, 1 + train_config.epochs))
     best_model, best_loss = None, np.inf
 
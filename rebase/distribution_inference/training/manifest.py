@@ -0,0 +1,259 @@
+"""
+    Per-directory manifest of saved models, so that listing models, looking
+    them up by id and checking for existence do not need to list the directory
+    and parse file names every time. Entries are appended by save_model(), and
+    the manifest is rebuilt (with a single listing) whenever the directory was
+    modified after the manifest was last written. Rebuilding, appending and
+    reading take a lock on the directory, so that concurrent jobs (training
+    and checking for existing models) do not lose each other's entries.
+"""
+import os
+import json
+from typing import List
+
+from distribution_inference.training.zoo import PackedZoo, ZOO_FILE_NAME, parse_model_name
+from distribution_inference.utils import directory_lock
+
+
+MANIFEST_NAME = "manifest.jsonl"
+# Entries that are not models trained with a model number
+SPECIAL_PREFIXES = ["adv_train_"]
+SPECIAL_NAMES = ["full", "drop"]
+
+
+def is_manifest_or_zoo(name: str) -> bool:
+    """
+        Whether directory entry is the manifest or packed zoo (or a temporary
+        file while writing either), and not a model
+    """
+    return name in [MANIFEST_NAME, ZOO_FILE_NAME,
+                    MANIFEST_NAME + ".tmp", ZOO_FILE_NAME + ".tmp"]
+
+
+def _is_special(name: str) -> bool:
+    return name in SPECIAL_NAMES or any(name.startswith(p) for p in SPECIAL_PREFIXES)
+
+
+def _make_entry(name: str, is_dir: bool) -> dict:
+    model_id, metrics = parse_model_name(name)
+    return {"name": name, "id": model_id, "metrics": metrics,
+            "is_dir": is_dir, "special": _is_special(name)}
+
+
+class ModelManifest:
+    def __init__(self, folder_path: str, entries: List[dict]):
+        self.folder_path = folder_path
+        self.entries = {}
+        self._by_id = {}
+        for entry in entries:
+            self._add(entry)
+
+    def _add(self, entry: dict):
+        if entry["name"] in self.entries:
+            return
+        self.entries[entry["name"]] = entry
+        if entry["id"] is not None and not entry["special"]:
+            self._by_id.setdefault(entry["id"], []).append(entry["name"])
+
+    @staticmethod
+    def path_for(folder_path: str) -> str:
+        return os.path.join(folder_path, MANIFEST_NAME)
+
+    @staticmethod
+    def build(folder_path: str) -> "ModelManifest":
+        """
+            (Re)build manifest from directory contents, and save it
+        """
+        with directory_lock(folder_path):
+            return ModelManifest._build(folder_path)
+
+    @staticmethod
+    def _build(folder_path: str) -> "ModelManifest":
+        # Caller must hold (exclusive) lock on directory
+        entries = []
+        for name in sorted(os.listdir(folder_path)):
+            if is_manifest_or_zoo(name):
+                continue
+            entries.append(_make_entry(
+                name, os.path.isdir(os.path.join(folder_path, name))))
+        # Models only present in packed zoo
+        zoo = PackedZoo.open(folder_path)
+        if zoo is not None:
+            entries += [_make_entry(name, False) for name in zoo.names]
+        manifest = ModelManifest(folder_path, entries)
+        manifest._save()
+        return manifest
+
+    def _save(self):
+        path = ModelManifest.path_for(self.folder_path)
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(temp_path, path)
+            # Renaming modifies the directory: mark manifest as newer
+            os.utime(path)
+        except OSError:
+            # Read-only directory: manifest is kept only in memory
+            pass
+
+    @staticmethod
+    def is_fresh(folder_path: str) -> bool:
+        # Anything changed in directory after manifest was last written?
+        return ModelManifest._read_if_fresh(folder_path) is not None
+
+    @staticmethod
+    def _read_if_fresh(folder_path: str) -> "ModelManifest":
+        """
+            Saved manifest, or None if directory changed after it was written
+        """
+        if not os.path.exists(ModelManifest.path_for(folder_path)):
+            return None
+        dir_mtime, manifest_mtime = ModelManifest._state(folder_path)
+        if dir_mtime > manifest_mtime:
+            return None
+        manifest = ModelManifest._read(folder_path)
+        # With coarse timestamps, files added in the same tick after the manifest
+        # was written leave times equal: compare with directory listing then
+        if dir_mtime == manifest_mtime and not manifest._matches_listing():
+            return None
+        return manifest
+
+    def _matches_listing(self) -> bool:
+        listed = set(name for name in os.listdir(self.folder_path)
+                     if not is_manifest_or_zoo(name))
+        names = set(self.entries.keys())
+        if not listed <= names:
+            return False
+        # Entries not in directory must be models in packed zoo
+        missing = names - listed
+        if len(missing) == 0:
+            return True
+        zoo = PackedZoo.open(self.folder_path)
+        return zoo is not None and all(name in zoo for name in missing)
+
+    @staticmethod
+    def _state(folder_path: str):
+        # Modification times of directory and manifest
+        path = ModelManifest.path_for(folder_path)
+        manifest_mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        return os.stat(folder_path).st_mtime_ns, manifest_mtime
+
+    @staticmethod
+    def _read(folder_path: str) -> "ModelManifest":
+        entries = []
+        with open(ModelManifest.path_for(folder_path), 'r') as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+        return ModelManifest(folder_path, entries)
+
+    @staticmethod
+    def load(folder_path: str) -> "ModelManifest":
+        """
+            Manifest for given directory (re-used from memory if unchanged)
+        """
+        key = os.path.abspath(folder_path)
+        state = ModelManifest._state(folder_path)
+        # Times that are equal (same tick) do not rule out changes: check again then
+        if key in _LOADED and _LOADED[key][0] == state and state[0] < state[1]:
+            return _LOADED[key][1]
+
+        with directory_lock(folder_path, exclusive=False):
+            manifest = ModelManifest._read_if_fresh(folder_path)
+        if manifest is None:
+            with directory_lock(folder_path):
+                # Another process may have rebuilt it while waiting for the lock
+                manifest = ModelManifest._read_if_fresh(folder_path)
+                if manifest is None:
+                    manifest = ModelManifest._build(folder_path)
+        _LOADED[key] = (ModelManifest._state(folder_path), manifest)
+        return manifest
+
+    @staticmethod
+    def record(path: str, was_fresh: bool):
+        """
+            Record (just saved) model file at given path in its directory's manifest.
+            was_fresh: whether manifest was up to date before the file was saved
+        """
+        folder_path = os.path.dirname(path)
+        with directory_lock(folder_path):
+            # Manifest may have been rebuilt (and then seen as fresh) by another
+            # process in the meantime: entry is then already in it, and appending
+            # it again is harmless (duplicates are ignored when read)
+            if was_fresh and os.path.exists(ModelManifest.path_for(folder_path)):
+                # Only the new file is missing from the manifest
+                with open(ModelManifest.path_for(folder_path), 'a') as f:
+                    f.write(json.dumps(_make_entry(os.path.basename(path), False)) + "\n")
+            else:
+                ModelManifest._build(folder_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name: str):
+        return name in self.entries
+
+    def names(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def has_id(self, model_id: int) -> bool:
+        return int(model_id) in self._by_id
+
+    def by_id(self, model_id: int) -> List[str]:
+        """
+            Names of models (files or directories) with given model id (or epoch)
+        """
+        return self._by_id.get(int(model_id), [])
+
+    def sorted_by_id(self) -> List[str]:
+        """
+            Names of entries with ids, in ascending order of id
+        """
+        return [name for model_id in sorted(self._by_id)
+                for name in self._by_id[model_id]]
+
+    def select(self,
+               offset: int = None,
+               min_metric: float = None,
+               max_metric: float = None,
+               metric_index: int = 0,
+               include_dirs: bool = True) -> List[str]:
+        """
+            Names of entries with id above offset, and metric (from name suffix,
+            like accuracy) at metric_index within [min_metric, max_metric]
+        """
+        selected = []
+        for name, entry in self.entries.items():
+            if entry["is_dir"] and not include_dirs:
+                continue
+            if offset is not None and not entry["special"] and \
+                    (entry["id"] is None or entry["id"] <= offset):
+                continue
+            if min_metric is not None or max_metric is not None:
+                if len(entry["metrics"]) <= metric_index:
+                    continue
+                metric = entry["metrics"][metric_index]
+                if min_metric is not None and metric < min_metric:
+                    continue
+                if max_metric is not None and metric > max_metric:
+                    continue
+            selected.append(name)
+        return selected
+
+    def is_dir(self, name: str) -> bool:
+        return self.entries[name]["is_dir"]
+
+    def is_below_offset(self, name: str, offset: int) -> bool:
+        """
+            Whether entry is a model with model number at or below offset
+        """
+        entry = self.entries[name]
+        if entry["special"] or entry["id"] is None:
+            return False
+        return entry["id"] <= offset
+
+
+# Manifests loaded in this process, with (directory, manifest) mtimes when loaded
+_LOADED = {}
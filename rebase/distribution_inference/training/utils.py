@@ -1,9 +1,13 @@
+import os
 import torch as ch
 import pickle
 import numpy as np
 from cleverhans.future.torch.attacks.projected_gradient_descent import projected_gradient_descent
 
 from distribution_inference.config import AttackConfig, EarlyStoppingConfig
+from distribution_inference.device import get_execution_context
+from distribution_inference.training.manifest import ModelManifest
+from distribution_inference.training.zoo import read_from_zoo
 
 
 class AverageMeter(object):
@@ -39,6 +43,7 @@ def extract_adv_params(
 
 
 def save_model(model, path, indices=None):
+    manifest_was_fresh = ModelManifest.is_fresh(os.path.dirname(path))
     if model.is_sklearn_model:
         if indices is not None:
             raise NotImplementedError("Saving sklearn model with indices is not implemented")
@@ -55,29 +60,60 @@ def save_model(model, path, indices=None):
             state_dict = model.state_dict()
 
         ch.save(state_dict, path)
+    ModelManifest.record(path, was_fresh=manifest_was_fresh)
+
+
+def read_model_file(path, is_sklearn_model: bool = False, on_cpu: bool = False,
+                    mmap: bool = False):
+    """
+        Read (and deserialize) contents of saved model file,
+        without loading them into a model. Models whose file was removed after
+        packing its directory are read from the packed zoo.
+        If mmap is True, tensors are memory-mapped (on CPU), so that
+        their contents are read from disk only when used.
+    """
+    if not is_sklearn_model and not os.path.exists(path):
+        contents = read_from_zoo(path)
+        if contents is not None:
+            return contents
+    if is_sklearn_model:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    if mmap:
+        try:
+            return ch.load(path, map_location="cpu", mmap=True)
+        except RuntimeError:
+            # Legacy (non-zip) format cannot be memory-mapped
+            pass
+    map_location = "cpu" if on_cpu else get_execution_context().map_location
+    return ch.load(path, map_location=map_location)
+
+
+def load_model_contents(model, contents):
+    """
+        Load contents read by read_model_file() into given model.
+    """
+    if model.is_sklearn_model:
+        model = contents
+        # Sklearn model is obviously not a graph model
+        model.is_graph_model = False
+        return model
+    if "actual_model" in contents:
+        # Information about training data also stored; return
+        model.load_state_dict(contents["actual_model"])
+        train_ids = contents["train_ids"]
+        test_ids = contents["test_ids"]
+        return model, (train_ids, test_ids)
+    model.load_state_dict(contents)
+    return model
 
 
 def load_model(model, path, on_cpu: bool = False):
-    map_location = "cpu" if on_cpu else None
     try:
-        if model.is_sklearn_model:
-            with open(path, 'rb') as f:
-                model = pickle.load(f)
-            # Sklearn model is obviously not a graph model
-            model.is_graph_model = False
-        else:
-            model_dict = ch.load(path, map_location=map_location)
-            if "actual_model" in model_dict:
-                # Information about training data also stored; return
-                model.load_state_dict(model_dict["actual_model"])
-                train_ids = model_dict["train_ids"]
-                test_ids = model_dict["test_ids"]
-                return model, (train_ids, test_ids)
-            else:
-                model.load_state_dict(ch.load(path, map_location=map_location))
+        contents = read_model_file(path, model.is_sklearn_model, on_cpu=on_cpu)
+        return load_model_contents(model, contents)
     except:
         raise Exception("Could not load model from {}".format(path))
-    return model
 
 
 def generate_adversarial_input(model, data,
@@ -0,0 +1,279 @@
+"""
+    Packed storage for a directory of models (same architecture): all models
+    are stored in one file, with each parameter as one contiguous
+    (n_models, ...) array that is memory-mapped on read. An index (in the
+    file header) holds model names, ids, metrics (from file names) and
+    train/test ids, if saved with the models.
+
+    Layout: magic, header length (uint64), JSON header, then raw arrays
+    (each aligned to ALIGNMENT bytes) at offsets listed in the header.
+"""
+import os
+import json
+import numpy as np
+import torch as ch
+from typing import List, Tuple
+
+
+ZOO_FILE_NAME = "packed.zoo"
+MAGIC = b"DDIZOO01"
+ALIGNMENT = 64
+# Prefix for (flattened) train/test id arrays stored alongside parameters
+IDS_PREFIX = "__ids__/"
+
+
+def parse_model_name(name: str) -> Tuple[int, List[float]]:
+    """
+        Model id and metrics from a file name like '12_0.85.ch',
+        '12_tr0.85_te0.81.ch' or '12_0.85_adv_0.54.ch'
+    """
+    parts = os.path.splitext(name)[0].split("_")
+    try:
+        model_id = int(parts[0])
+    except ValueError:
+        model_id = None
+    metrics = []
+    for part in parts[1:]:
+        try:
+            metrics.append(float(part.lstrip("tre")))
+        except ValueError:
+            continue
+    return model_id, metrics
+
+
+def _split_ids(ids) -> Tuple[List[np.ndarray], bool]:
+    # Ids are saved either as an array, or a sequence of arrays
+    if isinstance(ids, (np.ndarray, ch.Tensor)):
+        return [np.asarray(ids)], False
+    return [np.asarray(x) for x in ids], True
+
+
+class PackedZoo:
+    def __init__(self, path: str):
+        """
+            path: packed zoo file (see pack_directory)
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a packed model zoo")
+            header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(f.read(header_length).decode())
+        self.models = self.header["models"]
+        self.names = [m["name"] for m in self.models]
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        # Copy-on-write: tensors made from these are writable without touching the file
+        self.arrays = {
+            name: np.memmap(path, mode='c',
+                            dtype=np.dtype(info["dtype"]),
+                            offset=info["offset"],
+                            shape=tuple(info["shape"]))
+            for name, info in self.header["arrays"].items()}
+
+    @staticmethod
+    def open(folder_path: str):
+        """
+            Packed zoo for given directory of models, or None if not packed
+        """
+        path = os.path.join(folder_path, ZOO_FILE_NAME)
+        if not os.path.isfile(path):
+            return None
+        return PackedZoo(path)
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, name: str):
+        return name in self._positions
+
+    def position(self, name: str) -> int:
+        return self._positions[name]
+
+    def param(self, name: str) -> np.ndarray:
+        """
+            Parameter across all models: (n_models, ...) memory-mapped array
+        """
+        return self.arrays[name]
+
+    def state_dict(self, i: int) -> dict:
+        return {name: ch.from_numpy(np.asarray(self.arrays[name][i]))
+                for name in self.header["params"]}
+
+    def ids(self, i: int) -> Tuple:
+        """
+            (train_ids, test_ids) saved with i-th model, or None
+        """
+        if not self.header["has_ids"]:
+            return None
+        ids = []
+        for which in ["train_ids", "test_ids"]:
+            parts = []
+            for j in range(self.header["ids_structure"][which]["n_parts"]):
+                key = f"{IDS_PREFIX}{which}/{j}"
+                offsets = self.arrays[key + "/offsets"]
+                parts.append(np.array(self.arrays[key][offsets[i]:offsets[i + 1]]))
+            ids.append(parts if self.header["ids_structure"][which]["is_sequence"] else parts[0])
+        return tuple(ids)
+
+    def get_contents(self, name: str):
+        """
+            Contents of model with given name, in the same format
+            as read_model_file() for a single model file
+        """
+        i = self.position(name)
+        state_dict = self.state_dict(i)
+        ids = self.ids(i)
+        if ids is None:
+            return state_dict
+        return {"actual_model": state_dict,
+                "train_ids": ids[0],
+                "test_ids": ids[1]}
+
+
+def _write_zoo(path: str, names: List[str], arrays: dict,
+               params: List[str], ids_structure: dict):
+    models = []
+    for name in names:
+        model_id, metrics = parse_model_name(name)
+        models.append({"name": name, "id": model_id, "metrics": metrics})
+
+    # Lay out arrays (offsets relative to file start, filled in below)
+    header = {
+        "models": models,
+        "params": params,
+        "has_ids": ids_structure is not None,
+        "ids_structure": ids_structure,
+        "arrays": {k: {"dtype": v.dtype.str, "shape": list(v.shape), "offset": 0}
+                   for k, v in arrays.items()},
+    }
+
+    def encode(header):
+        return json.dumps(header).encode()
+
+    # Offsets change header length: iterate until stable
+    header_length = -1
+    while True:
+        encoded = encode(header)
+        if len(encoded) == header_length:
+            break
+        header_length = len(encoded)
+        position = len(MAGIC) + 8 + header_length
+        for k, v in arrays.items():
+            position = int(np.ceil(position / ALIGNMENT) * ALIGNMENT)
+            header["arrays"][k]["offset"] = position
+            position += v.nbytes
+
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(header_length).tobytes())
+        f.write(encoded)
+        for k, v in arrays.items():
+            f.seek(header["arrays"][k]["offset"])
+            f.write(np.ascontiguousarray(v).tobytes())
+    os.replace(temp_path, path)
+
+
+def pack_directory(folder_path: str,
+                   remove_originals: bool = False) -> str:
+    """
+        Pack all model files (.ch torch state dicts of the same architecture) in
+        given directory into a single packed zoo file. Subdirectories (like
+        epoch-wise models) are left as they are. Returns path to packed file.
+    """
+    names = sorted(
+        [x for x in os.listdir(folder_path)
+         if x.endswith(".ch") and os.path.isfile(os.path.join(folder_path, x))],
+        key=lambda x: (parse_model_name(x)[0] is None, parse_model_name(x)[0], x))
+    if len(names) == 0:
+        raise ValueError(f"No model files found in {folder_path}")
+
+    # Include models packed earlier
+    existing = PackedZoo.open(folder_path)
+    contents = []
+    for name in names:
+        try:
+            content = ch.load(os.path.join(folder_path, name), map_location="cpu")
+        except Exception:
+            content = None
+        if not isinstance(content, dict):
+            raise ValueError(f"{name} is not a torch state dict: cannot pack")
+        contents.append(content)
+    if existing is not None:
+        for name in existing.names:
+            if name not in names:
+                names.append(name)
+                contents.append(existing.get_contents(name))
+
+    has_ids = ["actual_model" in c for c in contents]
+    if any(has_ids) and not all(has_ids):
+        raise ValueError("Either all or none of the models should have train/test ids")
+    state_dicts = [c["actual_model"] if has_ids[0] else c for c in contents]
+
+    params = list(state_dicts[0].keys())
+    arrays = {}
+    for param in params:
+        values = [sd[param] for sd in state_dicts]
+        if any(v.shape != values[0].shape for v in values):
+            raise ValueError(f"Shape of {param} not same across models: cannot pack")
+        arrays[param] = ch.stack(values, 0).numpy()
+
+    ids_structure = None
+    if has_ids[0]:
+        ids_structure = {}
+        for which in ["train_ids", "test_ids"]:
+            split = [_split_ids(c[which]) for c in contents]
+            n_parts = len(split[0][0])
+            ids_structure[which] = {"n_parts": n_parts, "is_sequence": split[0][1]}
+            for j in range(n_parts):
+                parts = [s[0][j].reshape(-1) for s in split]
+                key = f"{IDS_PREFIX}{which}/{j}"
+                arrays[key] = np.concatenate(parts)
+                arrays[key + "/offsets"] = np.concatenate(
+                    [[0], np.cumsum([len(p) for p in parts])]).astype(np.int64)
+
+    path = os.path.join(folder_path, ZOO_FILE_NAME)
+    _write_zoo(path, names, arrays, params, ids_structure)
+
+    if remove_originals:
+        for name in names:
+            if os.path.isfile(os.path.join(folder_path, name)):
+                os.remove(os.path.join(folder_path, name))
+    return path
+
+
+def read_from_zoo(path: str):
+    """
+        Contents (as read_model_file() would return) of model at given path,
+        read from its directory's packed zoo. None if not in a packed zoo.
+    """
+    folder_path, name = os.path.split(path)
+    zoo_path = os.path.join(folder_path, ZOO_FILE_NAME)
+    if not os.path.isfile(zoo_path):
+        return None
+    # Re-use zoo (index) opened earlier, unless it was re-packed since
+    key = (os.path.abspath(zoo_path), os.stat(zoo_path).st_mtime_ns)
+    if key not in _OPENED:
+        _OPENED.clear()
+        _OPENED[key] = PackedZoo(zoo_path)
+    zoo = _OPENED[key]
+    if name not in zoo:
+        return None
+    return zoo.get_contents(name)
+
+
+def model_file_stat(path: str) -> os.stat_result:
+    """
+        os.stat() of model file, or of the packed zoo holding it
+        (if original file was removed after packing)
+    """
+    if os.path.exists(path):
+        return os.stat(path)
+    zoo_path = os.path.join(os.path.dirname(path), ZOO_FILE_NAME)
+    if os.path.isfile(zoo_path):
+        return os.stat(zoo_path)
+    raise FileNotFoundError(path)
+
+
+# Most recently opened zoo (for read_from_zoo), keyed by (path, mtime)
+_OPENED = {}
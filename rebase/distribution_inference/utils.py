@@ -4,6 +4,12 @@
 import os
 from colorama import Fore, Style
 import dataclasses
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (e.g. Windows): directory locks are no-ops
+    fcntl = None
 
 
 class bcolors:
@@ -60,6 +66,24 @@ def ensure_dir_exists(dir):
         os.makedirs(dir)
 
 
+@contextmanager
+def directory_lock(folder_path: str, exclusive: bool = True):
+    """
+        Advisory lock (flock) on given directory itself (to not add
+        more files to it), shared across processes. Exclusive by default.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(folder_path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        # Closing the descriptor also releases the lock
+        os.close(fd)
+
+
 def get_save_path():
     """
         Path where results/trained meta-models are stored
@@ -67,6 +91,13 @@ def get_save_path():
     return "./log"
 
 
+def get_cache_path():
+    """
+        Path where cached artifacts (predictions, features) are stored
+    """
+    return os.environ.get('DDI_CACHE_DIRECTORY', "./cache")
+
+
 def get_arxiv_node_params_mapping():
     """
         Get parameters for Zipf distribution estimation
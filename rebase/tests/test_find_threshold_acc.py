@@ -0,0 +1,88 @@
+"""
+    find_threshold_acc: exact (sort-based) search against the previous
+    threshold sweep, run over every value taken by the scores.
+"""
+import numpy as np
+import pytest
+
+from distribution_inference.attacks.blackbox.core import find_threshold_acc
+
+
+def _loop_threshold_acc(X, Y, threshold):
+    # Previous get_threshold_acc (without given rule)
+    acc_1 = np.mean((X >= threshold) == Y)
+    acc_2 = np.mean((X <= threshold) == Y)
+    if acc_1 >= acc_2:
+        return acc_1, 1
+    return acc_2, 2
+
+
+def _loop_find_threshold_acc(accs_1, accs_2, thresholds):
+    # Previous find_threshold_acc, trying given thresholds (in increasing order)
+    combined = np.concatenate((accs_1, accs_2))
+    classes = np.concatenate(
+        (np.zeros(accs_1.shape[0]), np.ones(accs_2.shape[0])))
+    best_acc = 0.0
+    best_threshold = 0
+    best_rule = None
+    for threshold in thresholds:
+        best_of_two, rule = _loop_threshold_acc(combined, classes, threshold)
+        if best_of_two > best_acc:
+            best_threshold = threshold
+            best_acc = best_of_two
+            best_rule = rule
+    return best_acc, best_threshold, best_rule
+
+
+def _loop_sweep(accs_1, accs_2, granularity):
+    # Previous find_threshold_acc, as it was (steps of granularity)
+    combined = np.concatenate((accs_1, accs_2))
+    lower, upper = np.min(combined), np.max(combined)
+    thresholds = []
+    while lower <= upper:
+        thresholds.append(lower)
+        lower += granularity
+    return _loop_find_threshold_acc(accs_1, accs_2, thresholds)
+
+
+def _cases():
+    rng = np.random.default_rng(0)
+    cases = [
+        # Continuous scores
+        (rng.normal(0, 1, 50), rng.normal(0.5, 1, 40)),
+        # Accuracies (in %) with many ties, within and across distributions
+        (rng.integers(40, 60, 100).astype(float), rng.integers(45, 65, 80).astype(float)),
+        # Separable, in either direction
+        (rng.uniform(0, 1, 20), rng.uniform(2, 3, 20)),
+        (rng.uniform(2, 3, 20), rng.uniform(0, 1, 20)),
+        # Degenerate: all scores equal, and a single score per distribution
+        (np.full(10, 0.7), np.full(15, 0.7)),
+        (np.array([0.2]), np.array([0.2])),
+        (np.array([0.9]), np.array([0.1])),
+    ]
+    for _ in range(20):
+        n_1, n_2 = rng.integers(1, 30, 2)
+        cases.append((rng.integers(0, 5, n_1).astype(float),
+                      rng.integers(0, 5, n_2).astype(float)))
+    return cases
+
+
+@pytest.mark.parametrize("accs_1, accs_2", _cases())
+def test_exact_matches_loop_over_all_values(accs_1, accs_2):
+    values = np.unique(np.concatenate((accs_1, accs_2)))
+    expected = _loop_find_threshold_acc(accs_1, accs_2, values)
+    acc, threshold, rule = find_threshold_acc(accs_1, accs_2)
+    assert acc == pytest.approx(expected[0])
+    assert threshold == expected[1]
+    assert rule == expected[2]
+
+
+@pytest.mark.parametrize("accs_1, accs_2", _cases())
+def test_exact_no_worse_than_sweep(accs_1, accs_2):
+    acc, _, _ = find_threshold_acc(accs_1, accs_2)
+    assert acc >= _loop_sweep(accs_1, accs_2, 0.1)[0] - 1e-12
+
+
+@pytest.mark.parametrize("accs_1, accs_2", _cases()[:4])
+def test_given_granularity_keeps_sweep(accs_1, accs_2):
+    assert find_threshold_acc(accs_1, accs_2, 0.1) == _loop_sweep(accs_1, accs_2, 0.1)
@@ -0,0 +1,107 @@
+"""
+    find_thresholds_per_point and find_threshold_pred: all points at
+    once against the previous per-point loop of threshold searches.
+"""
+import numpy as np
+import pytest
+
+from distribution_inference.attacks.blackbox.core import (
+    find_thresholds_per_point, find_threshold_pred)
+
+
+def _loop_find_threshold_acc(accs_1, accs_2, thresholds):
+    # Previous find_threshold_acc, trying given thresholds (in increasing order)
+    combined = np.concatenate((accs_1, accs_2))
+    classes = np.concatenate(
+        (np.zeros(accs_1.shape[0]), np.ones(accs_2.shape[0])))
+    best_acc = 0.0
+    best_threshold = 0
+    best_rule = None
+    for threshold in thresholds:
+        acc_1 = np.mean((combined >= threshold) == classes)
+        acc_2 = np.mean((combined <= threshold) == classes)
+        best_of_two, rule = (acc_1, 1) if acc_1 >= acc_2 else (acc_2, 2)
+        if best_of_two > best_acc:
+            best_threshold = threshold
+            best_acc = best_of_two
+            best_rule = rule
+    return best_acc, best_threshold, best_rule
+
+
+def _loop_sweep(accs_1, accs_2, granularity):
+    combined = np.concatenate((accs_1, accs_2))
+    lower, upper = np.min(combined), np.max(combined)
+    thresholds = []
+    while lower <= upper:
+        thresholds.append(lower)
+        lower += granularity
+    return _loop_find_threshold_acc(accs_1, accs_2, thresholds)
+
+
+def _loop_find_threshold_pred(pred_1, pred_2, search):
+    # Previous find_threshold_pred: one search per point, then votes of each model
+    thres, rules = [], []
+    for i in range(pred_1.shape[0]):
+        _, t, r = search(pred_1[i], pred_2[i])
+        thres.append(t)
+        rules.append(r - 1)
+    thres, rules = np.array(thres), np.array(rules)
+    X = np.concatenate((pred_1, pred_2), axis=1)
+    Y = np.concatenate((np.zeros(pred_1.shape[1]), np.ones(pred_2.shape[1])))
+    res = np.array([np.average((X[:, i] <= thres) == rules)
+                    for i in range(X.shape[1])])
+    acc = np.mean((res >= 0.5) == Y)
+    return acc, thres, rules
+
+
+def _exact(accs_1, accs_2):
+    values = np.unique(np.concatenate((accs_1, accs_2)))
+    return _loop_find_threshold_acc(accs_1, accs_2, values)
+
+
+def _cases():
+    rng = np.random.default_rng(1)
+    ties_1 = np.round(rng.uniform(0, 1, (30, 10)), 1)
+    ties_2 = np.round(rng.uniform(0.2, 1, (30, 12)), 1)
+    # Degenerate points: same prediction from every model
+    ties_1[:5] = 0.5
+    ties_2[:5] = 0.5
+    ties_1[5:8] = 0.1
+    ties_2[5:8] = 0.9
+    return [
+        (rng.normal(0, 1, (40, 15)), rng.normal(0.3, 1, (40, 20))),
+        (ties_1, ties_2),
+        (rng.integers(0, 3, (50, 4)).astype(float), rng.integers(0, 3, (50, 6)).astype(float)),
+        # A single model from each distribution
+        (rng.uniform(0, 1, (20, 1)), rng.uniform(0, 1, (20, 1))),
+        (rng.integers(0, 100, (20, 8)), rng.integers(20, 120, (20, 8))),
+    ]
+
+
+@pytest.mark.parametrize("pred_1, pred_2", _cases())
+def test_per_point_matches_loop(pred_1, pred_2):
+    accs, thresholds, rules = find_thresholds_per_point(pred_1, pred_2)
+    for i in range(pred_1.shape[0]):
+        acc, threshold, rule = _exact(pred_1[i], pred_2[i])
+        assert accs[i] == pytest.approx(acc)
+        assert thresholds[i] == threshold
+        assert rules[i] == rule
+
+
+@pytest.mark.parametrize("pred_1, pred_2", _cases())
+def test_threshold_pred_matches_loop(pred_1, pred_2):
+    acc, thres, rules = find_threshold_pred(pred_1, pred_2, granularity=None)
+    acc_, thres_, rules_ = _loop_find_threshold_pred(pred_1, pred_2, _exact)
+    assert acc == acc_
+    assert np.array_equal(thres, thres_)
+    assert np.array_equal(rules, rules_)
+
+
+@pytest.mark.parametrize("pred_1, pred_2", _cases()[:4])
+def test_threshold_pred_given_granularity_keeps_sweep(pred_1, pred_2):
+    acc, thres, rules = find_threshold_pred(pred_1, pred_2, granularity=0.05, verbose=False)
+    acc_, thres_, rules_ = _loop_find_threshold_pred(
+        pred_1, pred_2, lambda a, b: _loop_sweep(a, b, 0.05))
+    assert acc == acc_
+    assert np.array_equal(thres, thres_)
+    assert np.array_equal(rules, rules_)
@@ -0,0 +1,79 @@
+"""
+    KL_matrix and KLAttack._kl_compare: KL values of all model pairs as a
+    matrix product (and victim models in chunks), against the previous
+    loop over victim models with broadcast pairwise comparisons.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from distribution_inference.attacks.blackbox.KL import (
+    KLAttack, KL, KL_matrix, _log_probs)
+
+
+def _loop_KL_vals(x, y, multi_class):
+    # Previous KL values: one call per victim model
+    return np.array([KL(x, y_, multi_class) for y_ in y])
+
+
+def _loop_pairwise_compare(x, y, xx, yy, kl_voting):
+    # Previous _pairwise_compare: all pairs compared, then sampled ones kept
+    x_ = np.expand_dims(x, 2)
+    y_ = np.expand_dims(y, 2)
+    y_ = np.transpose(y_, (0, 2, 1))
+    if kl_voting:
+        pairwise_comparisons = (x_ > y_)
+    else:
+        pairwise_comparisons = (x_ - y_)
+    return np.array([z[xx, yy] for z in pairwise_comparisons])
+
+
+def _preds(rng, n_models, multi_class):
+    if multi_class:
+        logits = rng.normal(0, 2, (n_models, 30, 4))
+        exp = np.exp(logits - logits.max(-1, keepdims=True))
+        return exp / exp.sum(-1, keepdims=True)
+    # Include saturated predictions, which get clipped
+    preds = rng.uniform(0, 1, (n_models, 30))
+    preds[:, :3] = rng.choice([0., 1.], (n_models, 3))
+    return preds
+
+
+def _attack(multi_class, kl_voting, budget_gb):
+    config = SimpleNamespace(multi_class=multi_class, kl_voting=kl_voting,
+                             kl_memory_budget_gb=budget_gb,
+                             multi_sampling_seed=0)
+    return KLAttack(config)
+
+
+@pytest.mark.parametrize("multi_class", [False, True])
+def test_kl_matrix_matches_loop(multi_class):
+    rng = np.random.default_rng(0)
+    x, y = _preds(rng, 7, multi_class), _preds(rng, 5, multi_class)
+    KL_vals = KL_matrix(x, _log_probs(y, multi_class), multi_class)
+    assert KL_vals.shape == (5, 7)
+    assert np.allclose(KL_vals, _loop_KL_vals(x, y, multi_class))
+
+
+@pytest.mark.parametrize("multi_class", [False, True])
+@pytest.mark.parametrize("kl_voting", [False, True])
+# Tiny budget: one victim model per chunk
+@pytest.mark.parametrize("budget_gb", [1e-9, 1.0])
+def test_kl_compare_matches_loop(multi_class, kl_voting, budget_gb):
+    rng = np.random.default_rng(1)
+    ka, kb = _preds(rng, 8, multi_class), _preds(rng, 8, multi_class)
+    kc = _preds(rng, 6, multi_class)
+    xx, yy = np.triu_indices(8, k=1)
+    pick = rng.permutation(len(xx))[:15]
+    xx, yy = xx[pick], yy[pick]
+
+    preds = _attack(multi_class, kl_voting, budget_gb)._kl_compare(ka, kb, kc, xx, yy)
+    expected = _loop_pairwise_compare(_loop_KL_vals(ka, kc, multi_class),
+                                      _loop_KL_vals(kb, kc, multi_class),
+                                      xx, yy, kl_voting)
+    assert preds.shape == expected.shape
+    if kl_voting:
+        assert np.array_equal(preds, expected)
+    else:
+        assert np.allclose(preds, expected)
@@ -0,0 +1,89 @@
+"""
+    pair_order, find_rules and acc_rule: pairs sampled in one call and
+    compared for all pairs at once, against the previous per-pair loops.
+"""
+import numpy as np
+import pytest
+
+from distribution_inference.attacks.blackbox.perpoint_choose import (
+    pair_order, find_rules, acc_rule)
+
+
+def _order_pairs(p, order):
+    # Previous order_pairs: list of pairs
+    return np.array([p[o] for o in order])
+
+
+def _loop_acc_rule(p1, p2, order, rule):
+    p1 = _order_pairs(p1, order)
+    p2 = _order_pairs(p2, order)
+    r1 = np.repeat(np.expand_dims(rule, 1), p1.shape[2], axis=1)
+    r2 = np.repeat(np.expand_dims(rule, 1), p2.shape[2], axis=1)
+    preds1 = np.array([p[0, :] >= p[1, :] for p in p1])
+    preds1 = np.average(preds1 == r1, axis=0)
+    preds2 = np.array([p[0, :] < p[1, :] for p in p2])
+    preds2 = np.average(preds2 == r2, axis=0)
+    preds = np.hstack((1 - preds1, preds2))
+    accs = (np.average(preds1) + np.average(preds2)) / 2
+    return preds, accs
+
+
+def _loop_find_rules(p1, p2, order):
+    p1o = _order_pairs(p1, order)
+    p2o = _order_pairs(p2, order)
+    r1 = np.array([np.average(p[0, :] >= p[1, :]) >= 0.5 for p in p1o])
+    r2 = np.array([np.average(p[0, :] < p[1, :]) >= 0.5 for p in p2o])
+    rs = r1 == r2
+    ord = order[rs]
+    rs = r1[rs]
+    preds, acc = _loop_acc_rule(p1, p2, ord, rs)
+    return rs, ord, acc, preds
+
+
+@pytest.mark.parametrize("leng", [2, 3, 4, 7, 50, 500])
+def test_pair_order_distinct_pairs(leng):
+    order = pair_order(leng, np.random.default_rng(leng))
+    n_pairs = leng * (leng - 1) // 2
+    assert order.shape == (min(leng, n_pairs), 2)
+    assert np.all(order[:, 0] < order[:, 1])
+    assert np.all((order >= 0) & (order < leng))
+    assert len(set(map(tuple, order))) == len(order)
+    if leng <= 3:
+        # Every pair is needed
+        assert set(map(tuple, order)) == set(zip(*np.triu_indices(leng, k=1)))
+
+
+@pytest.mark.parametrize("leng", [5, 64])
+def test_pair_order_indexes_upper_triangle(leng):
+    order = pair_order(leng, np.random.default_rng(0))
+    n_pairs = leng * (leng - 1) // 2
+    picked = np.random.default_rng(0).choice(n_pairs, size=min(leng, n_pairs), replace=False)
+    xx, yy = np.triu_indices(leng, k=1)
+    assert np.array_equal(order, np.stack((xx[picked], yy[picked]), 1))
+
+
+@pytest.mark.parametrize("seed, ties", [(0, False), (1, True), (2, True)])
+def test_rules_match_loop(seed, ties):
+    rng = np.random.default_rng(seed)
+    n_points = 40
+    if ties:
+        # Few distinct values: many pairs of points with equal predictions
+        p1 = rng.integers(0, 3, (n_points, 9)).astype(float)
+        p2 = rng.integers(0, 3, (n_points, 12)).astype(float)
+    else:
+        p1 = rng.normal(0, 1, (n_points, 9))
+        p2 = rng.normal(0.2, 1, (n_points, 12))
+    order = pair_order(n_points, rng)
+
+    rs, ord, acc, preds = find_rules(p1, p2, order)
+    rs_, ord_, acc_, preds_ = _loop_find_rules(p1, p2, order)
+    assert np.array_equal(rs, rs_)
+    assert np.array_equal(ord, ord_)
+    assert acc == acc_
+    assert np.array_equal(preds, preds_)
+
+    rule = rng.integers(0, 2, len(order)).astype(bool)
+    preds, acc = acc_rule(p1, p2, order, rule)
+    preds_, acc_ = _loop_acc_rule(p1, p2, order, rule)
+    assert acc == acc_
+    assert np.array_equal(preds, preds_)
@@ -0,0 +1,92 @@
+"""
+    get_threshold_votes (and its epoch-wise variant, and get_votes_on_ratio):
+    all models and prefixes of points at once, against the previous
+    per-model loop of get_threshold_pred.
+"""
+import numpy as np
+import pytest
+
+from distribution_inference.attacks.blackbox.core import (
+    get_threshold_votes, get_threshold_votes_epochwise,
+    get_votes_on_ratio, find_max_acc_threshold)
+
+
+def _loop_votes(X, threshold, rule, voting=True):
+    # Previous get_threshold_pred: P[distribution=1] for each model
+    res = []
+    for i in range(X.shape[1]):
+        if voting:
+            prob = np.average((X[:, i] <= threshold) == rule)
+        else:
+            raw_prob = (X[:, i] - threshold) * ((-2 * rule) + 1)
+            raw_prob -= np.min(raw_prob)
+            raw_prob /= np.max(raw_prob)
+            prob = np.mean(raw_prob)
+        res.append(prob)
+    return np.array(res)
+
+
+def _loop_acc(res, Y, tune_final_threshold):
+    final_threshold = 0.5
+    if type(tune_final_threshold) != bool:
+        final_threshold = tune_final_threshold
+    elif tune_final_threshold is True:
+        final_threshold = find_max_acc_threshold(res, Y)
+    return np.mean((res >= final_threshold) == Y), final_threshold
+
+
+def _data(seed, ties=False):
+    rng = np.random.default_rng(seed)
+    n_points, n_models = 60, 25
+    if ties:
+        X = rng.integers(0, 4, (n_points, n_models)).astype(float)
+        threshold = rng.integers(0, 4, n_points).astype(float)
+    else:
+        X = rng.normal(0, 1, (n_points, n_models))
+        threshold = rng.normal(0, 0.5, n_points)
+    rule = rng.integers(0, 2, n_points)
+    return X, threshold, rule
+
+
+@pytest.mark.parametrize("seed, ties", [(0, False), (1, True), (2, True)])
+def test_votes_match_loop(seed, ties):
+    X, threshold, rule = _data(seed, ties)
+    lengths = [1, 5, 17, 60]
+    votes = get_threshold_votes(X, threshold, rule, lengths)
+    assert votes.shape == (len(lengths), X.shape[1])
+    for l, v in zip(lengths, votes):
+        assert np.array_equal(v, _loop_votes(X[:l], threshold[:l], rule[:l]))
+
+
+@pytest.mark.parametrize("seed", [0, 3])
+def test_votes_without_voting_match_loop(seed):
+    X, threshold, rule = _data(seed)
+    lengths = [2, 10, 60]
+    votes = get_threshold_votes(X, threshold, rule, lengths, voting=False)
+    for l, v in zip(lengths, votes):
+        assert np.allclose(v, _loop_votes(X[:l], threshold[:l], rule[:l], voting=False))
+    # Single length (all points)
+    assert np.allclose(get_threshold_votes(X, threshold, rule, voting=False)[0],
+                       _loop_votes(X, threshold, rule, voting=False))
+
+
+def test_votes_epochwise_match_loop():
+    X, threshold, rule = _data(4, ties=True)
+    Xs = [X[:, :10], X[:, 10:12], X[:, 12:]]
+    lengths = [3, 30, 60]
+    for X_, votes in zip(Xs, get_threshold_votes_epochwise(Xs, threshold, rule, lengths)):
+        for l, v in zip(lengths, votes):
+            assert np.array_equal(v, _loop_votes(X_[:l], threshold[:l], rule[:l]))
+
+
+@pytest.mark.parametrize("tune_final_threshold", [False, True, 0.3])
+def test_votes_on_ratio_match_loop(tune_final_threshold):
+    X, threshold, rule = _data(5, ties=True)
+    classes = np.concatenate((np.zeros(12), np.ones(13)))
+    votes = get_threshold_votes(X, threshold, rule)[0]
+    acc, votes_, final_thresh = get_votes_on_ratio(votes, classes, tune_final_threshold)
+    acc_, final_thresh_ = _loop_acc(_loop_votes(X, threshold, rule), classes,
+                                    tune_final_threshold)
+    assert acc == 100 * acc_
+    assert final_thresh == final_thresh_
+    assert votes_ is votes